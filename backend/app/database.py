@@ -1,15 +1,256 @@
-from sqlalchemy import create_engine
+import time
+import logging
+import threading
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from .config import DATABASE_URL
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
+from .config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS, DB_PGBOUNCER,
+    DATABASE_READ_URL, DB_REPLICA_MAX_LAG_SECONDS, DB_REPLICA_CHECK_INTERVAL
+)
 
-engine = create_engine(DATABASE_URL)
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """Thread-safe counters for connection checkout waits"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.timeouts,
+                "checkout_wait_seconds_total": round(self.wait_seconds_total, 6),
+                "checkout_wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+                "checkout_wait_seconds_max": round(self.wait_seconds_max, 6)
+            }
+
+
+class _CheckoutTimingMixin:
+    """Records how long callers wait for a pooled connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(_CheckoutTimingMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def to_async_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto the matching asyncio driver"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+def _engine_options(url: str, is_async: bool = False) -> dict:
+    """Build create_engine() keyword arguments from the environment"""
+    if url.startswith("sqlite"):
+        return {} if is_async else {"connect_args": {"check_same_thread": False}}
+
+    if DB_PGBOUNCER:
+        # PgBouncer pools server connections; keep none open on our side.
+        # Set statement_timeout on the role instead (ALTER ROLE ... SET statement_timeout)
+        options = {"poolclass": NullPool}
+        if is_async:
+            # Transaction pooling breaks asyncpg's server-side prepared statements
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+        return options
+
+    options = {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if DB_STATEMENT_TIMEOUT_MS > 0 and url.startswith("postgres"):
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async engine for high-QPS read endpoints (asyncpg / aiosqlite)
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL, is_async=True))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Optional read replica; without DATABASE_READ_URL reads go to the primary
+if DATABASE_READ_URL:
+    read_engine = create_engine(DATABASE_READ_URL, **_engine_options(DATABASE_READ_URL))
+    ASYNC_DATABASE_READ_URL = to_async_url(DATABASE_READ_URL)
+    async_read_engine = create_async_engine(
+        ASYNC_DATABASE_READ_URL, **_engine_options(ASYNC_DATABASE_READ_URL, is_async=True)
+    )
+else:
+    read_engine = engine
+    async_read_engine = async_engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+class ReplicaMonitor:
+    """
+    Periodically probes the replica and reports whether reads may use it.
+    The replica is skipped while unreachable or lagging more than max_lag seconds.
+    """
+
+    # Lag is 0 when everything received has been replayed (an idle primary
+    # would otherwise look like growing lag), else time since last replay
+    LAG_QUERY = text("""
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """)
+
+    def __init__(self, bind, max_lag: float, interval: float):
+        self.bind = bind
+        self.max_lag = max_lag
+        self.interval = interval
+        self.usable = True
+        self.lag_seconds = 0.0
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def needs_check(self) -> bool:
+        return time.monotonic() - self.checked_at >= self.interval
+
+    def check(self) -> bool:
+        # Only one thread probes at a time; others use the last known state
+        if not self._lock.acquire(blocking=False):
+            return self.usable
+        try:
+            if not self.needs_check():
+                return self.usable
+            try:
+                with self.bind.connect() as conn:
+                    if self.bind.dialect.name == "postgresql":
+                        self.lag_seconds = float(conn.execute(self.LAG_QUERY).scalar() or 0)
+                    else:
+                        conn.execute(text("SELECT 1"))
+                        self.lag_seconds = 0.0
+                usable = self.lag_seconds <= self.max_lag
+                if not usable:
+                    logger.warning(f"Read replica lagging {self.lag_seconds:.1f}s; using primary")
+            except Exception as e:
+                logger.warning(f"Read replica unavailable ({e}); using primary")
+                usable = False
+            self.usable = usable
+            self.checked_at = time.monotonic()
+            return usable
+        finally:
+            self._lock.release()
+
+    def is_usable(self) -> bool:
+        return self.check() if self.needs_check() else self.usable
+
+    def status(self) -> dict:
+        return {
+            "configured": bool(DATABASE_READ_URL),
+            "usable": self.usable,
+            "lag_seconds": round(self.lag_seconds, 3),
+            "max_lag_seconds": self.max_lag
+        }
+
+
+replica_monitor = ReplicaMonitor(read_engine, DB_REPLICA_MAX_LAG_SECONDS, DB_REPLICA_CHECK_INTERVAL)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_read_db():
+    """Session for read-only queries: replica when healthy, else primary"""
+    use_replica = bool(DATABASE_READ_URL) and replica_monitor.is_usable()
+    db = ReadSessionLocal() if use_replica else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    """Async counterpart of get_read_db"""
+    use_replica = False
+    if DATABASE_READ_URL:
+        if replica_monitor.needs_check():
+            use_replica = await run_in_threadpool(replica_monitor.check)
+        else:
+            use_replica = replica_monitor.usable
+    session_factory = AsyncReadSessionLocal if use_replica else AsyncSessionLocal
+    async with session_factory() as db:
+        yield db
+
+def upsert_insert(db):
+    """insert() supporting ON CONFLICT for the session's dialect (PostgreSQL, SQLite in development)"""
+    return postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+
+def get_pool_status(bind=engine) -> dict:
+    """Current pool occupancy plus checkout wait metrics"""
+    pool = bind.pool
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    if isinstance(pool, _CheckoutTimingMixin):
+        status.update(pool.metrics.snapshot())
+    return status
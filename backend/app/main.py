@@ -1,12 +1,18 @@
 import os
-import asyncio
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from .database import engine, Base
-from .routers import auth, labs, users, courses, quiz, admin, dashboard, vm, admin_labs, admin_courses, admin_content, admin_assessments, assessments
-from .utils.vm_lifecycle import VMLifecycleManager
+from fastapi.concurrency import run_in_threadpool
+from .database import engine, async_engine, read_engine, replica_monitor, Base, get_pool_status
+from .routers import auth, labs, users, courses, quiz, admin, dashboard, vm, admin_labs, admin_courses, admin_content, admin_assessments, assessments, media
+from .utils.auth import require_metrics_access
+from .utils.password_service import password_service
+from .utils.metrics import PerformanceMiddleware, register_status_collector, render_metrics
+from .utils.scheduler import scheduler
+from .utils.jobs import register_jobs
+from .utils.mistral import close_client as close_mistral_client, mistral_client
+from .utils.media_processing import processing_status as media_processing_status, stop_processing
+from .utils.progress_buffer import buffer_status as progress_buffer_status, drain_local_buffer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,8 +22,8 @@ Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="Cyyberlabs API", version="2.0.0")
 
-# Initialize VM Lifecycle Manager
-vm_lifecycle = VMLifecycleManager()
+# Periodic jobs (VM optimizer, cache warmers) run once per cluster via Redis leases
+register_jobs(scheduler)
 
 # Get allowed origins from environment variable (required for production)
 ALLOWED_ORIGINS_STR = os.getenv("ALLOWED_ORIGINS")
@@ -37,6 +43,9 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Outermost, so latency includes CORS handling
+app.add_middleware(PerformanceMiddleware)
+
 app.include_router(auth.router, prefix="/api/auth")
 app.include_router(labs.router, prefix="/api/labs")
 app.include_router(users.router, prefix="/api/users")
@@ -51,51 +60,29 @@ app.include_router(admin_content.router, prefix="/api/admin/content")
 app.include_router(admin_assessments.router, prefix="/api/admin/assessments")
 app.include_router(assessments.router, prefix="/api/assessments")
 
-# Mount uploads directory for serving uploaded files
-UPLOAD_DIR = "/app/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Uploaded files (range requests, ETags, optional X-Accel-Redirect to the front nginx)
+app.include_router(media.router, prefix="/uploads")
 
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks on application startup"""
     logger.info("🚀 CyberLabs API starting up...")
-    logger.info("🔧 Starting automatic VM optimization background task...")
-    asyncio.create_task(auto_optimize_vms_loop())
+    logger.info("🔧 Starting periodic job scheduler...")
+    scheduler.start()
     logger.info("✅ Startup complete!")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on application shutdown"""
     logger.info("🛑 CyberLabs API shutting down...")
-
-async def auto_optimize_vms_loop():
-    """
-    Background task that automatically optimizes VM resources.
-    Runs every 5 minutes to pause idle VMs and stop very idle VMs.
-    """
-    await asyncio.sleep(60)  # Wait 1 minute after startup before first optimization
-    
-    while True:
-        try:
-            logger.info("🔄 Running automatic VM optimization...")
-            result = vm_lifecycle.auto_pause_idle_vms(
-                idle_threshold_minutes=10
-            )
-            
-            paused = result.get('paused_count', 0)
-            stopped = result.get('stopped_count', 0)
-            
-            if paused > 0 or stopped > 0:
-                logger.info(f"✅ Optimization complete: Paused {paused} VMs, Stopped {stopped} VMs")
-            else:
-                logger.debug("✓ All VMs are active or already optimized")
-                
-        except Exception as e:
-            logger.error(f"❌ Error in auto-optimization: {e}")
-        
-        # Wait 5 minutes before next optimization
-        await asyncio.sleep(300)
+    await scheduler.stop()
+    await stop_processing()
+    try:
+        await run_in_threadpool(drain_local_buffer)
+    except Exception as e:
+        logger.error(f"❌ Could not save buffered content progress: {e}")
+    await close_mistral_client()
+    password_service.shutdown()
 
 @app.get("/")
 def root():
@@ -119,3 +106,33 @@ def health_check():
         "api": "online",
         "auto_optimization": "active"
     }
+
+register_status_collector("db_pool", {
+    "primary": get_pool_status,
+    "async": lambda: get_pool_status(async_engine.sync_engine),
+    "replica": lambda: get_pool_status(read_engine),
+})
+register_status_collector("password_hashing", {"bcrypt": password_service.status})
+register_status_collector("llm", {"mistral": mistral_client.status})
+register_status_collector("media", {"processing": media_processing_status})
+register_status_collector("progress", {"buffer": progress_buffer_status})
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_access)])
+def metrics():
+    """Prometheus metrics: per-route latency, per-request SQL/Redis/Docker usage, pools"""
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+@app.get("/metrics/summary", dependencies=[Depends(require_metrics_access)])
+def metrics_summary():
+    """Runtime metrics for tuning as JSON (per worker process)"""
+    return {
+        "database_pool": get_pool_status(),
+        "database_async_pool": get_pool_status(async_engine.sync_engine),
+        "database_replica": {**replica_monitor.status(), "pool": get_pool_status(read_engine)},
+        "password_hashing": password_service.status(),
+        "llm": mistral_client.status(),
+        "media_processing": media_processing_status(),
+        "progress_buffer": progress_buffer_status(),
+        "scheduler": scheduler.status()
+    }
@@ -3,10 +3,12 @@ from .progress import LabProgress
 from .lab import Lab, LabTool, LabFile, VMConfiguration
 from .course_content import CourseModule, CourseContent, CourseResource, UserContentProgress
 from .assessment import CourseAssessment, UserAssessmentAttempt
+from .question_bank import QuestionBankEntry, UserServedQuestion
 
 __all__ = [
     "User", "Course", "Enrollment", "LabProgress", "Quiz", "UserQuizResult", "CourseLab", "AssessmentQuizAttempt",
     "Lab", "LabTool", "LabFile", "VMConfiguration",
     "CourseModule", "CourseContent", "CourseResource", "UserContentProgress",
-    "CourseAssessment", "UserAssessmentAttempt"
+    "CourseAssessment", "UserAssessmentAttempt",
+    "QuestionBankEntry", "UserServedQuestion"
 ]
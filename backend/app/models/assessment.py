@@ -2,7 +2,7 @@
 Course Assessment Model
 Stores assessment configuration for each course
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, JSON, Float
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, JSON, Float, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
@@ -41,6 +41,11 @@ class CourseAssessment(Base):
 class UserAssessmentAttempt(Base):
     """Track user assessment attempts"""
     __tablename__ = "user_assessment_attempts"
+    __table_args__ = (
+        Index("ix_user_assessment_attempts_user_course", "user_id", "course_id"),
+        # Admin attempts listing per course
+        Index("ix_user_assessment_attempts_course", "course_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
@@ -7,6 +7,9 @@ from ..database import Base
 class CourseModule(Base):
     """Course modules/sections - organizes course content"""
     __tablename__ = "course_modules"
+    __table_args__ = (
+        Index("ix_course_modules_course_order", "course_id", "order"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id", ondelete="CASCADE"))
@@ -24,6 +27,13 @@ class CourseModule(Base):
 class CourseContent(Base):
     """Individual content items within a module"""
     __tablename__ = "course_contents"
+    __table_args__ = (
+        Index("ix_course_contents_module_order", "module_id", "order"),
+        # Blob reference counting looks rows up by file URL
+        Index("ix_course_contents_file_url", "file_url"),
+        # Media processing sweeper looks up pending/stale rows
+        Index("ix_course_contents_processing_status", "processing_status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     module_id = Column(Integer, ForeignKey("course_modules.id", ondelete="CASCADE"))
@@ -41,9 +51,16 @@ class CourseContent(Base):
     # For text/markdown content
     text_content = Column(Text, nullable=True)
     
-    # For video content
+    # For video content (filled by the media processing pipeline)
     video_duration = Column(Integer, nullable=True)  # in seconds
     video_thumbnail = Column(String, nullable=True)
+    video_poster = Column(String, nullable=True)  # Full-size frame shown before playback
+    hls_url = Column(String, nullable=True)  # Adaptive bitrate master playlist
+    mp4_url = Column(String, nullable=True)  # Progressive 720p fallback for browsers without HLS
+    processing_status = Column(String, nullable=True)  # pending, processing, ready, failed
+    processing_error = Column(Text, nullable=True)
+    processing_attempts = Column(Integer, default=0)
+    processing_started_at = Column(DateTime(timezone=True), nullable=True)
     
     # For quiz content
     quiz_data = Column(JSON, nullable=True)  # Questions and answers
@@ -68,6 +85,9 @@ class CourseContent(Base):
 class CourseResource(Base):
     """Additional downloadable resources for a course"""
     __tablename__ = "course_resources"
+    __table_args__ = (
+        Index("ix_course_resources_file_url", "file_url"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id", ondelete="CASCADE"))
@@ -87,6 +107,9 @@ class CourseResource(Base):
 class UserContentProgress(Base):
     """Track user progress through course content"""
     __tablename__ = "user_content_progress"
+    __table_args__ = (
+        Index("uq_user_content_progress_user_content", "user_id", "content_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
@@ -1,10 +1,16 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
 
 class LabProgress(Base):
     __tablename__ = "lab_progress"
+    __table_args__ = (
+        # One progress row per user/lab; also serves the per-lab progress lookup
+        Index("uq_lab_progress_user_lab", "user_id", "lab_id", unique=True),
+        # Completed-lab counts (dashboard, leaderboard, rank)
+        Index("ix_lab_progress_user_completed", "user_id", "completed"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -0,0 +1,50 @@
+"""
+Question Bank Models
+Pre-generated quiz questions, bucketed by category and difficulty, and the
+record of which questions each user has already been served.
+"""
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+
+class QuestionBankEntry(Base):
+    """A generated multiple choice question ready to be served"""
+    __tablename__ = "question_bank"
+    __table_args__ = (
+        # Draws filter by bucket and skip retired questions
+        Index("ix_question_bank_bucket", "category", "difficulty", "retired"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    category = Column(String, nullable=False)
+    difficulty = Column(String, nullable=False, default="intermediate")
+
+    question = Column(Text, nullable=False)
+    option_a = Column(String, nullable=False)
+    option_b = Column(String, nullable=False)
+    option_c = Column(String, nullable=False)
+    option_d = Column(String, nullable=False)
+    correct_answer = Column(String, nullable=False)  # a, b, c, d
+    points = Column(Integer, default=10)
+
+    # sha256 of the normalized question text; keeps the bank free of duplicates
+    question_hash = Column(String(64), unique=True, nullable=False)
+    source = Column(String, default="mistral")  # mistral, fallback
+
+    times_served = Column(Integer, default=0)
+    retired = Column(Boolean, default=False)  # Served often enough; no longer counted as stock
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UserServedQuestion(Base):
+    """Questions already shown to a user (never drawn for them again)"""
+    __tablename__ = "user_served_questions"
+    __table_args__ = (
+        Index("ix_user_served_questions_user_question", "user_id", "question_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    question_id = Column(Integer, ForeignKey("question_bank.id", ondelete="CASCADE"), nullable=False)
+    served_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Float, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Float, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
@@ -39,6 +39,9 @@ class Course(Base):
 
 class CourseLab(Base):
     __tablename__ = "course_labs"
+    __table_args__ = (
+        Index("ix_course_labs_course_order", "course_id", "order"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id"))
@@ -50,6 +53,10 @@ class CourseLab(Base):
 
 class Enrollment(Base):
     __tablename__ = "enrollments"
+    __table_args__ = (
+        # Leading user_id column also covers "all enrollments of a user"
+        Index("uq_enrollments_user_course", "user_id", "course_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -89,6 +96,9 @@ class QuizQuestion(Base):
 
 class UserQuizResult(Base):
     __tablename__ = "user_quiz_results"
+    __table_args__ = (
+        Index("ix_user_quiz_results_user", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -103,6 +113,9 @@ class UserQuizResult(Base):
 class AssessmentQuizAttempt(Base):
     """Store assessment quiz attempts with questions and answers"""
     __tablename__ = "assessment_quiz_attempts"
+    __table_args__ = (
+        Index("ix_assessment_quiz_attempts_user_started", "user_id", "started_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -134,12 +147,17 @@ class AdminSettings(Base):
 
 class CourseProgress(Base):
     __tablename__ = "course_progress"
+    __table_args__ = (
+        Index("uq_course_progress_user_course", "user_id", "course_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     course_id = Column(Integer, ForeignKey("courses.id"))
     current_module = Column(Integer, default=0)
-    completed_modules = Column(String, default="[]")  # JSON array of completed module IDs
+    # Legacy JSON array of completed module IDs; superseded by course_module_completions
+    # (migrations/add_module_completions.py copies it over)
+    completed_modules = Column(String, default="[]")
     assessment_attempts = Column(Integer, default=0)
     assessment_score = Column(Float, nullable=True)
     last_attempt_at = Column(DateTime(timezone=True), nullable=True)
@@ -148,3 +166,30 @@ class CourseProgress(Base):
     completed_at = Column(DateTime(timezone=True), nullable=True)
     quiz_questions = Column(Text, nullable=True)  # JSON - stored quiz questions
     draft_answers = Column(Text, nullable=True)  # JSON - student's draft answers
+
+class CourseModuleCompletion(Base):
+    """One row per module a student completed in a (file-based) course"""
+    __tablename__ = "course_module_completions"
+    __table_args__ = (
+        # A module is completed once; also serves the per-student progress lookup
+        Index("uq_course_module_completions_user_course_module", "user_id", "course_id", "module_id", unique=True),
+        # Completion analytics per course/module
+        Index("ix_course_module_completions_course_module", "course_id", "module_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    course_id = Column(Integer, ForeignKey("courses.id", ondelete="CASCADE"), nullable=False)
+    module_id = Column(Integer, nullable=False)  # id of the module in the course's content file
+    completed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class UserDashboardSummary(Base):
+    """Per-user dashboard numbers, kept current by the write paths (utils/dashboard_summary.py)"""
+    __tablename__ = "user_dashboard_summaries"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    enrolled_courses = Column(Integer, nullable=False, default=0, server_default="0")
+    completed_labs = Column(Integer, nullable=False, default=0, server_default="0")
+    total_labs = Column(Integer, nullable=False, default=0, server_default="0")  # labs of enrolled courses
+    quiz_scores = Column(JSON, nullable=True)  # JSON - [{quiz_id, category, score, max_score, percentage}]
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
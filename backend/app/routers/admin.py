@@ -1,21 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List
-from ..database import get_db
-from ..models.user import User, Course, Quiz, QuizQuestion, AdminSettings, Enrollment, UserQuizResult
+from typing import List, Optional
+from ..database import get_db, get_read_db
+from ..models.user import User, Course, Quiz, QuizQuestion, AdminSettings, Enrollment, UserQuizResult, CourseModuleCompletion
 from ..schemas import AdminSettingUpdate, UserAdminResponse, CourseCreate, QuizCreate
 from ..utils.auth import get_current_user
+from ..utils.principal_cache import UserPrincipal, invalidate_principal
+from ..utils.refresh_tokens import revoke_user_sessions
+from ..utils.scheduler import scheduler
+from ..utils.blob_store import release_files, course_media_urls
+from ..utils.dashboard_summary import (
+    refresh_dashboard_summaries, rebuild_dashboard_summaries, enrolled_user_ids, invalidate_dashboard_catalog
+)
 
 router = APIRouter(tags=["admin"])
 
-def require_admin(current_user: User = Depends(get_current_user)):
+def require_admin(current_user: UserPrincipal = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
 @router.get("/stats")
-def get_admin_stats(db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def get_admin_stats(db: Session = Depends(get_read_db), current_user: UserPrincipal = Depends(require_admin)):
     try:
         total_users = db.query(User).count()
         total_courses = db.query(Course).count()
@@ -49,12 +56,12 @@ def get_admin_stats(db: Session = Depends(get_db), current_user: User = Depends(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/users", response_model=List[UserAdminResponse])
-def get_all_users(db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def get_all_users(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     users = db.query(User).all()
     return users
 
 @router.put("/users/{user_id}/role")
-def update_user_role(user_id: int, role: str, db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def update_user_role(user_id: int, role: str, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -64,11 +71,13 @@ def update_user_role(user_id: int, role: str, db: Session = Depends(get_db), cur
 
     user.role = role
     db.commit()
+    invalidate_principal(user.id)
+    revoke_user_sessions(user.id)
 
     return {"message": f"User role updated to {role}"}
 
 @router.delete("/users/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def delete_user(user_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -78,16 +87,18 @@ def delete_user(user_id: int, db: Session = Depends(get_db), current_user: User
 
     db.delete(user)
     db.commit()
+    invalidate_principal(user_id)
+    revoke_user_sessions(user_id)
 
     return {"message": "User deleted"}
 
 @router.get("/courses")
-def get_all_courses(db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def get_all_courses(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     courses = db.query(Course).all()
     return courses
 
 @router.put("/courses/{course_id}")
-def update_course(course_id: int, course_data: CourseCreate, db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def update_course(course_id: int, course_data: CourseCreate, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     course = db.query(Course).filter(Course.id == course_id).first()
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -96,22 +107,50 @@ def update_course(course_id: int, course_data: CourseCreate, db: Session = Depen
         setattr(course, key, value)
 
     db.commit()
+    invalidate_dashboard_catalog()
 
     return {"message": "Course updated"}
 
 @router.delete("/courses/{course_id}")
-def delete_course(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def delete_course(course_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     course = db.query(Course).filter(Course.id == course_id).first()
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
 
+    released = course_media_urls(db, course)
+    enrolled = list(db.execute(enrolled_user_ids(course_id)).scalars())
     db.delete(course)
+    refresh_dashboard_summaries(db, ("enrolled_courses", "total_labs"), enrolled)
     db.commit()
+    release_files(db, released)
+    invalidate_dashboard_catalog()
 
     return {"message": "Course deleted"}
 
+@router.get("/courses/{course_id}/module-completion")
+def get_module_completion(course_id: int, db: Session = Depends(get_read_db), current_user: UserPrincipal = Depends(require_admin)):
+    """How many students completed each module, and how far students got"""
+    by_module = db.query(
+        CourseModuleCompletion.module_id, func.count(CourseModuleCompletion.id)
+    ).filter(CourseModuleCompletion.course_id == course_id).group_by(CourseModuleCompletion.module_id).all()
+
+    per_student = db.query(
+        func.count(CourseModuleCompletion.id).label("completed")
+    ).filter(CourseModuleCompletion.course_id == course_id).group_by(CourseModuleCompletion.user_id).subquery()
+    by_count = db.query(per_student.c.completed, func.count()).group_by(per_student.c.completed).all()
+
+    enrolled = db.query(func.count(Enrollment.id)).filter(Enrollment.course_id == course_id).scalar()
+
+    return {
+        "course_id": course_id,
+        "enrolled": enrolled,
+        "students_with_progress": sum(students for _, students in by_count),
+        "modules": [{"module_id": m, "completed": c} for m, c in sorted(by_module)],
+        "students_by_completed_modules": [{"completed_modules": n, "students": s} for n, s in sorted(by_count)]
+    }
+
 @router.get("/quizzes")
-def get_all_quizzes(db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def get_all_quizzes(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     quizzes = db.query(Quiz).all()
     result = []
 
@@ -129,25 +168,29 @@ def get_all_quizzes(db: Session = Depends(get_db), current_user: User = Depends(
     return result
 
 @router.delete("/quizzes/{quiz_id}")
-def delete_quiz(quiz_id: int, db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def delete_quiz(quiz_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
 
+    # Results keep their scores but lose the category shown on dashboards
+    affected = [user_id for (user_id,) in db.query(UserQuizResult.user_id).filter(UserQuizResult.quiz_id == quiz_id).distinct()]
+
     # Delete questions first
     db.query(QuizQuestion).filter(QuizQuestion.quiz_id == quiz_id).delete()
     db.delete(quiz)
+    refresh_dashboard_summaries(db, ("quiz_scores",), affected)
     db.commit()
 
     return {"message": "Quiz deleted"}
 
 @router.get("/settings")
-def get_settings(db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def get_settings(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     settings = db.query(AdminSettings).all()
     return {s.key: s.value for s in settings}
 
 @router.put("/settings")
-def update_setting(setting: AdminSettingUpdate, db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def update_setting(setting: AdminSettingUpdate, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     existing = db.query(AdminSettings).filter(AdminSettings.key == setting.key).first()
 
     if existing:
@@ -161,7 +204,7 @@ def update_setting(setting: AdminSettingUpdate, db: Session = Depends(get_db), c
     return {"message": "Setting updated"}
 
 @router.post("/init-data")
-def initialize_data(db: Session = Depends(get_db), current_user: User = Depends(require_admin)):
+def initialize_data(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
     """Initialize courses with linked labs"""
     from ..models.user import CourseLab
 
@@ -317,6 +360,7 @@ def initialize_data(db: Session = Depends(get_db), current_user: User = Depends(
             course = existing
 
         # Link labs to course (always check and add missing links)
+        linked = False
         for order, lab_id in enumerate(labs):
             existing_link = db.query(CourseLab).filter(
                 CourseLab.course_id == course.id,
@@ -330,6 +374,11 @@ def initialize_data(db: Session = Depends(get_db), current_user: User = Depends(
                     order=order
                 )
                 db.add(course_lab)
+                linked = True
+
+        # Students already enrolled in an existing course gain its new labs
+        if linked and existing:
+            refresh_dashboard_summaries(db, ("total_labs",), enrolled_user_ids(course.id))
 
     # Create assessment quizzes
     quizzes_data = [
@@ -454,5 +503,26 @@ def initialize_data(db: Session = Depends(get_db), current_user: User = Depends(
                 db.add(question)
 
     db.commit()
+    invalidate_dashboard_catalog()
 
     return {"message": "Sample data initialized"}
+
+@router.get("/jobs")
+def get_jobs(current_user: UserPrincipal = Depends(require_admin)):
+    """Periodic jobs with their current leader and last run"""
+    return scheduler.status()
+
+@router.get("/jobs/{job_name}/history")
+def get_job_history(job_name: str, limit: int = 20, current_user: UserPrincipal = Depends(require_admin)):
+    if job_name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return scheduler.history(job_name, min(limit, 100))
+
+@router.post("/dashboard-summaries/rebuild")
+def rebuild_dashboard_summary_rows(user_id: Optional[int] = None, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(require_admin)):
+    """Recompute materialized dashboard numbers for one user, or for everyone"""
+    if user_id is not None and not db.query(User.id).filter(User.id == user_id).first():
+        raise HTTPException(status_code=404, detail="User not found")
+    rebuilt = rebuild_dashboard_summaries(db, None if user_id is None else [user_id])
+    invalidate_dashboard_catalog()
+    return {"rebuilt": rebuilt}
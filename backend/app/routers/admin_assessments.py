@@ -3,13 +3,16 @@ Admin Assessment Management Router
 Handles course assessment creation with AI-generated questions
 """
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
-from ..database import get_db
+from ..database import get_db, get_async_db, get_read_db
 from ..models import User, Course, CourseAssessment, UserAssessmentAttempt
-from ..utils.auth import get_current_user
-from ..utils.mistral import generate_quiz_questions
+from ..utils.auth import get_current_user, get_current_user_async
+from ..utils.principal_cache import UserPrincipal
+from ..utils.question_bank import draw_questions, bank_status
 
 router = APIRouter(tags=["admin-assessments"])
 
@@ -48,7 +51,7 @@ class GenerateQuestionsRequest(BaseModel):
 
 # ========== Helper Functions ==========
 
-def check_admin(current_user: User):
+def check_admin(current_user: UserPrincipal):
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -61,21 +64,21 @@ def check_admin(current_user: User):
 @router.post("/")
 async def create_assessment(
     data: AssessmentCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user_async)
 ):
     """Create assessment for a course with AI-generated questions"""
     check_admin(current_user)
     
     # Verify course exists
-    course = db.query(Course).filter(Course.id == data.course_id).first()
+    course = await db.get(Course, data.course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
     # Check if assessment already exists
-    existing = db.query(CourseAssessment).filter(
-        CourseAssessment.course_id == data.course_id
-    ).first()
+    existing = await db.scalar(
+        select(CourseAssessment).where(CourseAssessment.course_id == data.course_id)
+    )
     if existing:
         raise HTTPException(
             status_code=400,
@@ -86,18 +89,13 @@ async def create_assessment(
     all_questions = []
     questions_per_topic = max(1, data.num_questions // len(data.topics))
     
-    for topic in data.topics:
-        try:
-            questions = await generate_quiz_questions(
-                category=topic,
-                num_questions=questions_per_topic,
-                difficulty=data.difficulty
-            )
-            for q in questions:
-                q["topic"] = topic
-            all_questions.extend(questions)
-        except Exception as e:
-            print(f"Error generating questions for {topic}: {e}")
+    generated = await draw_questions(
+        db, data.topics, per_category=questions_per_topic, difficulty=data.difficulty
+    )
+    for topic, questions in generated.items():
+        for q in questions:
+            q["topic"] = topic
+        all_questions.extend(questions)
     
     # Trim to exact number requested
     all_questions = all_questions[:data.num_questions]
@@ -117,8 +115,8 @@ async def create_assessment(
     )
     
     db.add(assessment)
-    db.commit()
-    db.refresh(assessment)
+    await db.commit()
+    await db.refresh(assessment)
     
     return {
         "message": "Assessment created successfully",
@@ -128,11 +126,21 @@ async def create_assessment(
     }
 
 
+@router.get("/question-bank")
+async def get_question_bank_status(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user_async)
+):
+    """Live question stock per (category, difficulty) bucket"""
+    check_admin(current_user)
+    return await bank_status(db)
+
+
 @router.get("/{course_id}")
 def get_assessment(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get assessment for a course"""
     check_admin(current_user)
@@ -162,11 +170,11 @@ def get_assessment(
 
 
 @router.put("/{course_id}")
-async def update_assessment(
+def update_assessment(
     course_id: int,
     data: AssessmentUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Update assessment configuration"""
     check_admin(current_user)
@@ -192,15 +200,15 @@ async def update_assessment(
 @router.post("/{course_id}/regenerate")
 async def regenerate_questions(
     course_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user_async)
 ):
     """Regenerate assessment questions using AI"""
     check_admin(current_user)
     
-    assessment = db.query(CourseAssessment).filter(
-        CourseAssessment.course_id == course_id
-    ).first()
+    assessment = await db.scalar(
+        select(CourseAssessment).where(CourseAssessment.course_id == course_id)
+    )
     
     if not assessment:
         raise HTTPException(status_code=404, detail="Assessment not found")
@@ -209,23 +217,18 @@ async def regenerate_questions(
     all_questions = []
     questions_per_topic = max(1, assessment.num_questions // len(assessment.topics))
     
-    for topic in assessment.topics:
-        try:
-            questions = await generate_quiz_questions(
-                category=topic,
-                num_questions=questions_per_topic,
-                difficulty=assessment.difficulty
-            )
-            for q in questions:
-                q["topic"] = topic
-            all_questions.extend(questions)
-        except Exception as e:
-            print(f"Error generating questions for {topic}: {e}")
+    generated = await draw_questions(
+        db, assessment.topics, per_category=questions_per_topic, difficulty=assessment.difficulty
+    )
+    for topic, questions in generated.items():
+        for q in questions:
+            q["topic"] = topic
+        all_questions.extend(questions)
     
     all_questions = all_questions[:assessment.num_questions]
     assessment.questions = all_questions
     
-    db.commit()
+    await db.commit()
     
     return {
         "message": "Questions regenerated",
@@ -236,8 +239,8 @@ async def regenerate_questions(
 @router.post("/generate-preview")
 async def generate_preview_questions(
     data: GenerateQuestionsRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user_async)
 ):
     """Preview generated questions before saving"""
     check_admin(current_user)
@@ -245,18 +248,15 @@ async def generate_preview_questions(
     all_questions = []
     questions_per_topic = max(1, data.num_questions // len(data.topics))
     
-    for topic in data.topics:
-        try:
-            questions = await generate_quiz_questions(
-                category=topic,
-                num_questions=questions_per_topic,
-                difficulty=data.difficulty
-            )
-            for q in questions:
-                q["topic"] = topic
-            all_questions.extend(questions)
-        except Exception as e:
-            print(f"Error generating questions for {topic}: {e}")
+    generated = await draw_questions(
+        db, data.topics, per_category=questions_per_topic, difficulty=data.difficulty, record=False
+    )
+    # Keep anything generated live for the preview in the bank
+    await db.commit()
+    for topic, questions in generated.items():
+        for q in questions:
+            q["topic"] = topic
+        all_questions.extend(questions)
     
     return {
         "questions": all_questions[:data.num_questions],
@@ -268,7 +268,7 @@ async def generate_preview_questions(
 def delete_assessment(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Delete assessment from a course"""
     check_admin(current_user)
@@ -289,8 +289,8 @@ def delete_assessment(
 @router.get("/{course_id}/attempts")
 def get_assessment_attempts(
     course_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get all attempts for an assessment (admin view)"""
     check_admin(current_user)
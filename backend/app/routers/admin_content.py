@@ -1,24 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Form, Header
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-import os
-import uuid
-import shutil
 from datetime import datetime
-from ..database import get_db
+from ..database import get_db, get_async_db
 from ..models import User, Course, Lab, CourseModule, CourseContent, CourseResource
 from ..utils.auth import get_current_user
+from ..utils.principal_cache import UserPrincipal
+from ..utils.uploads import (
+    VIDEO_POLICY, DOCUMENT_POLICY, IMAGE_POLICY, RESOURCE_POLICY,
+    receive_upload, form_str, form_int, form_bool
+)
+from ..utils.blob_store import release_files, blob_stats, content_media_urls
+from ..utils.media_processing import enqueue_processing
+from ..utils.image_variants import generate_variants
+from ..utils.resumable_uploads import (
+    TUS_VERSION, UPLOAD_CHUNK_MAX_MB, parse_metadata, create_upload, get_upload,
+    append_chunk, finalize_upload, delete_upload
+)
 from pydantic import BaseModel
 
 router = APIRouter(tags=["admin-content"])
 
-# Upload directory
-UPLOAD_DIR = "/app/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(f"{UPLOAD_DIR}/videos", exist_ok=True)
-os.makedirs(f"{UPLOAD_DIR}/documents", exist_ok=True)
-os.makedirs(f"{UPLOAD_DIR}/images", exist_ok=True)
-
 # ========== Pydantic Schemas ==========
 
 class ModuleCreate(BaseModel):
@@ -59,9 +62,18 @@ class ResourceCreate(BaseModel):
     title: str
     description: Optional[str] = None
 
+class ResumableFinalize(BaseModel):
+    # With module_id the upload becomes a CourseContent item; without it only the file URL is returned
+    module_id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    order: int = 0
+    is_required: bool = True
+    estimated_duration: Optional[int] = None
+
 # ========== Helper Functions ==========
 
-def check_admin(current_user: User):
+def check_admin(current_user: UserPrincipal):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
 
@@ -77,13 +89,18 @@ def get_file_type(filename: str) -> str:
         return 'image'
     return 'other'
 
+def content_type_for_file(filename: str) -> str:
+    """CourseContent type for an uploaded file (anything unrecognised is a document)"""
+    file_type = get_file_type(filename)
+    return file_type if file_type in ['video', 'pdf', 'document', 'image'] else 'document'
+
 # ========== Module Endpoints ==========
 
 @router.get("/courses/{course_id}/modules")
 def get_course_modules(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get all modules for a course with their contents"""
     check_admin(current_user)
@@ -121,7 +138,11 @@ def get_course_modules(
                 "order": c.order,
                 "is_required": c.is_required,
                 "is_active": c.is_active,
-                "estimated_duration": c.estimated_duration
+                "estimated_duration": c.estimated_duration,
+                "video_duration": c.video_duration,
+                "video_thumbnail": c.video_thumbnail,
+                "processing_status": c.processing_status,
+                "processing_error": c.processing_error
             } for c in contents]
         })
     
@@ -132,7 +153,7 @@ def create_module(
     course_id: int,
     module_data: ModuleCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Create a new module in a course"""
     check_admin(current_user)
@@ -158,7 +179,7 @@ def update_module(
     module_id: int,
     module_data: ModuleUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Update a module"""
     check_admin(current_user)
@@ -179,7 +200,7 @@ def update_module(
 def delete_module(
     module_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Delete a module and all its contents"""
     check_admin(current_user)
@@ -188,8 +209,10 @@ def delete_module(
     if not module:
         raise HTTPException(status_code=404, detail="Module not found")
     
+    released = [url for c in module.contents for url in content_media_urls(c)]
     db.delete(module)
     db.commit()
+    release_files(db, released)
     
     return {"message": "Module deleted"}
 
@@ -200,7 +223,7 @@ def create_content(
     module_id: int,
     content_data: ContentCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Create content item in a module"""
     check_admin(current_user)
@@ -221,7 +244,7 @@ def update_content(
     content_id: int,
     content_data: ContentUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Update content item"""
     check_admin(current_user)
@@ -242,7 +265,7 @@ def update_content(
 def delete_content(
     content_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Delete content item"""
     check_admin(current_user)
@@ -251,105 +274,246 @@ def delete_content(
     if not content:
         raise HTTPException(status_code=404, detail="Content not found")
     
-    # Delete associated file if exists
-    if content.file_url and os.path.exists(content.file_url.replace('/uploads/', UPLOAD_DIR + '/')):
-        try:
-            os.remove(content.file_url.replace('/uploads/', UPLOAD_DIR + '/'))
-        except:
-            pass
-    
+    released = content_media_urls(content)
     db.delete(content)
     db.commit()
+    # Files are shared between rows; only unreferenced ones are deleted
+    release_files(db, released)
     
     return {"message": "Content deleted"}
 
+@router.post("/contents/{content_id}/reprocess")
+async def reprocess_content(
+    content_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """Queue a video for probing, thumbnails and HLS transcoding again (e.g. after a failure)"""
+    check_admin(current_user)
+    
+    content = await db.get(CourseContent, content_id)
+    if not content:
+        raise HTTPException(status_code=404, detail="Content not found")
+    if content.content_type != 'video' or not content.file_url:
+        raise HTTPException(status_code=400, detail="Only uploaded videos can be processed")
+    if content.processing_status == 'processing':
+        raise HTTPException(status_code=409, detail="Content is already being processed")
+    
+    content.processing_status = 'pending'
+    content.processing_attempts = 0
+    content.processing_error = None
+    await db.commit()
+    enqueue_processing(content_id)
+    
+    return {"message": "Content queued for processing", "content_id": content_id}
+
 # ========== File Upload Endpoints ==========
+# Uploads are streamed to disk by utils.uploads (size/type checked as bytes arrive)
+# and stored content-addressed: identical files share one blob
 
-@router.post("/upload/video")
-async def upload_video(
-    file: UploadFile = File(...),
+@router.get("/media/stats")
+def get_media_stats(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    """Upload a video file"""
+    """Blob store usage and the space saved by deduplication"""
     check_admin(current_user)
     
-    if not file.filename.lower().endswith(('.mp4', '.webm', '.mov', '.avi')):
-        raise HTTPException(status_code=400, detail="Invalid video format")
-    
-    # Generate unique filename
-    ext = file.filename.split('.')[-1]
-    unique_name = f"{uuid.uuid4()}.{ext}"
-    file_path = f"{UPLOAD_DIR}/videos/{unique_name}"
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    return blob_stats(db)
+
+@router.post("/upload/video")
+async def upload_video(
+    request: Request,
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """Upload a video file (multipart field 'file')"""
+    check_admin(current_user)
     
-    file_size = os.path.getsize(file_path)
+    _, stored = await receive_upload(request, VIDEO_POLICY)
     
     return {
-        "file_url": f"/uploads/videos/{unique_name}",
-        "file_name": file.filename,
-        "file_size": file_size,
+        "file_url": stored.file_url,
+        "file_name": stored.file_name,
+        "file_size": stored.file_size,
+        "sha256": stored.sha256,
         "content_type": "video"
     }
 
 @router.post("/upload/document")
 async def upload_document(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Upload a document (PDF, DOC, etc.)"""
     check_admin(current_user)
     
-    allowed = ('.pdf', '.doc', '.docx', '.txt', '.md', '.ppt', '.pptx', '.xls', '.xlsx')
-    if not file.filename.lower().endswith(allowed):
-        raise HTTPException(status_code=400, detail="Invalid document format")
-    
-    ext = file.filename.split('.')[-1]
-    unique_name = f"{uuid.uuid4()}.{ext}"
-    file_path = f"{UPLOAD_DIR}/documents/{unique_name}"
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    file_size = os.path.getsize(file_path)
+    _, stored = await receive_upload(request, DOCUMENT_POLICY)
     
     return {
-        "file_url": f"/uploads/documents/{unique_name}",
-        "file_name": file.filename,
-        "file_size": file_size,
-        "content_type": get_file_type(file.filename)
+        "file_url": stored.file_url,
+        "file_name": stored.file_name,
+        "file_size": stored.file_size,
+        "sha256": stored.sha256,
+        "content_type": get_file_type(stored.file_name)
     }
 
 @router.post("/upload/image")
 async def upload_image(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Upload an image"""
     check_admin(current_user)
     
-    if not file.filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-        raise HTTPException(status_code=400, detail="Invalid image format")
+    _, stored = await receive_upload(request, IMAGE_POLICY)
+    # Resized WebP/AVIF copies for pages that show the image
+    variants = await generate_variants(stored.file_url)
     
-    ext = file.filename.split('.')[-1]
-    unique_name = f"{uuid.uuid4()}.{ext}"
-    file_path = f"{UPLOAD_DIR}/images/{unique_name}"
+    return {
+        "file_url": stored.file_url,
+        "file_name": stored.file_name,
+        "file_size": stored.file_size,
+        "sha256": stored.sha256,
+        "content_type": "image",
+        "variants": variants
+    }
+
+# ========== Resumable Uploads (tus-style) ==========
+# POST creates the upload, PATCH appends chunks at Upload-Offset, HEAD reports
+# the offset to resume from, finalize turns the complete file into content.
+
+TUS_HEADERS = {"Tus-Resumable": TUS_VERSION, "Cache-Control": "no-store"}
+
+def upload_status_headers(upload, offset: int) -> dict:
+    return {**TUS_HEADERS, "Upload-Offset": str(offset), "Upload-Length": str(upload.length)}
+
+@router.post("/uploads", status_code=201)
+async def create_resumable_upload(
+    request: Request,
+    response: Response,
+    upload_length: int = Header(..., alias="Upload-Length"),
+    upload_metadata: Optional[str] = Header(None, alias="Upload-Metadata"),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """
+    Start a resumable upload.
+    Upload-Metadata: filename (required) and kind (video, document, image or resource)
+    """
+    check_admin(current_user)
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    metadata = parse_metadata(upload_metadata)
+    upload = await create_upload(upload_length, metadata.get("filename"), metadata.get("kind"), current_user.id)
     
-    file_size = os.path.getsize(file_path)
+    location = f"{request.url.path.rstrip('/')}/{upload.id}"
+    response.headers.update({**upload_status_headers(upload, 0), "Location": location})
+    return {
+        "upload_id": upload.id,
+        "location": location,
+        "chunk_max_bytes": UPLOAD_CHUNK_MAX_MB * 1024 * 1024
+    }
+
+@router.head("/uploads/{upload_id}")
+async def get_resumable_upload_offset(
+    upload_id: str,
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """Offset to resume from"""
+    check_admin(current_user)
+    
+    upload = await get_upload(upload_id, current_user.id)
+    return Response(status_code=200, headers=upload_status_headers(upload, upload.offset()))
+
+@router.patch("/uploads/{upload_id}")
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """Append the raw request body (application/offset+octet-stream) at Upload-Offset"""
+    check_admin(current_user)
+    
+    if request.headers.get("content-type", "").split(";")[0].strip() != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Chunks must be sent as application/offset+octet-stream")
+    
+    upload = await get_upload(upload_id, current_user.id)
+    offset = await append_chunk(upload, request, upload_offset)
+    return Response(status_code=204, headers=upload_status_headers(upload, offset))
+
+@router.delete("/uploads/{upload_id}", status_code=204)
+async def cancel_resumable_upload(
+    upload_id: str,
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """Abandon an upload and delete what was received"""
+    check_admin(current_user)
+    
+    upload = await get_upload(upload_id, current_user.id)
+    await delete_upload(upload)
+    return Response(status_code=204, headers=TUS_HEADERS)
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_resumable_upload(
+    upload_id: str,
+    data: ResumableFinalize,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """Store the complete upload; with module_id also create the content item"""
+    check_admin(current_user)
+    
+    upload = await get_upload(upload_id, current_user.id)
+    if data.module_id is not None:
+        if not data.title:
+            raise HTTPException(status_code=422, detail="title is required when module_id is given")
+        if not await db.get(CourseModule, data.module_id):
+            raise HTTPException(status_code=404, detail="Module not found")
+        # No transaction stays open while the upload is hashed and stored
+        await db.rollback()
+    
+    stored = await finalize_upload(upload)
+    file_info = {
+        "file_url": stored.file_url,
+        "file_name": stored.file_name,
+        "file_size": stored.file_size,
+        "sha256": stored.sha256,
+        "content_type": get_file_type(stored.file_name)
+    }
+    if data.module_id is None:
+        return file_info
+    
+    content = CourseContent(
+        module_id=data.module_id,
+        content_type=content_type_for_file(stored.file_name),
+        title=data.title,
+        description=data.description,
+        file_url=stored.file_url,
+        file_name=stored.file_name,
+        file_size=stored.file_size,
+        order=data.order,
+        is_required=data.is_required,
+        estimated_duration=data.estimated_duration
+    )
+    if content.content_type == 'video':
+        content.processing_status = 'pending'
+    db.add(content)
+    await db.commit()
+    await db.refresh(content)
+    if content.processing_status == 'pending':
+        enqueue_processing(content.id)
     
     return {
-        "file_url": f"/uploads/images/{unique_name}",
-        "file_name": file.filename,
-        "file_size": file_size,
-        "content_type": "image"
+        "message": "Content uploaded successfully",
+        "content": {
+            "id": content.id,
+            "title": content.title,
+            "content_type": content.content_type,
+            "file_url": content.file_url,
+            "file_name": content.file_name,
+            "file_size": content.file_size,
+            "sha256": stored.sha256,
+            "processing_status": content.processing_status
+        }
     }
 
 # ========== Content with File Upload ==========
@@ -357,63 +521,48 @@ async def upload_image(
 @router.post("/modules/{module_id}/upload-content")
 async def upload_content_with_file(
     module_id: int,
-    title: str = Form(...),
-    description: str = Form(None),
-    order: int = Form(0),
-    is_required: bool = Form(True),
-    estimated_duration: int = Form(None),
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    """Upload content with file in one request"""
+    """
+    Upload content with file in one request.
+    Multipart fields: title, description, order, is_required, estimated_duration, file
+    """
     check_admin(current_user)
     
-    module = db.query(CourseModule).filter(CourseModule.id == module_id).first()
+    module = await db.get(CourseModule, module_id)
     if not module:
         raise HTTPException(status_code=404, detail="Module not found")
+    # No transaction stays open while the file streams in
+    await db.rollback()
     
-    # Determine content type and upload directory
-    file_type = get_file_type(file.filename)
-    if file_type == 'video':
-        upload_subdir = 'videos'
-        content_type = 'video'
-    elif file_type in ['pdf', 'document']:
-        upload_subdir = 'documents'
-        content_type = file_type
-    elif file_type == 'image':
-        upload_subdir = 'images'
-        content_type = 'image'
-    else:
-        upload_subdir = 'documents'
-        content_type = 'document'
-    
-    # Save file
-    ext = file.filename.split('.')[-1]
-    unique_name = f"{uuid.uuid4()}.{ext}"
-    file_path = f"{UPLOAD_DIR}/{upload_subdir}/{unique_name}"
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    file_size = os.path.getsize(file_path)
+    # Policy (and upload directory) follows the file's extension
+    fields, stored = await receive_upload(request)
+    # Without a title the stored blob stays unreferenced and is collected by the blob GC
+    title = form_str(fields, "title", required=True)
     
     # Create content record
     content = CourseContent(
         module_id=module_id,
-        content_type=content_type,
+        content_type=content_type_for_file(stored.file_name),
         title=title,
-        description=description,
-        file_url=f"/uploads/{upload_subdir}/{unique_name}",
-        file_name=file.filename,
-        file_size=file_size,
-        order=order,
-        is_required=is_required,
-        estimated_duration=estimated_duration
+        description=form_str(fields, "description"),
+        file_url=stored.file_url,
+        file_name=stored.file_name,
+        file_size=stored.file_size,
+        order=form_int(fields, "order", 0),
+        is_required=form_bool(fields, "is_required", True),
+        estimated_duration=form_int(fields, "estimated_duration")
     )
+    if content.content_type == 'video':
+        content.processing_status = 'pending'
     db.add(content)
-    db.commit()
-    db.refresh(content)
+    await db.commit()
+    await db.refresh(content)
+    if content.processing_status == 'pending':
+        # Probe, thumbnails and HLS renditions are produced in the background
+        enqueue_processing(content.id)
     
     return {
         "message": "Content uploaded successfully",
@@ -423,7 +572,8 @@ async def upload_content_with_file(
             "content_type": content.content_type,
             "file_url": content.file_url,
             "file_name": content.file_name,
-            "file_size": content.file_size
+            "file_size": content.file_size,
+            "processing_status": content.processing_status
         }
     }
 
@@ -433,7 +583,7 @@ async def upload_content_with_file(
 def get_course_resources(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get all resources for a course"""
     check_admin(current_user)
@@ -456,40 +606,35 @@ def get_course_resources(
 @router.post("/courses/{course_id}/resources")
 async def upload_resource(
     course_id: int,
-    title: str = Form(...),
-    description: str = Form(None),
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
-    """Upload a resource file for a course"""
+    """Upload a resource file for a course (multipart fields: title, description, file)"""
     check_admin(current_user)
     
-    course = db.query(Course).filter(Course.id == course_id).first()
+    course = await db.get(Course, course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
+    # No transaction stays open while the file streams in
+    await db.rollback()
     
-    ext = file.filename.split('.')[-1]
-    unique_name = f"{uuid.uuid4()}.{ext}"
-    file_path = f"{UPLOAD_DIR}/documents/{unique_name}"
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    file_size = os.path.getsize(file_path)
+    fields, stored = await receive_upload(request, RESOURCE_POLICY)
+    # Without a title the stored blob stays unreferenced and is collected by the blob GC
+    title = form_str(fields, "title", required=True)
     
     resource = CourseResource(
         course_id=course_id,
         title=title,
-        description=description,
-        file_url=f"/uploads/documents/{unique_name}",
-        file_name=file.filename,
-        file_type=ext,
-        file_size=file_size
+        description=form_str(fields, "description"),
+        file_url=stored.file_url,
+        file_name=stored.file_name,
+        file_type=stored.file_name.split('.')[-1],
+        file_size=stored.file_size
     )
     db.add(resource)
-    db.commit()
-    db.refresh(resource)
+    await db.commit()
+    await db.refresh(resource)
     
     return {"message": "Resource uploaded", "resource_id": resource.id}
 
@@ -497,7 +642,7 @@ async def upload_resource(
 def delete_resource(
     resource_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Delete a resource"""
     check_admin(current_user)
@@ -506,8 +651,10 @@ def delete_resource(
     if not resource:
         raise HTTPException(status_code=404, detail="Resource not found")
     
+    released = [resource.file_url]
     db.delete(resource)
     db.commit()
+    release_files(db, released)
     
     return {"message": "Resource deleted"}
 
@@ -516,7 +663,7 @@ def delete_resource(
 @router.get("/available-labs")
 def get_available_labs(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get list of labs available for linking to course content"""
     check_admin(current_user)
@@ -537,7 +684,7 @@ def reorder_modules(
     course_id: int,
     module_orders: List[dict],  # [{"id": 1, "order": 0}, {"id": 2, "order": 1}]
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Reorder modules in a course"""
     check_admin(current_user)
@@ -558,7 +705,7 @@ def reorder_contents(
     module_id: int,
     content_orders: List[dict],  # [{"id": 1, "order": 0}, {"id": 2, "order": 1}]
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Reorder contents in a module"""
     check_admin(current_user)
@@ -581,7 +728,7 @@ def reorder_contents(
 def get_course_linked_labs(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get all labs linked to a course through its modules"""
     check_admin(current_user)
@@ -633,7 +780,7 @@ def link_lab_to_course(
     is_required: bool = Form(True),
     order: int = Form(0),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Link a lab to a course. Creates a module if none specified."""
     check_admin(current_user)
@@ -706,7 +853,7 @@ def unlink_lab_from_course(
     course_id: int,
     content_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Remove a lab link from a course"""
     check_admin(current_user)
@@ -732,7 +879,7 @@ def unlink_lab_from_course(
 @router.get("/all-courses-with-labs")
 def get_all_courses_with_lab_counts(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get all courses with their linked lab counts"""
     check_admin(current_user)
@@ -4,6 +4,9 @@ from typing import List, Optional
 from ..database import get_db
 from ..models import User, Course, CourseLab
 from ..utils.auth import get_current_user
+from ..utils.principal_cache import UserPrincipal
+from ..utils.blob_store import release_files, course_media_urls
+from ..utils.dashboard_summary import refresh_dashboard_summaries, enrolled_user_ids, invalidate_dashboard_catalog
 from pydantic import BaseModel
 
 router = APIRouter(tags=["admin-courses"])
@@ -46,7 +49,7 @@ class CourseResponse(BaseModel):
 
 # ========== Helper Functions ==========
 
-def check_admin(current_user: User):
+def check_admin(current_user: UserPrincipal):
     """Verify user is admin"""
     if current_user.role != "admin":
         raise HTTPException(
@@ -59,7 +62,7 @@ def check_admin(current_user: User):
 @router.get("/")
 def get_all_courses(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     include_inactive: bool = False,
     page: int = 1,
     per_page: int = 10,
@@ -110,7 +113,7 @@ def get_all_courses(
 def create_course(
     course_data: CourseCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Create a new course (admin only)"""
     check_admin(current_user)
@@ -120,6 +123,7 @@ def create_course(
     db.add(new_course)
     db.commit()
     db.refresh(new_course)
+    invalidate_dashboard_catalog()
     
     return new_course
 
@@ -127,7 +131,7 @@ def create_course(
 def get_course(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get course details (admin only)"""
     check_admin(current_user)
@@ -146,7 +150,7 @@ def update_course(
     course_id: int,
     course_data: CourseUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Update course (admin only)"""
     check_admin(current_user)
@@ -165,6 +169,7 @@ def update_course(
     
     db.commit()
     db.refresh(course)
+    invalidate_dashboard_catalog()
     
     return course
 
@@ -172,7 +177,7 @@ def update_course(
 def delete_course(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Delete course (admin only)"""
     check_admin(current_user)
@@ -184,8 +189,15 @@ def delete_course(
             detail=f"Course with ID {course_id} not found"
         )
     
+    # Modules, contents and resources go with the course (ON DELETE CASCADE)
+    released = course_media_urls(db, course)
+    enrolled = list(db.execute(enrolled_user_ids(course_id)).scalars())
+    
     db.delete(course)
+    refresh_dashboard_summaries(db, ("enrolled_courses", "total_labs"), enrolled)
     db.commit()
+    release_files(db, released)
+    invalidate_dashboard_catalog()
     
     return {"message": f"Course '{course.title}' deleted successfully"}
 
@@ -193,7 +205,7 @@ def delete_course(
 def get_course_labs(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get labs assigned to a course"""
     check_admin(current_user)
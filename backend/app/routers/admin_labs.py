@@ -4,6 +4,8 @@ from typing import List, Optional
 from ..database import get_db
 from ..models import User, Lab, LabTool, LabFile, VMConfiguration, Course, CourseLab
 from ..utils.auth import get_current_user
+from ..utils.principal_cache import UserPrincipal
+from ..utils.dashboard_summary import refresh_dashboard_summaries, enrolled_user_ids, lab_user_ids
 from pydantic import BaseModel
 
 router = APIRouter(tags=["admin-labs"])
@@ -92,7 +94,7 @@ class LabResponse(BaseModel):
 
 # ========== Helper Functions ==========
 
-def check_admin(current_user: User):
+def check_admin(current_user: UserPrincipal):
     """Verify user is admin"""
     if current_user.role != "admin":
         raise HTTPException(
@@ -105,7 +107,7 @@ def check_admin(current_user: User):
 @router.get("/")
 def get_all_labs(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
     include_inactive: bool = False,
     page: int = 1,
     per_page: int = 10,
@@ -166,7 +168,7 @@ def get_all_labs(
 def create_lab(
     lab_data: LabCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Create a new lab (admin only)"""
     check_admin(current_user)
@@ -191,7 +193,7 @@ def create_lab(
 def get_lab(
     lab_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get lab details (admin only)"""
     check_admin(current_user)
@@ -210,7 +212,7 @@ def update_lab(
     lab_id: str,
     lab_data: LabUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Update lab (admin only)"""
     check_admin(current_user)
@@ -236,7 +238,7 @@ def update_lab(
 def delete_lab(
     lab_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Delete lab (admin only)"""
     check_admin(current_user)
@@ -248,7 +250,9 @@ def delete_lab(
             detail=f"Lab '{lab_id}' not found"
         )
     
+    affected = lab_user_ids(db, lab_id)
     db.delete(lab)
+    refresh_dashboard_summaries(db, ("completed_labs", "total_labs"), affected)
     db.commit()
     
     return {"message": f"Lab '{lab_id}' deleted successfully"}
@@ -257,7 +261,7 @@ def delete_lab(
 def deactivate_lab(
     lab_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Deactivate lab (admin only) - soft delete"""
     check_admin(current_user)
@@ -278,7 +282,7 @@ def deactivate_lab(
 def activate_lab(
     lab_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Activate lab (admin only)"""
     check_admin(current_user)
@@ -301,7 +305,7 @@ def activate_lab(
 def get_lab_tools(
     lab_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get tools for a specific lab"""
     check_admin(current_user)
@@ -314,7 +318,7 @@ def add_lab_tool(
     lab_id: str,
     tool_data: LabToolCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Add a tool to a lab"""
     check_admin(current_user)
@@ -340,7 +344,7 @@ def delete_lab_tool(
     lab_id: str,
     tool_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Delete a tool from a lab"""
     check_admin(current_user)
@@ -367,7 +371,7 @@ def delete_lab_tool(
 def get_vm_config(
     lab_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get VM configuration for a lab"""
     check_admin(current_user)
@@ -383,7 +387,7 @@ def set_vm_config(
     lab_id: str,
     config_data: VMConfigCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Set VM configuration for a lab"""
     check_admin(current_user)
@@ -423,7 +427,7 @@ def assign_lab_to_course(
     course_id: int,
     order: int = 0,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Assign a lab to a course"""
     check_admin(current_user)
@@ -456,6 +460,7 @@ def assign_lab_to_course(
         order=order
     )
     db.add(association)
+    refresh_dashboard_summaries(db, ("total_labs",), enrolled_user_ids(course_id))
     db.commit()
     
     return {"message": "Lab assigned to course successfully"}
@@ -465,7 +470,7 @@ def unassign_lab_from_course(
     lab_id: str,
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Remove lab from course"""
     check_admin(current_user)
@@ -482,6 +487,7 @@ def unassign_lab_from_course(
         )
     
     db.delete(association)
+    refresh_dashboard_summaries(db, ("total_labs",), enrolled_user_ids(course_id))
     db.commit()
     
     return {"message": "Lab unassigned from course successfully"}
@@ -11,6 +11,7 @@ from pydantic import BaseModel
 from ..database import get_db
 from ..models import User, Course, CourseAssessment, UserAssessmentAttempt
 from ..utils.auth import get_current_user
+from ..utils.principal_cache import UserPrincipal
 
 router = APIRouter(tags=["assessments"])
 
@@ -23,7 +24,7 @@ class SubmitAssessmentRequest(BaseModel):
 def get_course_assessment(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get assessment for a course (student view - no correct answers)"""
     assessment = db.query(CourseAssessment).filter(
@@ -89,7 +90,7 @@ def submit_assessment(
     course_id: int,
     submission: SubmitAssessmentRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Submit assessment answers"""
     assessment = db.query(CourseAssessment).filter(
@@ -180,7 +181,7 @@ def submit_assessment(
 def get_my_attempts(
     course_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get user's assessment attempts for a course"""
     attempts = db.query(UserAssessmentAttempt).filter(
@@ -209,7 +210,7 @@ def get_my_attempts(
 @router.get("/my-results")
 def get_all_my_results(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """Get all assessment results for current user"""
     attempts = db.query(UserAssessmentAttempt).filter(
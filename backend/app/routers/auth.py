@@ -1,37 +1,119 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from ..models import User
-from ..schemas import UserCreate, UserResponse, Token, LoginRequest
-from ..utils.auth import get_password_hash, verify_password, create_access_token
+from ..config import ACCESS_TOKEN_EXPIRE_MINUTES
+from ..schemas import UserCreate, UserResponse, Token, LoginRequest, PasswordChange, RefreshRequest
+from ..utils.auth import create_user_access_token, get_current_user_async
+from ..utils.principal_cache import UserPrincipal, invalidate_principal
+from ..utils.password_service import password_service, PasswordServiceBusy
+from ..utils.refresh_tokens import refresh_tokens, revoke_user_sessions, RefreshTokenError
 
 router = APIRouter(tags=["auth"])
 
+# Handlers are async and await bcrypt in the password pool, so login bursts
+# neither block the event loop nor occupy request threadpool slots.
+
+def busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many login attempts in progress, please retry shortly",
+        headers={"Retry-After": "2"},
+    )
+
+def token_response(user, refresh_token=None) -> dict:
+    """Short-lived access token plus a refresh token (a new session unless one is passed in)"""
+    return {
+        "access_token": create_user_access_token(user),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token or refresh_tokens.issue(user.id)
+    }
+
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.username == user.username).first():
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if await db.scalar(select(User.id).where(User.username == user.username)):
         raise HTTPException(status_code=400, detail="Username already registered")
-    if db.query(User).filter(User.email == user.email).first():
+    if await db.scalar(select(User.id).where(User.email == user.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
 
+    try:
+        hashed_password = await password_service.hash(user.password)
+    except PasswordServiceBusy:
+        raise busy_exception()
+
     db_user = User(
         username=user.username,
         email=user.email,
-        hashed_password=get_password_hash(user.password),
-        vm_password=get_password_hash(user.password),  # Store hashed password for VM access
+        hashed_password=hashed_password,
+        vm_password=hashed_password,  # Store hashed password for VM access
         semester=user.semester,
         department=user.department
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/login", response_model=Token)
-def login(request: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == request.username).first()
-    if not user or not verify_password(request.password, user.hashed_password):
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.username == request.username))
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    try:
+        valid, new_hash = await password_service.verify_and_update(request.password, user.hashed_password)
+    except PasswordServiceBusy:
+        raise busy_exception()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    access_token = create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Transparently upgrade hashes created with a different BCRYPT_ROUNDS
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
+    return token_response(user)
+
+@router.post("/refresh", response_model=Token)
+async def refresh(request: RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """Rotate a refresh token; the new access token reflects the user's current role and profile"""
+    try:
+        grant = refresh_tokens.rotate(request.refresh_token)
+    except RefreshTokenError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+    user = await db.get(User, grant.user_id)
+    if user is None:
+        refresh_tokens.revoke_family(grant.family)
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    return token_response(user, grant.token)
+
+@router.post("/logout")
+def logout(request: RefreshRequest):
+    refresh_tokens.revoke(request.refresh_token)
+    return {"message": "Logged out"}
+
+@router.post("/change-password", response_model=Token)
+async def change_password(request: PasswordChange, db: AsyncSession = Depends(get_async_db), current_user: UserPrincipal = Depends(get_current_user_async)):
+    user = await db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    try:
+        if not await password_service.verify(request.current_password, user.hashed_password):
+            raise HTTPException(status_code=400, detail="Current password is incorrect")
+        hashed_password = await password_service.hash(request.new_password)
+    except PasswordServiceBusy:
+        raise busy_exception()
+
+    user.hashed_password = hashed_password
+    user.vm_password = hashed_password
+    await db.commit()
+    invalidate_principal(current_user.id)
+
+    # Sign out every other session; the caller continues with a fresh token pair
+    revoke_user_sessions(current_user.id)
+    return token_response(user)
@@ -1,13 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select, func, update
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime, timedelta
 import json
 import os
-from ..database import get_db
-from ..models.user import Course, CourseLab, Enrollment, User, CourseProgress
-from ..schemas import CourseCreate, CourseResponse, CourseLabCreate, EnrollmentCreate
-from ..utils.auth import get_current_user
+from ..database import get_db, get_async_db, upsert_insert
+from ..models.user import Course, CourseLab, Enrollment, User, CourseProgress, CourseModuleCompletion
+from ..schemas import CourseCreate, CourseResponse, CourseLabCreate, EnrollmentCreate, ContentProgressHeartbeat
+from ..utils.auth import get_current_user, get_current_user_async
+from ..utils.principal_cache import UserPrincipal
+from ..utils.progress_buffer import record_heartbeat, pending_progress, merged_progress
+from ..utils.dashboard_summary import refresh_dashboard_summaries, enrolled_user_ids, invalidate_dashboard_catalog
 
 COURSES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "courses")
 
@@ -33,12 +38,12 @@ def get_public_courses(db: Session = Depends(get_db)):
     return courses
 
 @router.get("/", response_model=List[CourseResponse])
-def get_courses(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    courses = db.query(Course).filter(Course.is_active == True).all()
-    return courses
+async def get_courses(db: AsyncSession = Depends(get_async_db), current_user: UserPrincipal = Depends(get_current_user_async)):
+    result = await db.execute(select(Course).where(Course.is_active == True))
+    return result.scalars().all()
 
 @router.get("/recommended", response_model=List[CourseResponse])
-def get_recommended_courses(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_recommended_courses(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     from ..models.user import UserQuizResult, Quiz
 
     # Get user's quiz results to determine interests
@@ -71,7 +76,7 @@ def get_recommended_courses(db: Session = Depends(get_db), current_user: User =
     return courses
 
 @router.post("/enroll")
-def enroll_course(enrollment: EnrollmentCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def enroll_course(enrollment: EnrollmentCreate, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     # Check if already enrolled
     existing = db.query(Enrollment).filter(
         Enrollment.user_id == current_user.id,
@@ -86,12 +91,13 @@ def enroll_course(enrollment: EnrollmentCreate, db: Session = Depends(get_db), c
         course_id=enrollment.course_id
     )
     db.add(new_enrollment)
+    refresh_dashboard_summaries(db, ("enrolled_courses", "total_labs"), [current_user.id])
     db.commit()
 
     return {"message": "Successfully enrolled"}
 
 @router.get("/enrolled/list")
-def get_enrolled_courses(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_enrolled_courses(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     enrollments = db.query(Enrollment).filter(Enrollment.user_id == current_user.id).all()
     result = []
 
@@ -113,7 +119,7 @@ def get_enrolled_courses(db: Session = Depends(get_db), current_user: User = Dep
     return result
 
 @router.get("/enrolled/labs")
-def get_enrolled_labs(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_enrolled_labs(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Get all labs from enrolled courses only"""
     import json
     import os
@@ -156,7 +162,7 @@ def get_course(course_id: int, db: Session = Depends(get_db)):
     return course
 
 @router.get("/{course_id}/modules")
-def get_course_modules(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_course_modules(course_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Get course modules and content for students"""
     from ..models.course_content import CourseModule, CourseContent
     
@@ -198,14 +204,78 @@ def get_course_modules(course_id: int, db: Session = Depends(get_db), current_us
                 "linked_lab_id": c.linked_lab_id,
                 "order": c.order,
                 "is_required": c.is_required,
-                "estimated_duration": c.estimated_duration
+                "estimated_duration": c.estimated_duration,
+                "video_duration": c.video_duration,
+                "video_thumbnail": c.video_thumbnail,
+                "video_poster": c.video_poster,
+                "hls_url": c.hls_url,
+                "mp4_url": c.mp4_url
             } for c in contents]
         })
     
     return {"modules": result}
 
+# ========== Content Progress ==========
+# Heartbeats are buffered (progress_buffer.py) and flushed in batches by the
+# scheduler; reads merge the pending deltas into the stored rows.
+
+@router.post("/contents/{content_id}/progress", status_code=202)
+async def report_content_progress(
+    content_id: int,
+    heartbeat: ContentProgressHeartbeat,
+    current_user: UserPrincipal = Depends(get_current_user_async)
+):
+    """Player heartbeat: no database work here (unknown contents are dropped at flush)"""
+    record_heartbeat(
+        current_user.id, content_id,
+        seconds=heartbeat.seconds,
+        progress_percent=heartbeat.progress_percent,
+        completed=heartbeat.completed
+    )
+    return {"content_id": content_id, "accepted": True}
+
+@router.get("/contents/{content_id}/progress")
+async def get_content_progress(
+    content_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user_async)
+):
+    from ..models.course_content import UserContentProgress
+
+    # Primary: a row just flushed may not have reached the replica yet
+    row = (await db.execute(select(UserContentProgress).where(
+        UserContentProgress.user_id == current_user.id,
+        UserContentProgress.content_id == content_id
+    ))).scalar_one_or_none()
+    pending = pending_progress(current_user.id, [content_id]).get(content_id)
+    return merged_progress(content_id, row, pending)
+
+@router.get("/{course_id}/content-progress")
+async def get_course_content_progress(
+    course_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user_async)
+):
+    """Progress for every content item of a course"""
+    from ..models.course_content import CourseModule, CourseContent, UserContentProgress
+
+    content_ids = list((await db.execute(
+        select(CourseContent.id).join(CourseModule)
+        .where(CourseModule.course_id == course_id, CourseContent.is_active == True)
+        .order_by(CourseModule.order, CourseContent.order)
+    )).scalars())
+    rows = {row.content_id: row for row in (await db.execute(select(UserContentProgress).where(
+        UserContentProgress.user_id == current_user.id,
+        UserContentProgress.content_id.in_(content_ids)
+    ))).scalars()} if content_ids else {}
+    pending = pending_progress(current_user.id, content_ids)
+    return {
+        "course_id": course_id,
+        "contents": [merged_progress(cid, rows.get(cid), pending.get(cid)) for cid in content_ids]
+    }
+
 @router.get("/{course_id}/labs")
-def get_course_labs(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_course_labs(course_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     import json
     import os
 
@@ -224,7 +294,7 @@ def get_course_labs(course_id: int, db: Session = Depends(get_db), current_user:
     return labs
 
 @router.post("/", response_model=CourseResponse)
-def create_course(course: CourseCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_course(course: CourseCreate, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
 
@@ -232,21 +302,23 @@ def create_course(course: CourseCreate, db: Session = Depends(get_db), current_u
     db.add(new_course)
     db.commit()
     db.refresh(new_course)
+    invalidate_dashboard_catalog()
     return new_course
 
 @router.post("/lab")
-def add_lab_to_course(course_lab: CourseLabCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def add_lab_to_course(course_lab: CourseLabCreate, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
 
     new_course_lab = CourseLab(**course_lab.dict())
     db.add(new_course_lab)
+    refresh_dashboard_summaries(db, ("total_labs",), enrolled_user_ids(new_course_lab.course_id))
     db.commit()
 
     return {"message": "Lab added to course"}
 
 @router.get("/{course_id}/content")
-def get_course_content(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_course_content(course_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Get course learning content from JSON file"""
     # Check if enrolled
     enrollment = db.query(Enrollment).filter(
@@ -272,8 +344,16 @@ def get_course_content(course_id: int, db: Session = Depends(get_db), current_us
 
     return content
 
+def completed_module_ids(db: Session, user_id: int, course_id: int) -> List[int]:
+    """Completed module ids in the order they were completed"""
+    return list(db.execute(
+        select(CourseModuleCompletion.module_id)
+        .where(CourseModuleCompletion.user_id == user_id, CourseModuleCompletion.course_id == course_id)
+        .order_by(CourseModuleCompletion.completed_at, CourseModuleCompletion.id)
+    ).scalars())
+
 @router.get("/{course_id}/progress")
-def get_course_progress(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_course_progress(course_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Get user's progress in a course"""
     progress = db.query(CourseProgress).filter(
         CourseProgress.user_id == current_user.id,
@@ -283,7 +363,7 @@ def get_course_progress(course_id: int, db: Session = Depends(get_db), current_u
     if not progress:
         return {
             "current_module": 0,
-            "completed_modules": [],
+            "completed_modules": completed_module_ids(db, current_user.id, course_id),
             "assessment_attempts": 0,
             "assessment_score": None,
             "passed": False,
@@ -291,7 +371,7 @@ def get_course_progress(course_id: int, db: Session = Depends(get_db), current_u
             "next_attempt_at": None
         }
 
-    completed = json.loads(progress.completed_modules) if progress.completed_modules else []
+    completed = completed_module_ids(db, current_user.id, course_id)
 
     # Check if can attempt assessment
     can_attempt = True
@@ -319,29 +399,25 @@ def get_course_progress(course_id: int, db: Session = Depends(get_db), current_u
     }
 
 @router.post("/{course_id}/progress")
-def update_course_progress(course_id: int, module_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_course_progress(course_id: int, module_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Update progress - mark module as completed"""
-    progress = db.query(CourseProgress).filter(
-        CourseProgress.user_id == current_user.id,
-        CourseProgress.course_id == course_id
-    ).first()
-
-    if not progress:
-        progress = CourseProgress(
-            user_id=current_user.id,
-            course_id=course_id,
-            current_module=module_id,
-            completed_modules="[]"
-        )
-        db.add(progress)
-
-    completed = json.loads(progress.completed_modules) if progress.completed_modules else []
-
-    if module_id not in completed:
-        completed.append(module_id)
-        progress.completed_modules = json.dumps(completed)
-
-    progress.current_module = module_id
+    insert = upsert_insert(db)
+    # Both statements are idempotent, so concurrent completions cannot lose each other
+    db.execute(
+        insert(CourseModuleCompletion.__table__)
+        .values(user_id=current_user.id, course_id=course_id, module_id=module_id)
+        .on_conflict_do_nothing(index_elements=["user_id", "course_id", "module_id"])
+    )
+    progress_table = CourseProgress.__table__
+    stmt = insert(progress_table).values(
+        user_id=current_user.id,
+        course_id=course_id,
+        current_module=module_id
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[progress_table.c.user_id, progress_table.c.course_id],
+        set_={"current_module": stmt.excluded.current_module}
+    ))
 
     # Calculate and update enrollment progress percentage
     course_file = validate_course_file_path(course_id)
@@ -350,22 +426,28 @@ def update_course_progress(course_id: int, module_id: int, db: Session = Depends
             content = json.load(f)
             total_modules = len(content.get("modules", []))
             if total_modules > 0:
-                progress_percent = (len(completed) / total_modules) * 100
-
-                # Update enrollment progress
-                enrollment = db.query(Enrollment).filter(
-                    Enrollment.user_id == current_user.id,
-                    Enrollment.course_id == course_id
-                ).first()
-                if enrollment:
-                    enrollment.progress = progress_percent
+                # Counted in the same statement that writes it, from the committed rows
+                completed_count = (
+                    select(func.count())
+                    .select_from(CourseModuleCompletion)
+                    .where(
+                        CourseModuleCompletion.user_id == current_user.id,
+                        CourseModuleCompletion.course_id == course_id
+                    )
+                    .scalar_subquery()
+                )
+                db.execute(
+                    update(Enrollment)
+                    .where(Enrollment.user_id == current_user.id, Enrollment.course_id == course_id)
+                    .values(progress=completed_count * 100.0 / total_modules)
+                )
 
     db.commit()
 
-    return {"status": "success", "completed_modules": completed}
+    return {"status": "success", "completed_modules": completed_module_ids(db, current_user.id, course_id)}
 
 @router.get("/{course_id}/assessment")
-def get_course_assessment(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_course_assessment(course_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Get assessment questions - returns stored quiz or creates new one"""
     # Load course content
     course_file = validate_course_file_path(course_id)
@@ -419,7 +501,7 @@ def get_course_assessment(course_id: int, db: Session = Depends(get_db), current
     }
 
 @router.post("/{course_id}/assessment/regenerate")
-def regenerate_assessment(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def regenerate_assessment(course_id: int, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Regenerate quiz questions - clears stored quiz and drafts"""
     course_file = validate_course_file_path(course_id)
     if not os.path.exists(course_file):
@@ -463,7 +545,7 @@ def regenerate_assessment(course_id: int, db: Session = Depends(get_db), current
     }
 
 @router.post("/{course_id}/assessment/draft")
-def save_assessment_draft(course_id: int, answers: dict, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def save_assessment_draft(course_id: int, answers: dict, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Save draft answers"""
     progress = db.query(CourseProgress).filter(
         CourseProgress.user_id == current_user.id,
@@ -484,7 +566,7 @@ def save_assessment_draft(course_id: int, answers: dict, db: Session = Depends(g
     return {"status": "saved"}
 
 @router.post("/{course_id}/assessment")
-def submit_course_assessment(course_id: int, answers: dict, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def submit_course_assessment(course_id: int, answers: dict, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Submit assessment answers and get score"""
     # Get or create progress
     progress = db.query(CourseProgress).filter(
@@ -1,102 +1,43 @@
 from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models.user import User, Course, Enrollment, UserQuizResult, Quiz
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_read_db, get_async_read_db
+from ..models.user import Course, Enrollment, UserDashboardSummary
 from ..models.progress import LabProgress
-from ..utils.auth import get_current_user
+from ..utils.auth import get_current_user, get_current_user_fresh
+from ..utils.principal_cache import UserPrincipal
+from ..utils.leaderboard import get_dashboard_leaderboard
+from ..utils.dashboard_summary import build_dashboard_summary, get_dashboard_catalog, recommended_courses
 
 router = APIRouter(tags=["dashboard"])
 
 @router.get("/stats")
-def get_dashboard_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # Total courses
-    total_courses = db.query(Course).filter(Course.is_active == True).count()
+async def get_dashboard_stats(db: AsyncSession = Depends(get_async_read_db), current_user: UserPrincipal = Depends(get_current_user_fresh)):
+    # One row per user, kept current by the write paths (utils/dashboard_summary.py)
+    result = await db.execute(select(UserDashboardSummary.__table__).where(UserDashboardSummary.user_id == current_user.id))
+    summary = result.mappings().first()
+    if summary is None:
+        summary = await run_in_threadpool(build_dashboard_summary, current_user.id)
 
-    # Enrolled courses
-    enrolled_courses = db.query(Enrollment).filter(Enrollment.user_id == current_user.id).count()
-
-    # Completed labs
-    completed_labs = db.query(LabProgress).filter(
-        LabProgress.user_id == current_user.id,
-        LabProgress.completed == True
-    ).count()
-
-    # Total labs (from enrolled courses)
-    total_labs = 0
-    enrollments = db.query(Enrollment).filter(Enrollment.user_id == current_user.id).all()
-    for enrollment in enrollments:
-        from ..models.user import CourseLab
-        labs_count = db.query(CourseLab).filter(CourseLab.course_id == enrollment.course_id).count()
-        total_labs += labs_count
-
-    # Quiz scores
-    quiz_results = db.query(UserQuizResult).filter(UserQuizResult.user_id == current_user.id).all()
-    quiz_scores = []
-    for result in quiz_results:
-        quiz = db.query(Quiz).filter(Quiz.id == result.quiz_id).first()
-        quiz_scores.append({
-            "quiz_id": result.quiz_id,
-            "category": quiz.category if quiz else "Unknown",
-            "score": result.score,
-            "max_score": result.max_score,
-            "percentage": result.percentage
-        })
-
-    # Recommended courses based on quiz performance
-    recommended = []
-    if quiz_scores:
-        # Find strong categories
-        strong_categories = [qs["category"] for qs in quiz_scores if qs["percentage"] >= 60]
-
-        if strong_categories:
-            courses = db.query(Course).filter(
-                Course.is_active == True,
-                Course.category.in_(strong_categories)
-            ).limit(3).all()
-        else:
-            courses = db.query(Course).filter(
-                Course.is_active == True,
-                Course.difficulty == "Beginner"
-            ).limit(3).all()
-
-        for course in courses:
-            recommended.append({
-                "id": course.id,
-                "title": course.title,
-                "description": course.description,
-                "category": course.category,
-                "difficulty": course.difficulty,
-                "duration": course.duration
-            })
-    else:
-        # No quiz taken, recommend beginner courses
-        courses = db.query(Course).filter(
-            Course.is_active == True,
-            Course.difficulty == "Beginner"
-        ).limit(3).all()
-
-        for course in courses:
-            recommended.append({
-                "id": course.id,
-                "title": course.title,
-                "description": course.description,
-                "category": course.category,
-                "difficulty": course.difficulty,
-                "duration": course.duration
-            })
+    catalog = await get_dashboard_catalog(db)
+    quiz_scores = summary["quiz_scores"] or []
+    completed_labs = summary["completed_labs"]
 
     return {
-        "total_courses": total_courses,
-        "enrolled_courses": enrolled_courses,
+        "total_courses": catalog["total_courses"],
+        "enrolled_courses": summary["enrolled_courses"],
         "completed_labs": completed_labs,
-        "total_labs": total_labs if total_labs > 0 else completed_labs,
+        "total_labs": summary["total_labs"] if summary["total_labs"] > 0 else completed_labs,
         "quiz_completed": current_user.quiz_completed,
         "quiz_scores": quiz_scores,
-        "recommended_courses": recommended
+        # Recommended courses based on quiz performance
+        "recommended_courses": recommended_courses(catalog, quiz_scores)
     }
 
 @router.get("/recent-activity")
-def get_recent_activity(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_recent_activity(db: Session = Depends(get_read_db), current_user: UserPrincipal = Depends(get_current_user)):
     # Get recent lab completions
     recent_progress = db.query(LabProgress).filter(
         LabProgress.user_id == current_user.id
@@ -129,23 +70,6 @@ def get_recent_activity(db: Session = Depends(get_db), current_user: User = Depe
     return activities
 
 @router.get("/leaderboard")
-def get_leaderboard(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # Get top users by completed labs
-    users = db.query(User).all()
-    leaderboard = []
-
-    for user in users:
-        completed = db.query(LabProgress).filter(
-            LabProgress.user_id == user.id,
-            LabProgress.completed == True
-        ).count()
-
-        leaderboard.append({
-            "username": user.username,
-            "completed_labs": completed,
-            "department": user.department
-        })
-
-    leaderboard.sort(key=lambda x: x["completed_labs"], reverse=True)
-
-    return leaderboard[:10]
+def get_leaderboard(db: Session = Depends(get_read_db), current_user: UserPrincipal = Depends(get_current_user)):
+    # Top users by completed labs (cached, kept warm by the scheduler)
+    return get_dashboard_leaderboard(db)
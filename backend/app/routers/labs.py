@@ -1,55 +1,66 @@
 import json
 import os
+from typing import Dict, List
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, case, func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from ..database import get_db
-from ..models import User, LabProgress
-from ..schemas import ProgressUpdate, ProgressResponse
-from ..utils.auth import get_current_user
+from ..database import get_db, get_async_db, upsert_insert
+from ..models import User, Lab, LabProgress
+from ..schemas import ProgressUpdate, ProgressBatchUpdate, ProgressResponse
+from ..utils.auth import get_current_user, get_current_user_async
+from ..utils.principal_cache import UserPrincipal
+from ..utils.dashboard_summary import refresh_dashboard_summaries
 
 router = APIRouter(tags=["labs"])
 
 LABS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "labs")
+LAB_PROGRESS_BATCH_MAX = 100
 
-@router.get("/public")
-def get_public_labs(db: Session = Depends(get_db)):
-    """Public endpoint to get all labs without authentication (no progress data)"""
+def load_lab_files() -> list:
+    """Read every lab definition from LABS_DIR"""
     labs = []
     for filename in os.listdir(LABS_DIR):
         if filename.endswith(".json"):
             with open(os.path.join(LABS_DIR, filename)) as f:
-                lab = json.load(f)
-                # Don't include progress for public endpoint
-                lab["progress"] = {
-                    "current_step": 0,
-                    "completed": False,
-                    "total_steps": len(lab.get("tasks", []))
-                }
-                labs.append(lab)
+                labs.append(json.load(f))
+    return labs
+
+@router.get("/public")
+def get_public_labs(db: Session = Depends(get_db)):
+    """Public endpoint to get all labs without authentication (no progress data)"""
+    labs = load_lab_files()
+    for lab in labs:
+        # Don't include progress for public endpoint
+        lab["progress"] = {
+            "current_step": 0,
+            "completed": False,
+            "total_steps": len(lab.get("tasks", []))
+        }
     return labs
 
 @router.get("/")
-def get_all_labs(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    labs = []
-    for filename in os.listdir(LABS_DIR):
-        if filename.endswith(".json"):
-            with open(os.path.join(LABS_DIR, filename)) as f:
-                lab = json.load(f)
-                progress = db.query(LabProgress).filter(
-                    LabProgress.user_id == current_user.id,
-                    LabProgress.lab_id == lab["id"]
-                ).first()
-                lab["progress"] = {
-                    "current_step": progress.current_step if progress else 0,
-                    "completed": progress.completed if progress else False,
-                    "total_steps": len(lab["tasks"])
-                }
-                labs.append(lab)
+async def get_all_labs(current_user: UserPrincipal = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    labs = await run_in_threadpool(load_lab_files)
+
+    # One query for all of the user's progress instead of one per lab
+    result = await db.execute(select(LabProgress).where(LabProgress.user_id == current_user.id))
+    progress_by_lab = {p.lab_id: p for p in result.scalars()}
+
+    for lab in labs:
+        progress = progress_by_lab.get(lab["id"])
+        lab["progress"] = {
+            "current_step": progress.current_step if progress else 0,
+            "completed": progress.completed if progress else False,
+            "total_steps": len(lab["tasks"])
+        }
     return labs
 
 @router.get("/{lab_id}")
-def get_lab(lab_id: str, current_user: User = Depends(get_current_user)):
+def get_lab(lab_id: str, current_user: UserPrincipal = Depends(get_current_user)):
     # Validate lab_id to prevent path traversal
     if not lab_id.replace("_", "").replace("-", "").isalnum():
         raise HTTPException(status_code=400, detail="Invalid lab ID")
@@ -65,32 +76,96 @@ def get_lab(lab_id: str, current_user: User = Depends(get_current_user)):
     with open(lab_path) as f:
         return json.load(f)
 
+def merge_progress_updates(updates: List[ProgressUpdate]) -> Dict[str, ProgressUpdate]:
+    """One update per lab: furthest step, completed if any update completed, latest flag"""
+    merged: Dict[str, ProgressUpdate] = {}
+    for update in updates:
+        current = merged.get(update.lab_id)
+        if current is None:
+            merged[update.lab_id] = update.model_copy()
+            continue
+        current.current_step = max(current.current_step, update.current_step)
+        current.completed = bool(current.completed or update.completed)
+        current.flag_submitted = update.flag_submitted or current.flag_submitted
+    return merged
+
+def upsert_lab_progress(db: Session, user_id: int, updates: List[ProgressUpdate]):
+    """
+    INSERT ... ON CONFLICT (user_id, lab_id) DO UPDATE for every update in one
+    statement. Progress only moves forward, so retried or out-of-order updates
+    (offline sync) cannot undo a step or a completion.
+    """
+    table = LabProgress.__table__
+    now = datetime.utcnow()
+    rows = [{
+        "user_id": user_id,
+        "lab_id": update.lab_id,
+        "current_step": update.current_step,
+        "completed": bool(update.completed),
+        "flag_submitted": update.flag_submitted,
+        "completed_at": now if update.completed else None,
+    } for update in sorted(merge_progress_updates(updates).values(), key=lambda u: u.lab_id)]
+
+    stmt = upsert_insert(db)(table).values(rows)
+    excluded = stmt.excluded
+    current_step = func.coalesce(table.c.current_step, 0)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.lab_id],
+        set_={
+            "current_step": case((excluded.current_step > current_step, excluded.current_step), else_=current_step),
+            "completed": or_(table.c.completed.is_(True), excluded.completed.is_(True)),
+            "flag_submitted": func.coalesce(excluded.flag_submitted, table.c.flag_submitted),
+            "completed_at": func.coalesce(table.c.completed_at, excluded.completed_at),
+            "updated_at": func.now(),
+        }
+    ).returning(table.c.lab_id, table.c.current_step, table.c.completed)
+    rows = db.execute(stmt).all()
+    if any(row.completed for row in rows):
+        refresh_dashboard_summaries(db, ("completed_labs",), [user_id])
+    return rows
+
 @router.post("/progress")
 def update_progress(
     progress: ProgressUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    try:
+        upsert_lab_progress(db, current_user.id, [progress])
+        db.commit()
+    except IntegrityError:
+        # lab_id is not a known lab (foreign key)
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Lab not found")
+    return {"status": "success"}
+
+@router.post("/progress/batch")
+def update_progress_batch(
+    batch: ProgressBatchUpdate,
+    current_user: UserPrincipal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    db_progress = db.query(LabProgress).filter(
-        LabProgress.user_id == current_user.id,
-        LabProgress.lab_id == progress.lab_id
-    ).first()
-
-    if not db_progress:
-        db_progress = LabProgress(user_id=current_user.id, lab_id=progress.lab_id)
-        db.add(db_progress)
-
-    db_progress.current_step = progress.current_step
-    db_progress.completed = progress.completed
-    if progress.flag_submitted:
-        db_progress.flag_submitted = progress.flag_submitted
-    if progress.completed:
-        db_progress.completed_at = datetime.utcnow()
+    """Apply several step updates (e.g. progress made offline) in one statement"""
+    if not batch.updates:
+        return {"status": "success", "progress": [], "unknown_labs": []}
+    if len(batch.updates) > LAB_PROGRESS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {LAB_PROGRESS_BATCH_MAX} updates per batch")
 
+    lab_ids = {update.lab_id for update in batch.updates}
+    known = set(db.execute(select(Lab.id).where(Lab.id.in_(lab_ids))).scalars())
+    updates = [update for update in batch.updates if update.lab_id in known]
+    rows = upsert_lab_progress(db, current_user.id, updates) if updates else []
     db.commit()
-    return {"status": "success"}
+
+    return {
+        "status": "success",
+        "progress": [
+            {"lab_id": lab_id, "current_step": step, "completed": completed} for lab_id, step, completed in rows
+        ],
+        "unknown_labs": sorted(lab_ids - known)
+    }
 
 @router.get("/progress/all")
-def get_all_progress(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_all_progress(current_user: UserPrincipal = Depends(get_current_user), db: Session = Depends(get_db)):
     progress = db.query(LabProgress).filter(LabProgress.user_id == current_user.id).all()
     return [{"lab_id": p.lab_id, "current_step": p.current_step, "completed": p.completed} for p in progress]
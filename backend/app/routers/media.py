@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Request
+from ..utils.media_files import serve_media
+from ..utils.image_variants import VARIANT_URL_PREFIX, ensure_variant
+
+router = APIRouter(tags=["media"])
+
+# ========== Uploaded Media ==========
+# Replaces the StaticFiles mount: ranges, ETags, immutable blobs, X-Accel-Redirect
+
+@router.api_route("/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_media(file_path: str, request: Request):
+    """Serve an uploaded file (public, like the former static mount)"""
+    if f"/uploads/{file_path}".startswith(VARIANT_URL_PREFIX):
+        # Image variants are generated on first request and cached on disk
+        await ensure_variant(file_path)
+    return await serve_media(request, file_path)
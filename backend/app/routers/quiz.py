@@ -1,19 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import asyncio
 import json
 from datetime import datetime
-from ..database import get_db
+from ..database import get_db, get_async_db, AsyncSessionLocal
 from ..models.user import Quiz, QuizQuestion, UserQuizResult, User, AssessmentQuizAttempt
 from ..schemas import QuizCreate, QuizResponse, QuizSubmission, QuizResultResponse, QuizQuestionResponse
-from ..utils.auth import get_current_user
-from ..utils.mistral import generate_quiz_questions, get_fallback_questions
+from ..utils.auth import get_current_user, get_current_user_async, get_current_db_user
+from ..utils.principal_cache import UserPrincipal, invalidate_principal
+from ..utils.dashboard_summary import refresh_dashboard_summaries
+from ..utils.question_bank import draw_questions, stream_questions, ASSESSMENT_CATEGORIES, ASSESSMENT_DIFFICULTY
 
 router = APIRouter(tags=["quiz"])
 
 @router.get("/", response_model=List[QuizResponse])
-def get_quizzes(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_quizzes(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     quizzes = db.query(Quiz).filter(Quiz.is_active == True).all()
     result = []
 
@@ -41,11 +46,14 @@ def get_quizzes(db: Session = Depends(get_db), current_user: User = Depends(get_
     return result
 
 @router.get("/assessment")
-async def get_assessment_quiz(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_assessment_quiz(db: AsyncSession = Depends(get_async_db), current_user: UserPrincipal = Depends(get_current_user_async)):
     """Get user's assessment quiz attempts"""
-    attempts = db.query(AssessmentQuizAttempt).filter(
-        AssessmentQuizAttempt.user_id == current_user.id
-    ).order_by(AssessmentQuizAttempt.started_at.desc()).all()
+    result = await db.execute(
+        select(AssessmentQuizAttempt)
+        .where(AssessmentQuizAttempt.user_id == current_user.id)
+        .order_by(AssessmentQuizAttempt.started_at.desc())
+    )
+    attempts = result.scalars().all()
     
     return {
         "attempts": [
@@ -65,57 +73,49 @@ async def get_assessment_quiz(db: Session = Depends(get_db), current_user: User
         "total_attempts": len(attempts)
     }
 
+def _attempt_questions(category: str, questions: List[dict], first_id: int) -> List[dict]:
+    """Bank/generated questions in the attempt's stored format (ids continue from first_id)"""
+    quiz_id = ASSESSMENT_CATEGORIES.index(category) + 1
+    return [
+        {
+            "id": question_id,
+            "quiz_id": quiz_id,
+            "category": category,
+            "question": q["question"],
+            "option_a": q["option_a"],
+            "option_b": q["option_b"],
+            "option_c": q["option_c"],
+            "option_d": q["option_d"],
+            "correct_answer": q["correct_answer"],
+            "points": q.get("points", 10),
+            "bank_id": q.get("bank_id")
+        }
+        for question_id, q in enumerate(questions, start=first_id)
+    ]
+
+async def _next_attempt_number(db: AsyncSession, user_id: int) -> int:
+    existing_attempts = await db.scalar(
+        select(func.count()).select_from(AssessmentQuizAttempt).where(
+            AssessmentQuizAttempt.user_id == user_id
+        )
+    )
+    return existing_attempts + 1
+
 @router.post("/assessment/create")
-async def create_assessment_quiz(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """Create a new assessment quiz attempt using Mistral AI"""
-    categories = ["Network Security", "Web Security", "Cryptography", "Linux Fundamentals", "Penetration Testing", "Incident Response"]
+async def create_assessment_quiz(db: AsyncSession = Depends(get_async_db), current_user: UserPrincipal = Depends(get_current_user_async)):
+    """Create a new assessment quiz attempt from the pre-generated question bank"""
+    categories = ASSESSMENT_CATEGORIES
 
-    all_questions = []
-    question_id = 1
+    # Questions this user has not seen before; live Mistral generation only if a bucket runs dry
+    generated = await draw_questions(
+        db, categories, per_category=3, difficulty=ASSESSMENT_DIFFICULTY, user_id=current_user.id
+    )
 
+    all_questions = []
     for category in categories:
-        try:
-            # Generate unique questions for each user using Mistral AI
-            questions = await generate_quiz_questions(category, num_questions=3)
-
-            for q in questions:
-                all_questions.append({
-                    "id": question_id,
-                    "quiz_id": categories.index(category) + 1,
-                    "category": category,
-                    "question": q["question"],
-                    "option_a": q["option_a"],
-                    "option_b": q["option_b"],
-                    "option_c": q["option_c"],
-                    "option_d": q["option_d"],
-                    "correct_answer": q["correct_answer"],
-                    "points": q.get("points", 10)
-                })
-                question_id += 1
-        except Exception as e:
-            print(f"Error generating questions for {category}: {e}")
-            # Use fallback questions
-            fallback = get_fallback_questions(category, 3)
-            for q in fallback:
-                all_questions.append({
-                    "id": question_id,
-                    "quiz_id": categories.index(category) + 1,
-                    "category": category,
-                    "question": q["question"],
-                    "option_a": q["option_a"],
-                    "option_b": q["option_b"],
-                    "option_c": q["option_c"],
-                    "option_d": q["option_d"],
-                    "correct_answer": q["correct_answer"],
-                    "points": q.get("points", 10)
-                })
-                question_id += 1
-
-    # Get attempt number
-    existing_attempts = db.query(AssessmentQuizAttempt).filter(
-        AssessmentQuizAttempt.user_id == current_user.id
-    ).count()
-    attempt_number = existing_attempts + 1
+        all_questions += _attempt_questions(category, generated[category], first_id=len(all_questions) + 1)
+
+    attempt_number = await _next_attempt_number(db, current_user.id)
 
     # Create and save the attempt
     attempt = AssessmentQuizAttempt(
@@ -125,8 +125,8 @@ async def create_assessment_quiz(db: Session = Depends(get_db), current_user: Us
         max_score=sum(q.get("points", 10) for q in all_questions)
     )
     db.add(attempt)
-    db.commit()
-    db.refresh(attempt)
+    await db.commit()
+    await db.refresh(attempt)
 
     return {
         "attempt_id": attempt.id,
@@ -135,17 +135,79 @@ async def create_assessment_quiz(db: Session = Depends(get_db), current_user: Us
         "attempt_number": attempt_number
     }
 
+@router.post("/assessment/create/stream")
+async def create_assessment_quiz_stream(current_user: UserPrincipal = Depends(get_current_user_async)):
+    """
+    Create an assessment attempt and stream its questions as NDJSON, one line per event:
+    {"type": "attempt", ...} first, then {"type": "questions", "category": ...} per category
+    as soon as it is ready, then {"type": "complete", "total": ..., "max_score": ...}.
+    Each category is saved to the attempt before it is sent, so answers can be submitted at any time.
+    """
+    user_id = current_user.id
+
+    async def events():
+        # Own session: the stream outlives the request's dependencies
+        async with AsyncSessionLocal() as db:
+            attempt = AssessmentQuizAttempt(
+                user_id=user_id,
+                attempt_number=await _next_attempt_number(db, user_id),
+                questions=[],
+                max_score=0
+            )
+            db.add(attempt)
+            await db.commit()
+            yield json.dumps({
+                "type": "attempt",
+                "attempt_id": attempt.id,
+                "attempt_number": attempt.attempt_number,
+                "categories": ASSESSMENT_CATEGORIES,
+                "expected_total": len(ASSESSMENT_CATEGORIES) * 3
+            }) + "\n"
+
+            try:
+                async for category, questions in stream_questions(
+                    db, ASSESSMENT_CATEGORIES, per_category=3, difficulty=ASSESSMENT_DIFFICULTY, user_id=user_id
+                ):
+                    batch = _attempt_questions(category, questions, first_id=len(attempt.questions) + 1)
+                    # Reassign so SQLAlchemy sees the JSON column change
+                    attempt.questions = attempt.questions + batch
+                    attempt.max_score = sum(q["points"] for q in attempt.questions)
+                    await db.commit()
+                    yield json.dumps({"type": "questions", "category": category, "questions": batch}) + "\n"
+            except Exception as e:
+                print(f"Assessment stream error for attempt {attempt.id}: {e}")
+                await db.rollback()
+                yield json.dumps({"type": "error", "detail": "Question generation failed"}) + "\n"
+                return
+
+            yield json.dumps({
+                "type": "complete",
+                "attempt_id": attempt.id,
+                "total": len(attempt.questions),
+                "max_score": attempt.max_score
+            }) + "\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        # Keep proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/assessment/{attempt_id}")
 async def get_assessment_attempt(
     attempt_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_user_async)
 ):
     """Get a specific assessment quiz attempt"""
-    attempt = db.query(AssessmentQuizAttempt).filter(
-        AssessmentQuizAttempt.id == attempt_id,
-        AssessmentQuizAttempt.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(AssessmentQuizAttempt).where(
+            AssessmentQuizAttempt.id == attempt_id,
+            AssessmentQuizAttempt.user_id == current_user.id
+        )
+    )
+    attempt = result.scalars().first()
     
     if not attempt:
         raise HTTPException(status_code=404, detail="Attempt not found")
@@ -165,7 +227,7 @@ async def get_assessment_attempt(
     }
 
 @router.post("/submit")
-def submit_quiz(submission: QuizSubmission, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def submit_quiz(submission: QuizSubmission, db: Session = Depends(get_db), current_user: User = Depends(get_current_db_user)):
     quiz = db.query(Quiz).filter(Quiz.id == submission.quiz_id).first()
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
@@ -196,7 +258,9 @@ def submit_quiz(submission: QuizSubmission, db: Session = Depends(get_db), curre
     # Mark quiz as completed for user
     current_user.quiz_completed = True
 
+    refresh_dashboard_summaries(db, ("quiz_scores",), [current_user.id])
     db.commit()
+    invalidate_principal(current_user.id)
 
     return {
         "quiz_id": quiz.id,
@@ -207,7 +271,7 @@ def submit_quiz(submission: QuizSubmission, db: Session = Depends(get_db), curre
     }
 
 @router.post("/submit-assessment")
-def submit_assessment(submission: dict, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def submit_assessment(submission: dict, db: Session = Depends(get_db), current_user: User = Depends(get_current_db_user)):
     """Submit answers for dynamically generated assessment"""
     attempt_id = submission.get("attempt_id")
     answers = submission.get("answers", submission)
@@ -301,7 +365,9 @@ def submit_assessment(submission: dict, db: Session = Depends(get_db), current_u
     
     # Mark quiz as completed for user
     current_user.quiz_completed = True
+    refresh_dashboard_summaries(db, ("quiz_scores",), [current_user.id])
     db.commit()
+    invalidate_principal(current_user.id)
 
     return {
         "attempt_id": attempt.id,
@@ -313,7 +379,7 @@ def submit_assessment(submission: dict, db: Session = Depends(get_db), current_u
     }
 
 @router.get("/results", response_model=List[QuizResultResponse])
-def get_quiz_results(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_quiz_results(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     results = db.query(UserQuizResult).filter(UserQuizResult.user_id == current_user.id).all()
     response = []
 
@@ -330,7 +396,7 @@ def get_quiz_results(db: Session = Depends(get_db), current_user: User = Depends
     return response
 
 @router.post("/create")
-def create_quiz(quiz_data: QuizCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_quiz(quiz_data: QuizCreate, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
 
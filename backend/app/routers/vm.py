@@ -5,19 +5,22 @@ import docker
 import random
 import logging
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..models import User
-from ..utils.auth import get_current_user
+from ..utils.auth import get_current_user, get_current_user_async, get_current_db_user
+from ..utils.principal_cache import UserPrincipal
 from ..utils.vm_lifecycle import VMLifecycleManager
 from ..utils.redis_client import redis_client
+from ..utils.metrics import instrument_docker_client
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["vm"])
 
 # Docker client
-docker_client = docker.from_env()
+docker_client = instrument_docker_client(docker.from_env())
 
 # VM Lifecycle Manager
 vm_lifecycle = VMLifecycleManager()
@@ -66,7 +69,7 @@ def get_all_user_vms(user_id: int) -> list:
     return vms
 
 @router.post("/start/{lab_id}")
-def start_vm(lab_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def start_vm(lab_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_db_user)):
     """Start a VM container for a specific lab"""
     try:
         # Check if user already has a VM running for this lab
@@ -166,7 +169,7 @@ def start_vm(lab_id: str, db: Session = Depends(get_db), current_user: User = De
         raise HTTPException(status_code=500, detail=f"Failed to start VM: {str(e)}")
 
 @router.post("/stop/{lab_id}")
-def stop_vm(lab_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def stop_vm(lab_id: str, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Stop a running VM container"""
     try:
         vm_state = get_vm_state(current_user.id, lab_id)
@@ -193,9 +196,14 @@ def stop_vm(lab_id: str, db: Session = Depends(get_db), current_user: User = Dep
         raise HTTPException(status_code=500, detail=f"Failed to stop VM: {str(e)}")
 
 @router.get("/status/{lab_id}")
-def get_vm_status(lab_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_vm_status(lab_id: str, current_user: UserPrincipal = Depends(get_current_user_async)):
     """Get status of VM for a specific lab"""
-    vm_state = get_vm_state(current_user.id, lab_id)
+    # Redis and Docker clients are blocking; keep them off the event loop
+    return await run_in_threadpool(read_vm_status, current_user.id, lab_id)
+
+def read_vm_status(user_id: int, lab_id: str) -> dict:
+    """Look up the VM state in Redis and refresh it from Docker"""
+    vm_state = get_vm_state(user_id, lab_id)
     
     if not vm_state or not vm_state.get("container_id"):
         return {
@@ -206,10 +214,10 @@ def get_vm_status(lab_id: str, db: Session = Depends(get_db), current_user: User
     container_id = vm_state["container_id"]
     
     try:
+        # containers.get() already returns fresh attributes; no reload() needed
         container = docker_client.containers.get(container_id)
         
         # Get actual ports from the running container
-        container.reload()
         actual_vnc_port = None
         actual_novnc_port = None
         
@@ -227,7 +235,7 @@ def get_vm_status(lab_id: str, db: Session = Depends(get_db), current_user: User
         if actual_vnc_port or actual_novnc_port:
             vm_state["vnc_port"] = final_vnc_port
             vm_state["novnc_port"] = final_novnc_port
-            set_vm_state(current_user.id, lab_id, vm_state)
+            set_vm_state(user_id, lab_id, vm_state)
         
         return {
             "status": container.status,
@@ -237,14 +245,14 @@ def get_vm_status(lab_id: str, db: Session = Depends(get_db), current_user: User
             "novnc_port": final_novnc_port
         }
     except docker.errors.NotFound:
-        delete_vm_state(current_user.id, lab_id)
+        delete_vm_state(user_id, lab_id)
         return {
             "status": "not_found",
             "running": False
         }
 
 @router.get("/list")
-def list_user_vms(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def list_user_vms(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """List all running VMs for the current user"""
     user_vms = []
     vms = get_all_user_vms(current_user.id)
@@ -266,7 +274,7 @@ def list_user_vms(db: Session = Depends(get_db), current_user: User = Depends(ge
     return {"vms": user_vms}
 
 @router.delete("/cleanup")
-def cleanup_stopped_vms(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def cleanup_stopped_vms(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Clean up stopped or removed VM entries"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
@@ -303,7 +311,7 @@ def cleanup_stopped_vms(db: Session = Depends(get_db), current_user: User = Depe
 # ═══════════════════════════════════════════════════════════════
 
 @router.post("/pause/{lab_id}")
-def pause_vm(lab_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def pause_vm(lab_id: str, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """
     Pause VM to save resources
     Paused VMs use 0% CPU (frozen state)
@@ -329,7 +337,7 @@ def pause_vm(lab_id: str, db: Session = Depends(get_db), current_user: User = De
     }
 
 @router.post("/resume/{lab_id}")
-def resume_vm(lab_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def resume_vm(lab_id: str, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Resume a paused VM"""
     vm_state = get_vm_state(current_user.id, lab_id)
 
@@ -356,7 +364,7 @@ def resume_vm(lab_id: str, db: Session = Depends(get_db), current_user: User = D
     }
 
 @router.get("/stats/{lab_id}")
-def get_vm_stats(lab_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_vm_stats(lab_id: str, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Get VM resource usage statistics"""
     vm_state = get_vm_state(current_user.id, lab_id)
 
@@ -373,7 +381,7 @@ def get_vm_stats(lab_id: str, db: Session = Depends(get_db), current_user: User
     return stats
 
 @router.post("/activity/{lab_id}")
-def record_vm_activity(lab_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def record_vm_activity(lab_id: str, db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Record user activity (called by frontend on VNC interaction)"""
     vm_state = get_vm_state(current_user.id, lab_id)
 
@@ -386,7 +394,7 @@ def record_vm_activity(lab_id: str, db: Session = Depends(get_db), current_user:
     return {"status": "activity_recorded"}
 
 @router.get("/admin/all-vms")
-def list_all_vms(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def list_all_vms(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Admin: List all VMs across all users"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
@@ -399,7 +407,7 @@ def list_all_vms(db: Session = Depends(get_db), current_user: User = Depends(get
     }
 
 @router.post("/admin/optimize")
-def optimize_resources(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def optimize_resources(db: Session = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     """Admin: Run resource optimization (pause idle VMs)"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
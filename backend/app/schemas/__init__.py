@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, computed_field
 from typing import Optional, List
 from datetime import datetime
+from ..utils.image_variants import image_variants
 
 class UserCreate(BaseModel):
     username: str
@@ -21,6 +22,11 @@ class UserResponse(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    expires_in: Optional[int] = None  # Access token lifetime in seconds
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -29,12 +35,20 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
 class ProgressUpdate(BaseModel):
     lab_id: str
     current_step: int
     completed: Optional[bool] = False
     flag_submitted: Optional[str] = None
 
+class ProgressBatchUpdate(BaseModel):
+    # Offline progress synced in one call; several updates per lab are merged
+    updates: List[ProgressUpdate]
+
 class ProgressResponse(BaseModel):
     lab_id: str
     current_step: int
@@ -62,6 +76,12 @@ class CourseResponse(BaseModel):
     semester_level: int
     is_active: bool
 
+    @computed_field
+    @property
+    def image_variants(self) -> Optional[dict]:
+        # Resized WebP/AVIF URLs for uploaded images (served and generated under /uploads/variants/)
+        return image_variants(self.image_url)
+
 class CourseLabCreate(BaseModel):
     course_id: int
     lab_id: str
@@ -111,6 +131,11 @@ class QuizResultResponse(BaseModel):
     category: str
 
 # Enrollment schemas
+class ContentProgressHeartbeat(BaseModel):
+    seconds: int = 0  # watched/read since the previous heartbeat
+    progress_percent: Optional[int] = None  # current position, 0-100
+    completed: bool = False
+
 class EnrollmentCreate(BaseModel):
     course_id: int
 
@@ -1,42 +1,182 @@
+import uuid
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from ..config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from ..database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, BCRYPT_ROUNDS, METRICS_TOKEN
+from ..database import get_db, get_async_db
 from ..models import User
+from .principal_cache import UserPrincipal, principal_cache
+from .refresh_tokens import session_version
+from .password_service import bcrypt_hash, bcrypt_verify
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+# Blocking helpers for scripts (init_database.py); request handlers use password_service
 def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return bcrypt_verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt_hash(password, BCRYPT_ROUNDS)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire, "iat": now, "typ": "access", "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def create_user_access_token(user) -> str:
+    """Access token carrying every claim handlers need, so requests need no lookup"""
+    principal = user if isinstance(user, UserPrincipal) else UserPrincipal.from_user(user)
+    return create_access_token(data={
+        "sub": principal.username,
+        "uid": principal.id,
+        "role": principal.role,
+        "email": principal.email,
+        "semester": principal.semester,
+        "department": principal.department,
+        "quiz_completed": principal.quiz_completed,
+        "sv": session_version(principal.id) or 0
+    })
+
+def credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_access_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
+        raise credentials_exception()
+    if payload.get("sub") is None or payload.get("typ", "access") != "access":
+        raise credentials_exception()
+    return payload
+
+def principal_from_claims(payload: dict) -> Optional[UserPrincipal]:
+    """Build the principal from token claims; tokens issued before claims were added return None"""
+    if "role" not in payload or payload.get("uid") is None:
+        return None
+    return UserPrincipal(
+        id=payload["uid"],
+        username=payload["sub"],
+        email=payload.get("email"),
+        semester=payload.get("semester"),
+        department=payload.get("department"),
+        role=payload["role"],
+        quiz_completed=bool(payload.get("quiz_completed"))
+    )
+
+def _cached_principal(username: str, user_id: Optional[int]) -> Optional[UserPrincipal]:
+    if user_id is None:
+        return None
+    principal = principal_cache.get(user_id)
+    if principal and principal.username == username:
+        return principal
+    return None
+
+def _load_principal(payload: dict, db: Session) -> UserPrincipal:
+    username, user_id = payload["sub"], payload.get("uid")
+    principal = _cached_principal(username, user_id)
+    if principal:
+        return principal
+
+    version = principal_cache.current_version(user_id) if user_id is not None else None
+    if user_id is not None:
+        user = db.get(User, user_id)
+    else:
+        user = db.query(User).filter(User.username == username).first()
+    if user is None or user.username != username:
+        raise credentials_exception()
+    if version is None:
+        version = principal_cache.current_version(user.id)
+    return principal_cache.put(user, version)
+
+async def _load_principal_async(payload: dict, db: AsyncSession) -> UserPrincipal:
+    username, user_id = payload["sub"], payload.get("uid")
+    principal = _cached_principal(username, user_id)
+    if principal:
+        return principal
+
+    version = principal_cache.current_version(user_id) if user_id is not None else None
+    if user_id is not None:
+        user = await db.get(User, user_id)
+    else:
+        user = await db.scalar(select(User).where(User.username == username))
+    if user is None or user.username != username:
+        raise credentials_exception()
+    if version is None:
+        version = principal_cache.current_version(user.id)
+    return principal_cache.put(user, version)
+
+def _session_revoked(payload: dict) -> Optional[bool]:
+    """Whether the user's sessions were revoked after the token was issued; None without Redis"""
+    current = session_version(payload["uid"])
+    if current is None:
+        return None
+    return payload.get("sv", 0) != current
+
+def _confirmed_principal(principal: UserPrincipal, user: Optional[User]) -> UserPrincipal:
+    if user is None or user.username != principal.username:
+        raise credentials_exception()
+    return UserPrincipal.from_user(user)
+
+# Access tokens are short-lived, so most requests are authorized from the claims alone,
+# plus one Redis GET that rejects tokens of users whose sessions were revoked (role change,
+# password change, deletion). Other claims can lag the database by up to
+# ACCESS_TOKEN_EXPIRE_MINUTES; refresh picks up changes. Without Redis revocations cannot
+# be seen, so admin claims are confirmed in the database instead (fail closed).
+# Tokens issued before claims were added are always loaded from the database.
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> UserPrincipal:
+    payload = decode_access_token(token)
+    principal = principal_from_claims(payload)
+    if principal is None:
+        return _load_principal(payload, db)
+    revoked = _session_revoked(payload)
+    if revoked:
+        raise credentials_exception()
+    if revoked is None and principal.role == "admin":
+        return _confirmed_principal(principal, db.get(User, principal.id))
+    return principal
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> UserPrincipal:
+    """Async variant for routes that use the async session"""
+    payload = decode_access_token(token)
+    principal = principal_from_claims(payload)
+    if principal is None:
+        return await _load_principal_async(payload, db)
+    revoked = _session_revoked(payload)
+    if revoked:
+        raise credentials_exception()
+    if revoked is None and principal.role == "admin":
+        return _confirmed_principal(principal, await db.get(User, principal.id))
+    return principal
+
+async def get_current_user_fresh(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> UserPrincipal:
+    """Current database state via the principal cache, for views that must not show stale claims"""
+    payload = decode_access_token(token)
+    if payload.get("uid") is not None and _session_revoked(payload):
+        raise credentials_exception()
+    return await _load_principal_async(payload, db)
+
+def get_current_db_user(principal: UserPrincipal = Depends(get_current_user), db: Session = Depends(get_db)) -> User:
+    """Managed ORM user, for handlers that modify the user or need secret columns"""
+    user = db.get(User, principal.id)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
+
+def require_metrics_access(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Monitoring endpoints: the METRICS_TOKEN scrape token or an admin access token"""
+    if METRICS_TOKEN and secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return
+    if get_current_user(token, db).role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
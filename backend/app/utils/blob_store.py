@@ -0,0 +1,257 @@
+"""
+Blob Store
+Reference counting and garbage collection for the content-addressed media
+files written by uploads.py.
+
+A blob's references are the rows whose URL columns (REFERENCE_COLUMNS)
+point at it, so the count can never drift from the data: the same video
+attached to five courses is one file with five references. Deleting
+content, resources, modules or courses releases their files; a file is
+removed once nothing references it. Blobs refreshed by an upload within
+MEDIA_BLOB_GRACE_HOURS are kept, because that upload's row may not be
+committed yet; the scheduler's media GC job collects them later.
+
+A dedupe upload can find a blob and refresh its mtime while the GC is
+deciding to remove it. The GC therefore renames the blob to a
+<name>.gc-<uuid> tombstone first (find_blob no longer sees it, so new
+uploads store a fresh copy) and checks grace and references again before
+unlinking; if either changed, the blob is put back.
+
+Files from before the blob store (/uploads/videos/<uuid>.mp4, ...) are
+deleted as soon as they are unreferenced, as they always were. HLS
+rendition directories (media_processing.py) are keyed by their source's
+hash and collected as a unit once no playlist or MP4 in them is referenced.
+Image variants (image_variants.py) go with their source image.
+"""
+import os
+import time
+import uuid
+import shutil
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+from ..models import Course, CourseContent, CourseModule, CourseResource, LabFile
+from .uploads import BLOB_DIR, TOMBSTONE_MARKER, is_blob_url, upload_path
+from .media_processing import HLS_DIR, HLS_URL_PREFIX
+from .image_variants import orphaned_variants, variant_paths
+
+logger = logging.getLogger(__name__)
+
+MEDIA_BLOB_GRACE_HOURS = float(os.getenv("MEDIA_BLOB_GRACE_HOURS", "24"))
+
+# Files a content item owns (released when it is deleted)
+CONTENT_MEDIA_COLUMNS = [
+    CourseContent.file_url,
+    CourseContent.video_thumbnail,
+    CourseContent.video_poster,
+    CourseContent.hls_url,
+    CourseContent.mp4_url,
+]
+
+# Every column that can hold an /uploads/ URL
+REFERENCE_COLUMNS = CONTENT_MEDIA_COLUMNS + [
+    CourseResource.file_url,
+    Course.image_url,
+    LabFile.file_url,
+]
+
+
+def _references(urls: Optional[List[str]] = None):
+    """One row per reference: (url,)"""
+    selects = []
+    for column in REFERENCE_COLUMNS:
+        stmt = select(column.label("url")).where(column.isnot(None))
+        if urls is not None:
+            stmt = stmt.where(column.in_(urls))
+        selects.append(stmt)
+    return union_all(*selects).subquery()
+
+
+def reference_counts(db: Session, urls: Iterable[str]) -> Dict[str, int]:
+    """{url: number of rows referencing it} (0 for unreferenced URLs)"""
+    urls = list({url for url in urls if url})
+    if not urls:
+        return {}
+    refs = _references(urls)
+    counts = dict(db.execute(select(refs.c.url, func.count()).group_by(refs.c.url)).all())
+    return {url: counts.get(url, 0) for url in urls}
+
+
+def content_media_urls(content: CourseContent) -> List[Optional[str]]:
+    return [getattr(content, column.key) for column in CONTENT_MEDIA_COLUMNS]
+
+
+def course_media_urls(db: Session, course: Course) -> List[Optional[str]]:
+    """Files a course owns: its image plus its modules' content and its resources"""
+    urls = [course.image_url]
+    urls += [url for row in db.query(*CONTENT_MEDIA_COLUMNS)
+             .join(CourseModule).filter(CourseModule.course_id == course.id) for url in row]
+    urls += [url for (url,) in db.query(CourseResource.file_url).filter(CourseResource.course_id == course.id)]
+    return urls
+
+
+def referenced_urls(db: Session) -> set:
+    refs = _references()
+    return set(db.execute(select(refs.c.url).distinct()).scalars())
+
+
+def _remove(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _remove_tree(path: str) -> int:
+    size = sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
+    shutil.rmtree(path, ignore_errors=True)
+    return size
+
+
+def _rendition_dir(url: str) -> str:
+    """/uploads/hls/<sha>/master.m3u8 -> <UPLOAD_DIR>/hls/<sha>"""
+    return os.path.join(HLS_DIR, url[len(HLS_URL_PREFIX):].split("/", 1)[0])
+
+
+def _in_grace(path: str, now: float) -> bool:
+    try:
+        return now - os.path.getmtime(path) < MEDIA_BLOB_GRACE_HOURS * 3600
+    except FileNotFoundError:
+        return False
+
+
+def _collect_blob(db: Session, url: str, path: str) -> Optional[int]:
+    """
+    Remove an unreferenced blob; returns the bytes freed, or None when it is
+    gone already or was refreshed or referenced meanwhile (and restored).
+    """
+    tombstone = f"{path}{TOMBSTONE_MARKER}{uuid.uuid4().hex}"
+    try:
+        os.rename(path, tombstone)
+    except FileNotFoundError:
+        return None
+    # An upload that found the blob before the rename has refreshed its mtime by now
+    if _in_grace(tombstone, time.time()) or reference_counts(db, [url]).get(url):
+        os.replace(tombstone, path)
+        return None
+    return _remove(tombstone)
+
+
+def _stale_tombstone(path: str, now: float) -> bool:
+    """Tombstone left by a GC run that died between the rename and the unlink"""
+    try:
+        return now - os.stat(path).st_ctime > MEDIA_BLOB_GRACE_HOURS * 3600
+    except FileNotFoundError:
+        return False
+
+
+def release_files(db: Session, urls: Iterable[Optional[str]]) -> int:
+    """
+    Call after committing a delete: removes each released file nobody else
+    references. Returns the number of files removed.
+    """
+    uploaded = [url for url in urls if url and url.startswith("/uploads/")]
+    removed = 0
+    now = time.time()
+    counts = reference_counts(db, uploaded)
+    for url, count in counts.items():
+        if count:
+            continue
+        if url.startswith(HLS_URL_PREFIX):
+            directory = _rendition_dir(url)
+            # The playlist and the MP4 share a directory; keep it while either is referenced
+            if referenced_urls_in(db, directory) or _in_grace(directory, now) or not os.path.isdir(directory):
+                continue
+            _remove_tree(directory)
+            removed += 1
+            logger.info(f"🗑️ Removed unreferenced renditions {directory}")
+            continue
+        path = upload_path(url)
+        if is_blob_url(url):
+            if _in_grace(path, now) or _collect_blob(db, url, path) is None:
+                continue
+        elif not _remove(path):
+            continue
+        removed += 1
+        logger.info(f"🗑️ Removed unreferenced media {url}")
+        for variant in variant_paths(url):
+            _remove(variant)
+    return removed
+
+
+def referenced_urls_in(db: Session, directory: str) -> List[str]:
+    """Referenced URLs inside a rendition directory"""
+    prefix = f"{HLS_URL_PREFIX}{os.path.basename(directory)}/"
+    refs = _references()
+    return list(db.execute(select(refs.c.url).where(refs.c.url.startswith(prefix)).distinct()).scalars())
+
+
+def collect_unreferenced_blobs(db: Session, fence: Optional[Callable[[], None]] = None) -> dict:
+    """Remove blobs no row references that were not stored within the grace period"""
+    referenced = referenced_urls(db)
+    now = time.time()
+    blobs, removed, freed = 0, 0, 0
+    for shard in os.scandir(BLOB_DIR):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if TOMBSTONE_MARKER in entry.name:
+                if _stale_tombstone(entry.path, now):
+                    freed += _remove(entry.path)
+                continue
+            blobs += 1
+            url = f"/uploads/blobs/{shard.name}/{entry.name}"
+            if url in referenced or _in_grace(entry.path, now):
+                continue
+            if fence:
+                fence()
+            collected = _collect_blob(db, url, entry.path)
+            if collected is None:
+                continue
+            freed += collected
+            removed += 1
+
+    # Rendition directories (and work directories left by killed transcodes)
+    referenced_dirs = {url[len(HLS_URL_PREFIX):].split("/", 1)[0] for url in referenced if url.startswith(HLS_URL_PREFIX)}
+    for entry in os.scandir(HLS_DIR):
+        if entry.name in referenced_dirs or _in_grace(entry.path, now):
+            continue
+        if fence:
+            fence()
+        freed += _remove_tree(entry.path) if entry.is_dir() else _remove(entry.path)
+        removed += 1
+
+    # Image variants whose source is gone (and temp files of interrupted resizes)
+    for path in orphaned_variants():
+        if _in_grace(path, now):
+            continue
+        if fence:
+            fence()
+        freed += _remove(path)
+        removed += 1
+    return {"blobs": blobs, "removed": removed, "freed_bytes": freed}
+
+
+def blob_stats(db: Session) -> dict:
+    """Disk used by blobs against the bytes the references would take without sharing"""
+    referenced = reference_counts(db, [url for url in referenced_urls(db) if is_blob_url(url)])
+    stored_bytes, logical_bytes = 0, 0
+    for url, count in referenced.items():
+        try:
+            size = os.path.getsize(upload_path(url))
+        except FileNotFoundError:
+            continue
+        stored_bytes += size
+        logical_bytes += size * count
+    return {
+        "referenced_blobs": len(referenced),
+        "references": sum(referenced.values()),
+        "stored_bytes": stored_bytes,
+        "saved_bytes": logical_bytes - stored_bytes
+    }
+
@@ -0,0 +1,202 @@
+"""
+Dashboard Summary
+Materialized numbers for /api/dashboard/stats, so a dashboard load (every
+login) is one primary-key read instead of a query per figure.
+
+- user_dashboard_summaries holds one row per user: enrolled courses,
+  completed labs, labs of enrolled courses and quiz scores (the input of
+  the course recommendations)
+- the write paths refresh only the fields they change, in their own
+  transaction: enrolling, completing a lab, submitting a quiz, assigning
+  labs to a course, deleting courses, labs or quizzes. Counts are set
+  from a correlated COUNT over the user's rows rather than incremented,
+  so concurrent writes and retries cannot make them drift
+- a missing row (new users, or rows removed for repair) is built on the
+  first dashboard load; rebuild_dashboard_summaries() rebuilds any or
+  all rows (migrations/rebuild_dashboard_summaries.py,
+  POST /api/admin/dashboard-summaries/rebuild)
+
+The course catalog part of the dashboard (active course count and the
+courses recommendations are picked from) is the same for everyone and is
+cached in Redis for DASHBOARD_CATALOG_TTL seconds; course writes drop it.
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Union
+from sqlalchemy import bindparam, exists, func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from ..database import SessionLocal, upsert_insert
+from ..models.user import User, Course, Enrollment, CourseLab, UserQuizResult, Quiz, UserDashboardSummary
+from ..models.progress import LabProgress
+from .redis_client import redis_client
+
+DASHBOARD_CATALOG_KEY = "dashboard:catalog"
+DASHBOARD_CATALOG_TTL = int(os.getenv("DASHBOARD_CATALOG_TTL", "300"))
+RECOMMENDED_COURSES = 3
+
+COUNT_FIELDS = ("enrolled_courses", "completed_labs", "total_labs")
+ALL_FIELDS = COUNT_FIELDS + ("quiz_scores",)
+
+UserIds = Union[Iterable[int], Select, None]
+
+summary = UserDashboardSummary.__table__
+
+
+def _count_expressions() -> Dict[str, object]:
+    """Each count field as a COUNT correlated to the summary row's user"""
+    user_id = summary.c.user_id
+    return {
+        "enrolled_courses": select(func.count(Enrollment.id))
+            .where(Enrollment.user_id == user_id).scalar_subquery(),
+        "completed_labs": select(func.count(LabProgress.id))
+            .where(LabProgress.user_id == user_id, LabProgress.completed == True).scalar_subquery(),
+        "total_labs": select(func.count(CourseLab.id))
+            .join(Enrollment, Enrollment.course_id == CourseLab.course_id)
+            .where(Enrollment.user_id == user_id).scalar_subquery(),
+    }
+
+
+def _restrict(stmt, column, user_ids: UserIds):
+    if user_ids is None:
+        return stmt
+    if not isinstance(user_ids, Select):
+        user_ids = list(user_ids)
+    return stmt.where(column.in_(user_ids))
+
+
+def _quiz_scores(db: Session, user_ids: UserIds) -> Dict[int, List[dict]]:
+    rows = db.execute(_restrict(
+        select(UserQuizResult, Quiz.category).outerjoin(Quiz, Quiz.id == UserQuizResult.quiz_id),
+        UserQuizResult.user_id, user_ids
+    ).order_by(UserQuizResult.id)).all()
+    scores: Dict[int, List[dict]] = {}
+    for result, category in rows:
+        scores.setdefault(result.user_id, []).append({
+            "quiz_id": result.quiz_id,
+            "category": category or "Unknown",
+            "score": result.score,
+            "max_score": result.max_score,
+            "percentage": result.percentage
+        })
+    return scores
+
+
+def refresh_dashboard_summaries(db: Session, fields: Iterable[str], user_ids: UserIds = None):
+    """
+    Recompute `fields` of the summaries of `user_ids` (a list, a SELECT of
+    user ids, or None for every row) inside the caller's transaction.
+    Users without a summary row are skipped; it is built on their next load.
+    """
+    fields = set(fields)
+    if user_ids is not None and not isinstance(user_ids, Select):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+    # The caller's pending rows must be visible to the counts
+    db.flush()
+
+    counts = {name: expr for name, expr in _count_expressions().items() if name in fields}
+    if counts:
+        db.execute(_restrict(update(summary), summary.c.user_id, user_ids).values(**counts))
+
+    if "quiz_scores" in fields:
+        stored = db.execute(_restrict(select(summary.c.user_id), summary.c.user_id, user_ids)).scalars().all()
+        if stored:
+            scores = _quiz_scores(db, stored)
+            db.execute(
+                update(summary).where(summary.c.user_id == bindparam("uid")).values(quiz_scores=bindparam("scores")),
+                [{"uid": user_id, "scores": scores.get(user_id, [])} for user_id in stored]
+            )
+
+
+def enrolled_user_ids(course_id: int) -> Select:
+    """Users whose total_labs depends on the course's labs"""
+    return select(Enrollment.user_id).where(Enrollment.course_id == course_id)
+
+
+def lab_user_ids(db: Session, lab_id: str) -> List[int]:
+    """Users whose counts include the lab (read before deleting it)"""
+    return list(db.execute(
+        select(LabProgress.user_id).where(LabProgress.lab_id == lab_id)
+        .union(select(Enrollment.user_id).join(CourseLab, CourseLab.course_id == Enrollment.course_id)
+               .where(CourseLab.lab_id == lab_id))
+    ).scalars())
+
+
+def rebuild_dashboard_summaries(db: Session, user_ids: UserIds = None) -> int:
+    """Create missing rows and recompute every field; None rebuilds all users. Commits."""
+    if user_ids is not None and not isinstance(user_ids, Select):
+        user_ids = list(user_ids)
+    missing = select(User.id).where(~exists().where(summary.c.user_id == User.id))
+    insert = upsert_insert(db)(summary).from_select(["user_id"], _restrict(missing, User.id, user_ids))
+    db.execute(insert.on_conflict_do_nothing(index_elements=[summary.c.user_id]))
+    if user_ids is None:
+        # Rows of users deleted where the foreign key did not cascade
+        db.execute(summary.delete().where(~exists().where(User.id == summary.c.user_id)))
+    refresh_dashboard_summaries(db, ALL_FIELDS, user_ids)
+    db.commit()
+    return db.execute(_restrict(select(func.count()).select_from(summary), summary.c.user_id, user_ids)).scalar()
+
+
+def build_dashboard_summary(user_id: int) -> Optional[dict]:
+    """Build (or repair) one user's row on the primary and return it"""
+    db = SessionLocal()
+    try:
+        rebuild_dashboard_summaries(db, [user_id])
+        row = db.execute(select(summary).where(summary.c.user_id == user_id)).mappings().first()
+        return dict(row) if row else None
+    finally:
+        db.close()
+
+
+def course_summary(course: Course) -> dict:
+    return {
+        "id": course.id,
+        "title": course.title,
+        "description": course.description,
+        "category": course.category,
+        "difficulty": course.difficulty,
+        "duration": course.duration
+    }
+
+
+def catalog_from_courses(courses: Iterable[Course]) -> dict:
+    """Active course count plus the first courses per category and of beginner level"""
+    by_category: Dict[str, List[dict]] = {}
+    beginner: List[dict] = []
+    total = 0
+    for course in courses:
+        total += 1
+        entry = course_summary(course)
+        if course.category is not None:
+            in_category = by_category.setdefault(course.category, [])
+            if len(in_category) < RECOMMENDED_COURSES:
+                in_category.append(entry)
+        if course.difficulty == "Beginner" and len(beginner) < RECOMMENDED_COURSES:
+            beginner.append(entry)
+    return {"total_courses": total, "by_category": by_category, "beginner": beginner}
+
+
+async def get_dashboard_catalog(db: AsyncSession) -> dict:
+    cached = redis_client.get_json(DASHBOARD_CATALOG_KEY)
+    if cached is not None:
+        return cached
+    courses = await db.execute(select(Course).where(Course.is_active == True).order_by(Course.id))
+    catalog = catalog_from_courses(courses.scalars())
+    redis_client.set_json(DASHBOARD_CATALOG_KEY, catalog, ttl=DASHBOARD_CATALOG_TTL)
+    return catalog
+
+
+def invalidate_dashboard_catalog():
+    """Call after courses are created, changed or deleted"""
+    redis_client.delete(DASHBOARD_CATALOG_KEY)
+
+
+def recommended_courses(catalog: dict, quiz_scores: List[dict]) -> List[dict]:
+    """Courses in the categories scored >= 60%; beginner courses without any"""
+    strong_categories = {qs["category"] for qs in quiz_scores if qs["percentage"] >= 60}
+    if not strong_categories:
+        return catalog["beginner"]
+    candidates = [course for category in strong_categories for course in catalog["by_category"].get(category, [])]
+    return sorted(candidates, key=lambda course: course["id"])[:RECOMMENDED_COURSES]
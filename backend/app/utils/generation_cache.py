@@ -0,0 +1,119 @@
+"""
+Generation Cache
+Caches Mistral question generations in Redis so repeated requests for the
+same category and difficulty (admin preview/regenerate clicks, placement
+top-ups) do not wait on the model every time.
+
+Each cache key is a hash of the normalized prompt inputs and holds a pool
+of up to GENERATION_CACHE_POOL_SIZE questions. A request samples from the
+pool; with probability GENERATION_CACHE_FRESH_RATE (or when the pool is too
+small) it generates instead, and the new questions join the pool. Questions
+whose word-bigram shingles (question text plus options, so a shared stem such as
+"What is the purpose of ..." alone does not match) overlap an existing
+question by at least GENERATION_DEDUP_THRESHOLD (Jaccard) are rejected as
+near-duplicates.
+"""
+import os
+import re
+import json
+import random
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+from prometheus_client import Counter
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+GENERATION_CACHE_ENABLED = os.getenv("GENERATION_CACHE_ENABLED", "true").lower() == "true"
+GENERATION_CACHE_TTL = int(os.getenv("GENERATION_CACHE_TTL", "86400"))
+GENERATION_CACHE_POOL_SIZE = int(os.getenv("GENERATION_CACHE_POOL_SIZE", "40"))
+GENERATION_CACHE_FRESH_RATE = float(os.getenv("GENERATION_CACHE_FRESH_RATE", "0.2"))
+GENERATION_DEDUP_THRESHOLD = float(os.getenv("GENERATION_DEDUP_THRESHOLD", "0.6"))
+
+CACHE_KEY_PREFIX = "mistral:generation:"
+SHINGLE_SIZE = 2
+
+GENERATION_CACHE_REQUESTS = Counter(
+    "mistral_generation_cache_total", "Question generation cache lookups", ["result"]
+)
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def shingles(question: Dict) -> Set[str]:
+    """Word bigrams of the normalized question and options (the words themselves for very short text)"""
+    text = " ".join(str(question.get(key) or "") for key in ("question", "option_a", "option_b", "option_c", "option_d"))
+    words = normalize_question(text).split()
+    if len(words) < SHINGLE_SIZE:
+        return set(words)
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def is_near_duplicate(question: Dict, existing: Iterable[Set[str]],
+                      threshold: float = GENERATION_DEDUP_THRESHOLD) -> bool:
+    candidate = shingles(question)
+    return any(jaccard(candidate, other) >= threshold for other in existing)
+
+
+def dedupe_questions(questions: List[Dict], existing: Optional[List[Dict]] = None) -> List[Dict]:
+    """Questions that are not near-duplicates of each other or of `existing`"""
+    seen = [shingles(q) for q in existing or []]
+    unique = []
+    for q in questions:
+        candidate = shingles(q)
+        if any(jaccard(candidate, other) >= GENERATION_DEDUP_THRESHOLD for other in seen):
+            continue
+        seen.append(candidate)
+        unique.append(q)
+    return unique
+
+
+def cache_key(prompt_template: str, model: str, category: str, difficulty: str) -> str:
+    """Same key for prompts that differ only in case, spacing or punctuation"""
+    material = json.dumps([
+        normalize_question(prompt_template), model, normalize_question(category), normalize_question(difficulty)
+    ])
+    return CACHE_KEY_PREFIX + hashlib.sha256(material.encode()).hexdigest()
+
+
+class GenerationCache:
+
+    def sample(self, key: str, num_questions: int) -> Optional[List[Dict]]:
+        """num_questions random pooled questions, or None when the caller should generate"""
+        if not GENERATION_CACHE_ENABLED:
+            return None
+        pool = (redis_client.get_json(key) or {}).get("questions", [])
+        if len(pool) < num_questions * 2:
+            # Too little variety to sample from yet
+            GENERATION_CACHE_REQUESTS.labels("miss").inc()
+            return None
+        if random.random() < GENERATION_CACHE_FRESH_RATE:
+            GENERATION_CACHE_REQUESTS.labels("refresh").inc()
+            return None
+        GENERATION_CACHE_REQUESTS.labels("hit").inc()
+        return [dict(q) for q in random.sample(pool, num_questions)]
+
+    def add(self, key: str, questions: List[Dict]) -> List[Dict]:
+        """Pool the questions that are not near-duplicates; returns those new questions"""
+        if not GENERATION_CACHE_ENABLED or not questions:
+            return dedupe_questions(questions)
+        pool = (redis_client.get_json(key) or {}).get("questions", [])
+        fresh = dedupe_questions(questions, existing=pool)
+        if fresh:
+            # Newest first; the oldest questions age out of the pool
+            pool = (fresh + pool)[:GENERATION_CACHE_POOL_SIZE]
+            redis_client.set_json(key, {"questions": pool}, ttl=GENERATION_CACHE_TTL)
+        return fresh
+
+
+generation_cache = GenerationCache()
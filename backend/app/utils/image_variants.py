@@ -0,0 +1,196 @@
+"""
+Image Variants
+Resized copies of uploaded images (course images, image uploads) so pages
+load a few KB per picture instead of the full-size original:
+
+- variants are keyed by width in the URL and mirror the source path:
+  /uploads/variants/w640/blobs/ab/<sha256>.png.webp is the 640px WebP of
+  /uploads/blobs/ab/<sha256>.png (AVIF too when Pillow can write it)
+- image uploads generate every variant up front; images from before this
+  (or whose variants were removed) get theirs generated on first request
+  and cached on disk, so the URL scheme works for every image
+- variants of blobs are immutable like the blob itself; the blob GC
+  removes variants whose source is gone
+
+Only the widths in IMAGE_VARIANTS can be requested, so on-demand
+generation cannot be used to fill the disk with arbitrary sizes. Resizing
+runs on its own thread limiter (IMAGE_VARIANT_THREADS).
+"""
+import os
+import uuid
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+import anyio
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .uploads import UPLOAD_DIR, IMAGE_POLICY, extension_of
+
+logger = logging.getLogger(__name__)
+
+# Named sizes: the width each is scaled down to (never up)
+IMAGE_VARIANTS = {"thumb": 160, "card": 640, "full": 1600}
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+IMAGE_VARIANT_THREADS = int(os.getenv("IMAGE_VARIANT_THREADS", "2"))
+
+VARIANT_DIR = os.path.join(UPLOAD_DIR, "variants")
+VARIANT_URL_PREFIX = "/uploads/variants/"
+os.makedirs(VARIANT_DIR, exist_ok=True)
+
+# Sources variants can be made from (relative to UPLOAD_DIR)
+SOURCE_DIRS = ("blobs", "images")
+
+Image.init()
+# Preferred first; AVIF needs a Pillow build (or plugin) that can encode it
+VARIANT_FORMATS = [fmt for fmt in ("avif", "webp") if fmt.upper() in Image.SAVE]
+ALL_FORMATS = ("avif", "webp")
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+_limiter: Optional[anyio.CapacityLimiter] = None
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+def _get_limiter() -> anyio.CapacityLimiter:
+    # Created on first use: the limiter needs a running event loop
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(IMAGE_VARIANT_THREADS)
+    return _limiter
+
+
+def _source_relative(image_url: Optional[str]) -> Optional[str]:
+    """'blobs/ab/<sha>.png' for an uploaded image URL, else None (external URLs)"""
+    if not image_url or not image_url.startswith("/uploads/"):
+        return None
+    relative = image_url[len("/uploads/"):]
+    if relative.split("/", 1)[0] not in SOURCE_DIRS or extension_of(relative) not in IMAGE_POLICY.extensions:
+        return None
+    return relative
+
+
+def variant_url(image_url: str, width: int, fmt: str) -> str:
+    return f"{VARIANT_URL_PREFIX}w{width}/{_source_relative(image_url)}.{fmt}"
+
+
+def image_variants(image_url: Optional[str]) -> Optional[dict]:
+    """
+    URLs of an uploaded image's variants for API responses:
+    {"thumb": url, "card": url, "full": url, "srcset": {mime type: srcset}}
+    The named URLs are WebP; srcset lists every width per format for <picture>.
+    None for external images.
+    """
+    if _source_relative(image_url) is None or not VARIANT_FORMATS:
+        return None
+    fallback = "webp" if "webp" in VARIANT_FORMATS else VARIANT_FORMATS[0]
+    variants = {name: variant_url(image_url, width, fallback) for name, width in IMAGE_VARIANTS.items()}
+    variants["srcset"] = {
+        MIME_TYPES[fmt]: ", ".join(f"{variant_url(image_url, width, fmt)} {width}w" for width in IMAGE_VARIANTS.values())
+        for fmt in VARIANT_FORMATS
+    }
+    return variants
+
+
+def parse_variant_path(relative_path: str) -> Optional[Tuple[int, str, str]]:
+    """'variants/w640/blobs/ab/<sha>.png.webp' -> (640, 'blobs/ab/<sha>.png', 'webp'), or None"""
+    parts = [p for p in relative_path.split("/") if p]
+    if len(parts) < 4 or parts[0] != "variants" or not parts[1].startswith("w"):
+        return None
+    width = int(parts[1][1:]) if parts[1][1:].isdigit() else 0
+    source, _, fmt = "/".join(parts[2:]).rpartition(".")
+    if width not in IMAGE_VARIANTS.values() or fmt not in VARIANT_FORMATS:
+        return None
+    if _source_relative(f"/uploads/{source}") is None or ".." in source.split("/"):
+        return None
+    return width, source, fmt
+
+
+def render_variant(source_path: str, width: int, fmt: str, dest_path: str):
+    """Scale the source down to `width` and write it atomically as `fmt`"""
+    with Image.open(source_path) as image:
+        # Animated GIFs become their first frame
+        image.seek(0)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        if image.width > width:
+            image = image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        temp = f"{dest_path}.tmp-{uuid.uuid4().hex}"
+        try:
+            image.save(temp, fmt.upper(), quality=IMAGE_VARIANT_QUALITY)
+            os.replace(temp, dest_path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+
+async def ensure_variant(relative_path: str) -> bool:
+    """
+    Generate a missing variant on demand. False when the path is not a valid
+    variant, the source does not exist or cannot be decoded.
+    """
+    parsed = parse_variant_path(relative_path)
+    if parsed is None:
+        return False
+    width, source, fmt = parsed
+    dest = os.path.join(VARIANT_DIR, f"w{width}", f"{source}.{fmt}")
+    if os.path.isfile(dest):
+        return True
+    source_path = os.path.join(UPLOAD_DIR, source)
+    if not os.path.isfile(source_path):
+        return False
+
+    # Concurrent requests for the same new variant share one resize
+    task = _inflight.get(dest)
+    if task is None:
+        task = asyncio.ensure_future(anyio.to_thread.run_sync(
+            render_variant, source_path, width, fmt, dest, limiter=_get_limiter()
+        ))
+        _inflight[dest] = task
+        task.add_done_callback(lambda _: _inflight.pop(dest, None))
+    try:
+        await asyncio.shield(task)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        logger.warning(f"⚠️ Could not generate image variant {relative_path}: {e}")
+        return False
+    return True
+
+
+async def generate_variants(image_url: str) -> Optional[dict]:
+    """Create every variant of a freshly uploaded image; returns image_variants()"""
+    source = _source_relative(image_url)
+    if source is None:
+        return None
+    for width in IMAGE_VARIANTS.values():
+        for fmt in VARIANT_FORMATS:
+            if not await ensure_variant(f"variants/w{width}/{source}.{fmt}"):
+                return None
+    return image_variants(image_url)
+
+
+def variant_paths(image_url: Optional[str]) -> List[str]:
+    """Existing variant files of an image (any width or format)"""
+    source = _source_relative(image_url)
+    if source is None:
+        return []
+    paths = []
+    for width in IMAGE_VARIANTS.values():
+        for fmt in ALL_FORMATS:
+            path = os.path.join(VARIANT_DIR, f"w{width}", f"{source}.{fmt}")
+            if os.path.isfile(path):
+                paths.append(path)
+    return paths
+
+
+def orphaned_variants() -> List[str]:
+    """Variant files whose source image no longer exists"""
+    orphans = []
+    for root, _, names in os.walk(VARIANT_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, VARIANT_DIR).split(os.sep)
+            # w<width>/<source path>.<fmt>
+            source = os.path.join(UPLOAD_DIR, *relative[1:]).rpartition(".")[0]
+            if ".tmp-" in name or not os.path.isfile(source):
+                orphans.append(path)
+    return orphans
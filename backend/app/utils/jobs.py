@@ -0,0 +1,119 @@
+"""
+Periodic Jobs
+Job functions registered with the scheduler at startup.
+"""
+import os
+import logging
+from ..database import SessionLocal, ReadSessionLocal, AsyncSessionLocal
+from .scheduler import Scheduler, JobContext
+from .vm_lifecycle import VMLifecycleManager
+from .leaderboard import warm_leaderboards, LEADERBOARD_CACHE_TTL
+from .question_bank import replenish
+from .resumable_uploads import collect_abandoned
+from .blob_store import collect_unreferenced_blobs
+from .media_processing import sweep as sweep_media_processing
+from .progress_buffer import flush as flush_progress, PROGRESS_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+VM_OPTIMIZER_INTERVAL = int(os.getenv("VM_OPTIMIZER_INTERVAL", "300"))
+VM_IDLE_THRESHOLD_MINUTES = int(os.getenv("VM_IDLE_THRESHOLD_MINUTES", "10"))
+# Refresh well before the cached copy expires
+LEADERBOARD_WARM_INTERVAL = int(os.getenv("LEADERBOARD_WARM_INTERVAL", str(max(LEADERBOARD_CACHE_TTL * 2 // 3, 30))))
+QUESTION_BANK_INTERVAL = int(os.getenv("QUESTION_BANK_INTERVAL", "300"))
+UPLOAD_GC_INTERVAL = int(os.getenv("UPLOAD_GC_INTERVAL", "3600"))
+MEDIA_GC_INTERVAL = int(os.getenv("MEDIA_GC_INTERVAL", "21600"))
+MEDIA_PROCESSING_SWEEP_INTERVAL = int(os.getenv("MEDIA_PROCESSING_SWEEP_INTERVAL", "60"))
+
+vm_lifecycle = VMLifecycleManager()
+
+
+def optimize_vms(ctx: JobContext) -> dict:
+    """Pause VMs idle for longer than VM_IDLE_THRESHOLD_MINUTES"""
+    result = vm_lifecycle.auto_pause_idle_vms(
+        idle_threshold_minutes=VM_IDLE_THRESHOLD_MINUTES,
+        fence=ctx.ensure_leader
+    )
+
+    paused = result.get('paused_count', 0)
+    stopped = result.get('stopped_count', 0)
+
+    if paused > 0 or stopped > 0:
+        logger.info(f"✅ Optimization complete: Paused {paused} VMs, Stopped {stopped} VMs")
+    else:
+        logger.debug("✓ All VMs are active or already optimized")
+    return result
+
+
+def warm_leaderboard_cache(ctx: JobContext) -> dict:
+    db = ReadSessionLocal()
+    try:
+        return warm_leaderboards(db)
+    finally:
+        db.close()
+
+
+async def replenish_question_bank(ctx: JobContext) -> dict:
+    """Top up question bank buckets below their target stock"""
+    async with AsyncSessionLocal() as db:
+        result = await replenish(db, fence=ctx.ensure_leader)
+    if result["added"]:
+        logger.info(f"📚 Question bank: added {result['added']} question(s) to {result['low_buckets']} low bucket(s)")
+    return result
+
+
+def collect_abandoned_uploads(ctx: JobContext) -> dict:
+    """Delete resumable uploads nobody has touched within the expiry window"""
+    result = collect_abandoned(fence=ctx.ensure_leader)
+    if result["removed_uploads"] or result["removed_parts"]:
+        logger.info(
+            f"🧹 Upload GC: removed {result['removed_uploads']} abandoned upload(s) and "
+            f"{result['removed_parts']} stray part file(s), freed {result['freed_bytes'] // (1024 * 1024)} MB"
+        )
+    return result
+
+
+def collect_media_blobs(ctx: JobContext) -> dict:
+    """Delete media blobs no content, resource, course or lab file references"""
+    # Primary, not the replica: a reference missed through lag would delete a live file
+    db = SessionLocal()
+    try:
+        result = collect_unreferenced_blobs(db, fence=ctx.ensure_leader)
+    finally:
+        db.close()
+    if result["removed"]:
+        logger.info(f"🧹 Media GC: removed {result['removed']} unreferenced blob(s), freed {result['freed_bytes'] // (1024 * 1024)} MB")
+    return result
+
+
+async def sweep_media_queue(ctx: JobContext) -> dict:
+    """Enqueue videos still waiting for processing and recover stuck ones"""
+    result = await sweep_media_processing(fence=ctx.ensure_leader)
+    if result.get("enqueued") or result.get("reset") or result.get("failed"):
+        logger.info(
+            f"🎬 Media queue: enqueued {result['enqueued']}, reset {result['reset']} stuck, "
+            f"gave up on {result['failed']}"
+        )
+    return result
+
+
+def flush_content_progress(ctx: JobContext) -> dict:
+    """Write buffered content progress heartbeats in batched upserts"""
+    db = SessionLocal()
+    try:
+        result = flush_progress(db, fence=ctx.ensure_leader)
+    finally:
+        db.close()
+    if result["flushed"]:
+        logger.debug(f"Progress flush: {result['flushed']} row(s) in {result['batches']} batch(es)")
+    return result
+
+
+def register_jobs(scheduler: Scheduler):
+    scheduler.add_job("vm_optimizer", optimize_vms, VM_OPTIMIZER_INTERVAL, initial_delay_seconds=60)
+    scheduler.add_job("leaderboard_warmer", warm_leaderboard_cache, LEADERBOARD_WARM_INTERVAL, initial_delay_seconds=5)
+    scheduler.add_job("question_bank_replenisher", replenish_question_bank, QUESTION_BANK_INTERVAL, initial_delay_seconds=30)
+    scheduler.add_job("upload_gc", collect_abandoned_uploads, UPLOAD_GC_INTERVAL, initial_delay_seconds=120)
+    scheduler.add_job("media_blob_gc", collect_media_blobs, MEDIA_GC_INTERVAL, initial_delay_seconds=300)
+    scheduler.add_job("media_processing_sweeper", sweep_media_queue, MEDIA_PROCESSING_SWEEP_INTERVAL, initial_delay_seconds=20)
+    scheduler.add_job("progress_flush", flush_content_progress, PROGRESS_FLUSH_INTERVAL, initial_delay_seconds=PROGRESS_FLUSH_INTERVAL)
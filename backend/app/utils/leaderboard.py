@@ -0,0 +1,121 @@
+"""
+Leaderboard Cache
+Builds the student ranking (/api/users/rank) and the dashboard top 10
+(/api/dashboard/leaderboard) with one grouped query per metric, and caches
+both in Redis. The scheduler's cache warmer rebuilds them before they
+expire, so requests almost never compute them inline.
+"""
+import os
+from typing import List
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..models import User
+from ..models.progress import LabProgress
+from ..models.user import UserQuizResult, CourseProgress, AssessmentQuizAttempt
+from ..models.assessment import UserAssessmentAttempt
+from .redis_client import redis_client
+
+RANKING_CACHE_KEY = "leaderboard:all"
+DASHBOARD_CACHE_KEY = "leaderboard:dashboard"
+LEADERBOARD_CACHE_TTL = int(os.getenv("LEADERBOARD_CACHE_TTL", "300"))
+
+
+def compute_student_scores(db: Session) -> List[dict]:
+    """
+    Score every student:
+    - Assessment: 40% of average assessment percentage
+    - Quiz: 30% of average quiz percentage
+    - Labs: 20 points per completed lab
+    - Courses: 50 points per passed course
+    """
+    students = db.query(User.id, User.username).filter(User.role == "student").order_by(User.id).all()
+
+    assessment_avg = dict(db.query(
+        UserAssessmentAttempt.user_id, func.avg(UserAssessmentAttempt.percentage)
+    ).group_by(UserAssessmentAttempt.user_id).all())
+    quiz_avg = dict(db.query(
+        UserQuizResult.user_id, func.avg(UserQuizResult.percentage)
+    ).group_by(UserQuizResult.user_id).all())
+    completed_labs = dict(db.query(
+        LabProgress.user_id, func.count(LabProgress.id)
+    ).filter(LabProgress.completed == True).group_by(LabProgress.user_id).all())
+    passed_courses = dict(db.query(
+        CourseProgress.user_id, func.count(CourseProgress.id)
+    ).filter(CourseProgress.passed == True).group_by(CourseProgress.user_id).all())
+    quiz_attempts = dict(db.query(
+        AssessmentQuizAttempt.user_id, func.count(AssessmentQuizAttempt.id)
+    ).filter(AssessmentQuizAttempt.completed_at.isnot(None)).group_by(AssessmentQuizAttempt.user_id).all())
+
+    user_scores = []
+    for user_id, username in students:
+        avg_assessment_score = float(assessment_avg.get(user_id) or 0)
+        avg_quiz_score = float(quiz_avg.get(user_id) or 0)
+        labs = completed_labs.get(user_id, 0)
+        courses = passed_courses.get(user_id, 0)
+
+        total_score = (
+            (avg_assessment_score * 0.4) +
+            (avg_quiz_score * 0.3) +
+            (labs * 20) +
+            (courses * 50)
+        )
+
+        user_scores.append({
+            "user_id": user_id,
+            "username": username,
+            "total_score": round(total_score, 2),
+            "assessment_score": round(avg_assessment_score, 2),
+            "quiz_score": round(avg_quiz_score, 2),
+            "completed_labs": labs,
+            "passed_courses": courses,
+            "quiz_attempts": quiz_attempts.get(user_id, 0)
+        })
+
+    user_scores.sort(key=lambda x: x["total_score"], reverse=True)
+    return user_scores
+
+
+def compute_dashboard_leaderboard(db: Session, limit: int = 10) -> List[dict]:
+    """Top users (any role) by completed labs"""
+    completed = func.count(LabProgress.id)
+    rows = db.query(User.username, User.department, completed).outerjoin(
+        LabProgress, (LabProgress.user_id == User.id) & (LabProgress.completed == True)
+    ).group_by(User.id, User.username, User.department).order_by(completed.desc(), User.id).limit(limit).all()
+
+    return [
+        {"username": username, "completed_labs": count, "department": department}
+        for username, department, count in rows
+    ]
+
+
+def get_student_ranking(db: Session) -> dict:
+    cached = redis_client.get_json(RANKING_CACHE_KEY)
+    if cached:
+        return cached
+    user_scores = compute_student_scores(db)
+    ranking = {"total_students": len(user_scores), "all_students": user_scores}
+    redis_client.set_json(RANKING_CACHE_KEY, ranking, ttl=LEADERBOARD_CACHE_TTL)
+    return ranking
+
+
+def get_dashboard_leaderboard(db: Session) -> List[dict]:
+    cached = redis_client.get_json(DASHBOARD_CACHE_KEY)
+    if cached is not None:
+        return cached["top"]
+    top = compute_dashboard_leaderboard(db)
+    redis_client.set_json(DASHBOARD_CACHE_KEY, {"top": top}, ttl=LEADERBOARD_CACHE_TTL)
+    return top
+
+
+def warm_leaderboards(db: Session) -> dict:
+    """Recompute and store both leaderboards (called by the scheduler)"""
+    user_scores = compute_student_scores(db)
+    redis_client.set_json(RANKING_CACHE_KEY, {
+        "total_students": len(user_scores),
+        "all_students": user_scores
+    }, ttl=LEADERBOARD_CACHE_TTL)
+
+    top = compute_dashboard_leaderboard(db)
+    redis_client.set_json(DASHBOARD_CACHE_KEY, {"top": top}, ttl=LEADERBOARD_CACHE_TTL)
+
+    return {"students_ranked": len(user_scores), "dashboard_entries": len(top)}
@@ -0,0 +1,249 @@
+"""
+Resilient LLM Client
+Wraps the pooled HTTP client used for Mistral completions with:
+
+- a circuit breaker: after LLM_BREAKER_FAILURES consecutive failures calls
+  fail immediately (callers fall back to the question bank or the static
+  questions) until LLM_BREAKER_RESET_SECONDS pass and one probe succeeds;
+- retries with full-jitter exponential backoff for timeouts, connection
+  errors, 429 and 5xx, all within one LLM_LATENCY_BUDGET per call;
+- single-flight coalescing: identical payloads already in flight share
+  the one upstream request instead of each going upstream.
+
+Every failure surfaces as LLMUnavailableError.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Optional
+import httpx
+from .metrics import record_mistral, record_llm_call
+
+logger = logging.getLogger(__name__)
+
+LLM_LATENCY_BUDGET = float(os.getenv("LLM_LATENCY_BUDGET", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "5"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+try:
+    import h2  # noqa: F401  (installed by httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class LLMUnavailableError(Exception):
+    """The completion could not be obtained (upstream error, budget exhausted or circuit open)"""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """The breaker is open; the call was not attempted"""
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    if isinstance(error, httpx.HTTPStatusError):
+        try:
+            return float(error.response.headers.get("Retry-After", ""))
+        except ValueError:
+            return None
+    return None
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            # Let exactly one request test the upstream
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info("✅ LLM circuit closed")
+        self.consecutive_failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        reopen = self._probe_in_flight
+        self._probe_in_flight = False
+        if reopen or (self._opened_at is None and self.consecutive_failures >= self.failure_threshold):
+            if self._opened_at is None:
+                self.times_opened += 1
+                logger.warning(
+                    f"⚠️ LLM circuit opened after {self.consecutive_failures} failures; "
+                    f"failing fast for {self.reset_seconds:.0f}s"
+                )
+            self._opened_at = time.monotonic()
+
+
+class LLMClient:
+
+    def __init__(self, url: str, api_key: str = "", timeout: float = 30.0, max_concurrency: int = 4,
+                 latency_budget: float = LLM_LATENCY_BUDGET, max_retries: int = LLM_MAX_RETRIES,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.latency_budget = latency_budget
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._bound_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.requests = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.short_circuited = 0
+
+    # Connection pool (one per event loop)
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._bound_loop is not loop:
+            # Pooled connections, the semaphore and in-flight futures belong to the loop that created them
+            self._client, self._semaphore, self._inflight, self._bound_loop = None, None, {}, loop
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Shared client: keeps connections (and the HTTP/2 session) open between requests"""
+        self._bind_loop()
+        if self._client is None or self._client.is_closed:
+            headers = {"Content-Type": "application/json"}
+            if self.api_key:
+                headers["Authorization"] = f"Bearer {self.api_key}"
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(max_connections=self.max_concurrency * 2,
+                                    max_keepalive_connections=self.max_concurrency),
+                headers=headers
+            )
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # Calls
+
+    async def complete(self, payload: dict) -> dict:
+        """POST the payload and return the JSON response"""
+        self._bind_loop()
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            record_llm_call("coalesced")
+            return await asyncio.shield(inflight)
+
+        task = asyncio.ensure_future(self._call_with_retries(payload))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one cancelled caller does not cancel the request for the others
+        return await asyncio.shield(task)
+
+    async def _send(self, payload: dict, timeout: float) -> dict:
+        client = self.get_client()
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    self.url, json=payload, timeout=httpx.Timeout(timeout, connect=min(5.0, timeout))
+                )
+                response.raise_for_status()
+            except Exception:
+                record_mistral(time.perf_counter() - started, "error")
+                raise
+            record_mistral(time.perf_counter() - started, "success")
+        return response.json()
+
+    async def _call_with_retries(self, payload: dict) -> dict:
+        self.requests += 1
+        deadline = time.monotonic() + self.latency_budget
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.short_circuited += 1
+                record_llm_call("short_circuited")
+                raise CircuitOpenError("LLM circuit open")
+
+            remaining = deadline - time.monotonic()
+            try:
+                result = await self._send(payload, timeout=max(0.1, min(self.timeout, remaining)))
+            except Exception as e:
+                self.breaker.record_failure()
+                attempt += 1
+                delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+                delay = max(delay, _retry_after(e) or 0)
+                if (not _is_retryable(e) or attempt > self.max_retries
+                        or time.monotonic() + delay >= deadline):
+                    record_llm_call("failed")
+                    raise LLMUnavailableError(f"{type(e).__name__}: {e}") from e
+                self.retries += 1
+                record_llm_call("retried")
+                logger.info(f"Retrying LLM request in {delay:.2f}s (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            record_llm_call("success")
+            return result
+
+    def status(self) -> dict:
+        state = self.breaker.state
+        return {
+            "circuit_state": state,
+            "circuit_open": {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 0.5, CircuitBreaker.OPEN: 1}[state],
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "in_flight": len(self._inflight),
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "short_circuited": self.short_circuited,
+            "latency_budget_seconds": self.latency_budget
+        }
@@ -0,0 +1,239 @@
+"""
+Media Files
+Serving of uploaded media (lecture videos, documents, images) tuned for many
+concurrent streams:
+
+- byte ranges (single range, If-Range) so players can seek and resume
+- strong ETags (the sha256 for content-addressed blobs) with If-None-Match /
+  If-Modified-Since revalidation, and Cache-Control: immutable for blobs and
+  HLS renditions and image variants of blobs (named after the source's hash)
+- zero-copy: the ASGI "http.response.zerocopysend" extension is used when
+  the server offers it; otherwise the file is read in chunks on a dedicated
+  thread limiter (MEDIA_READ_THREADS) so video reads cannot exhaust the
+  threadpool that sync API endpoints run on
+- MEDIA_ACCEL_MODE=nginx (X-Accel-Redirect) or sendfile (X-Sendfile): the
+  app only checks the request and the front web server sends the bytes
+"""
+import os
+import stat
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import quote
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from .uploads import UPLOAD_DIR, BLOB_URL_PREFIX, TOMBSTONE_MARKER
+from .media_processing import HLS_URL_PREFIX
+from .image_variants import VARIANT_URL_PREFIX
+
+MEDIA_ACCEL_MODE = os.getenv("MEDIA_ACCEL_MODE", "").lower()  # "", nginx, sendfile
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/protected-uploads/")
+MEDIA_READ_THREADS = int(os.getenv("MEDIA_READ_THREADS", "8"))
+MEDIA_CACHE_MAX_AGE = int(os.getenv("MEDIA_CACHE_MAX_AGE", "86400"))
+CHUNK_SIZE = 256 * 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Never served: resumable upload state, in-progress temp files, transcode work directories
+# and blobs being garbage collected
+PRIVATE_DIRS = ("incoming",)
+PRIVATE_SUFFIXES = (".part", ".tmp", ".json")
+
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+_UPLOAD_ROOT = os.path.realpath(UPLOAD_DIR)
+_read_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def read_limiter() -> anyio.CapacityLimiter:
+    # Created on first use: the limiter needs a running event loop
+    global _read_limiter
+    if _read_limiter is None:
+        _read_limiter = anyio.CapacityLimiter(MEDIA_READ_THREADS)
+    return _read_limiter
+
+
+def resolve_media_path(relative_path: str) -> Optional[str]:
+    """Absolute path of a servable file under UPLOAD_DIR, or None"""
+    parts = [p for p in relative_path.split("/") if p]
+    if (not parts or parts[0] in PRIVATE_DIRS or parts[-1].endswith(PRIVATE_SUFFIXES)
+            or any(".tmp-" in part or TOMBSTONE_MARKER in part for part in parts)):
+        return None
+    path = os.path.realpath(os.path.join(_UPLOAD_ROOT, *parts))
+    if not path.startswith(_UPLOAD_ROOT + os.sep):
+        return None
+    return path
+
+
+def is_blob(relative_path: str) -> bool:
+    return f"/uploads/{relative_path.lstrip('/')}".startswith(BLOB_URL_PREFIX)
+
+
+def is_immutable(relative_path: str) -> bool:
+    url = f"/uploads/{relative_path.lstrip('/')}"
+    if url.startswith(VARIANT_URL_PREFIX):
+        # Variants of a blob are as immutable as the blob: variants/w<width>/blobs/...
+        return url[len(VARIANT_URL_PREFIX):].split("/", 2)[1:2] == ["blobs"]
+    return is_blob(relative_path) or url.startswith(HLS_URL_PREFIX)
+
+
+def make_etag(relative_path: str, stat_result: os.stat_result) -> str:
+    if is_blob(relative_path):
+        # The name is the content hash
+        return f'"{os.path.basename(relative_path).split(".", 1)[0]}"'
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single "bytes=" range; None to serve the whole
+    file (malformed header or several ranges). Raises ValueError when unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if not (first or last) or not (first or "0").isdigit() or not (last or "0").isdigit():
+        return None
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError("empty suffix range")
+        start, end = max(size - suffix, 0), size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def range_applies(request: Request, etag: str, last_modified: str) -> bool:
+    """If-Range: only resume when the file is still the one the client has"""
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    return if_range.strip() in (etag, last_modified)
+
+
+class MediaFileResponse(Response):
+    """Sends bytes [start, end] of a file (the whole file by default)"""
+
+    def __init__(self, path: str, size: int, start: int = 0, end: Optional[int] = None,
+                 status_code: int = 200, headers: Optional[dict] = None,
+                 media_type: Optional[str] = None, head_only: bool = False):
+        self.path = path
+        self.start = start
+        self.end = size - 1 if end is None else end
+        self.head_only = head_only
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.headers["content-length"] = str(max(self.end - self.start + 1, 0))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if self.head_only or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        limiter = read_limiter()
+        file = await anyio.to_thread.run_sync(open, self.path, "rb", limiter=limiter)
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                # The server copies straight from the file descriptor (sendfile)
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": self.start,
+                    "count": count,
+                    "more_body": False
+                })
+                return
+
+            await anyio.to_thread.run_sync(file.seek, self.start, limiter=limiter)
+            remaining = count
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(file.read, min(CHUNK_SIZE, remaining), limiter=limiter)
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; end the response cleanly
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await anyio.to_thread.run_sync(file.close, limiter=limiter)
+
+
+def accel_response(relative_path: str, path: str, headers: dict, media_type: str) -> Response:
+    """Hand the transfer to the front web server (it handles Range itself)"""
+    if MEDIA_ACCEL_MODE == "nginx":
+        headers["X-Accel-Redirect"] = MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + quote(relative_path.lstrip("/"))
+    else:
+        headers["X-Sendfile"] = path
+    return Response(status_code=200, headers=headers, media_type=media_type)
+
+
+async def serve_media(request: Request, relative_path: str) -> Response:
+    path = resolve_media_path(relative_path)
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, path) if path else None
+    except (FileNotFoundError, NotADirectoryError):
+        stat_result = None
+    if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+        return Response(status_code=404, content="Not Found", media_type="text/plain")
+
+    size = stat_result.st_size
+    etag = make_etag(relative_path, stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if is_immutable(relative_path) else f"public, max-age={MEDIA_CACHE_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+    }
+
+    if not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if MEDIA_ACCEL_MODE in ("nginx", "sendfile"):
+        return accel_response(relative_path, path, headers, media_type)
+
+    head_only = request.method == "HEAD"
+    range_header = request.headers.get("range")
+    if range_header and range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return MediaFileResponse(path, size, start, end, status_code=206, headers=headers,
+                                     media_type=media_type, head_only=head_only)
+
+    return MediaFileResponse(path, size, headers=headers, media_type=media_type, head_only=head_only)
@@ -0,0 +1,400 @@
+"""
+Media Processing
+Background pipeline for uploaded lecture videos:
+
+1. probe duration and dimensions (ffprobe)
+2. grab a thumbnail and a poster frame (stored as content-addressed blobs)
+3. transcode to an adaptive HLS ladder (only rungs up to the source height)
+   plus a progressive 720p MP4 for browsers without HLS support
+4. update the CourseContent row (video_duration, video_thumbnail,
+   video_poster, hls_url, mp4_url, processing_status)
+
+The row's processing_status is the queue: uploads mark video content
+"pending" and enqueue it in-process; the scheduler's sweeper re-enqueues
+pending rows that were lost (restarts, other workers) and resets rows stuck
+in "processing" longer than MEDIA_PROCESSING_TIMEOUT. A row is claimed with
+a conditional UPDATE, so each video is processed by one worker. At most
+MEDIA_TRANSCODE_WORKERS ffmpeg processes run at once per API process.
+
+Renditions live in UPLOAD_DIR/hls/<sha256 of the source>/, so a video
+uploaded twice is transcoded once; the blob GC removes unreferenced
+rendition directories like any other blob.
+"""
+import os
+import json
+import uuid
+import shutil
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, or_, and_
+from ..database import AsyncSessionLocal
+from ..models import CourseContent
+from .uploads import UPLOAD_DIR, is_blob_url, upload_path, store_blob
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+MEDIA_PROCESSING_ENABLED = os.getenv("MEDIA_PROCESSING_ENABLED", "true").lower() == "true"
+MEDIA_TRANSCODE_WORKERS = int(os.getenv("MEDIA_TRANSCODE_WORKERS", "2"))
+# Longest a single video may take before ffmpeg is killed and the row retried
+MEDIA_PROCESSING_TIMEOUT = int(os.getenv("MEDIA_PROCESSING_TIMEOUT", "10800"))
+MEDIA_PROCESSING_MAX_ATTEMPTS = int(os.getenv("MEDIA_PROCESSING_MAX_ATTEMPTS", "3"))
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+FFMPEG_PRESET = os.getenv("FFMPEG_PRESET", "veryfast")
+
+HLS_DIR = os.path.join(UPLOAD_DIR, "hls")
+HLS_URL_PREFIX = "/uploads/hls/"
+os.makedirs(HLS_DIR, exist_ok=True)
+
+THUMBNAIL_WIDTH = 320
+POSTER_WIDTH = 1280
+MP4_FALLBACK_HEIGHT = 720
+
+
+class MediaProcessingError(Exception):
+    """ffmpeg/ffprobe failed or the file is not a usable video"""
+
+
+@dataclass(frozen=True)
+class Rendition:
+    name: str
+    height: int
+    video_kbps: int
+    audio_kbps: int
+
+
+# Lowest rung streams on congested campus Wi-Fi; players switch up as bandwidth allows
+HLS_LADDER = [
+    Rendition("360p", 360, 800, 96),
+    Rendition("480p", 480, 1400, 128),
+    Rendition("720p", 720, 2800, 128),
+    Rendition("1080p", 1080, 5000, 192),
+]
+
+
+@dataclass
+class VideoInfo:
+    duration: float
+    width: int
+    height: int
+    has_audio: bool
+
+
+def ffmpeg_available() -> bool:
+    return bool(shutil.which(FFMPEG_BIN) and shutil.which(FFPROBE_BIN))
+
+
+async def run_command(args: List[str], timeout: float = MEDIA_PROCESSING_TIMEOUT) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        tail = stderr.decode("utf-8", "replace").strip().splitlines()[-3:]
+        raise MediaProcessingError(f"{os.path.basename(args[0])} exited with {process.returncode}: {' | '.join(tail)}")
+    return stdout
+
+
+async def probe(path: str) -> VideoInfo:
+    output = await run_command([
+        FFPROBE_BIN, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path
+    ], timeout=60)
+    data = json.loads(output or b"{}")
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise MediaProcessingError("No video stream found")
+    duration = float(data.get("format", {}).get("duration") or video.get("duration") or 0)
+    return VideoInfo(
+        duration=duration,
+        width=int(video.get("width") or 0),
+        height=int(video.get("height") or 0),
+        has_audio=any(s.get("codec_type") == "audio" for s in streams)
+    )
+
+
+def ladder_for(info: VideoInfo) -> List[Rendition]:
+    """Rungs no taller than the source (never upscale); at least the lowest"""
+    return [r for r in HLS_LADDER if r.height <= info.height] or HLS_LADDER[:1]
+
+
+def transcode_command(source: str, out_dir: str, info: VideoInfo, renditions: List[Rendition]) -> List[str]:
+    fallback_height = min(MP4_FALLBACK_HEIGHT, max(info.height, HLS_LADDER[0].height))
+    outputs = len(renditions) + 1
+    # 8-bit 4:2:0 so every browser and device decoder can play the output
+    filters = [f"[0:v]format=yuv420p,split={outputs}" + "".join(f"[s{i}]" for i in range(outputs))]
+    filters += [f"[s{i}]scale=-2:{r.height}[v{i}]" for i, r in enumerate(renditions)]
+    filters.append(f"[s{len(renditions)}]scale=-2:{fallback_height}[vmp4]")
+
+    args = [
+        FFMPEG_BIN, "-hide_banner", "-nostdin", "-y", "-i", source,
+        "-filter_complex", ";".join(filters),
+        # Keyframes on segment boundaries so every rendition switches cleanly
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+    ]
+    stream_map = []
+    for i, r in enumerate(renditions):
+        args += [
+            "-map", f"[v{i}]", f"-c:v:{i}", "libx264", f"-preset:v:{i}", FFMPEG_PRESET,
+            f"-b:v:{i}", f"{r.video_kbps}k", f"-maxrate:v:{i}", f"{int(r.video_kbps * 1.07)}k",
+            f"-bufsize:v:{i}", f"{int(r.video_kbps * 1.5)}k",
+        ]
+        entry = f"v:{i}"
+        if info.has_audio:
+            args += ["-map", "0:a:0", f"-c:a:{i}", "aac", f"-b:a:{i}", f"{r.audio_kbps}k", f"-ac:a:{i}", "2"]
+            entry += f",a:{i}"
+        stream_map.append(f"{entry},name:{r.name}")
+    args += [
+        "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(out_dir, "%v", "segment_%05d.ts"),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(out_dir, "%v", "index.m3u8"),
+    ]
+
+    args += ["-map", "[vmp4]", "-c:v", "libx264", "-preset", FFMPEG_PRESET, "-crf", "23",
+             "-maxrate", "3000k", "-bufsize", "4500k"]
+    if info.has_audio:
+        args += ["-map", "0:a:0", "-c:a", "aac", "-b:a", "128k", "-ac", "2"]
+    # moov atom first so playback starts before the whole file is downloaded
+    args += ["-movflags", "+faststart", os.path.join(out_dir, "web.mp4")]
+    return args
+
+
+async def extract_frame(source: str, at_seconds: float, width: int) -> str:
+    """JPEG frame scaled to at most `width`, stored as a blob; returns its URL"""
+    temp = os.path.join(HLS_DIR, f"frame-{uuid.uuid4().hex}.jpg")
+    try:
+        await run_command([
+            FFMPEG_BIN, "-hide_banner", "-nostdin", "-y", "-ss", f"{at_seconds:.2f}", "-i", source,
+            "-frames:v", "1", "-vf", f"scale='min({width},iw)':-2", "-q:v", "3", temp
+        ], timeout=120)
+
+        def store():
+            with open(temp, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            return store_blob(temp, digest, "frame.jpg")[0]
+
+        return await run_in_threadpool(store)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def _source_digest(file_url: str, path: str) -> str:
+    if is_blob_url(file_url):
+        return os.path.basename(path).split(".", 1)[0]
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+async def transcode(file_url: str, info: VideoInfo) -> str:
+    """Build (or reuse) the rendition directory; returns its URL prefix"""
+    source = upload_path(file_url)
+    digest = await run_in_threadpool(_source_digest, file_url, source)
+    target = os.path.join(HLS_DIR, digest)
+    if os.path.exists(os.path.join(target, "master.m3u8")):
+        os.utime(target)
+        return f"{HLS_URL_PREFIX}{digest}/"
+
+    renditions = ladder_for(info)
+    work_dir = os.path.join(HLS_DIR, f"{digest}.tmp-{uuid.uuid4().hex[:8]}")
+    for r in renditions:
+        os.makedirs(os.path.join(work_dir, r.name), exist_ok=True)
+    try:
+        await run_command(transcode_command(source, work_dir, info, renditions))
+        try:
+            # Rendition directory appears complete or not at all
+            await run_in_threadpool(os.rename, work_dir, target)
+        except OSError:
+            # Another worker finished the same source first
+            if not os.path.exists(os.path.join(target, "master.m3u8")):
+                raise
+    finally:
+        if os.path.exists(work_dir):
+            await run_in_threadpool(shutil.rmtree, work_dir, True)
+    return f"{HLS_URL_PREFIX}{digest}/"
+
+
+# Queue
+
+_semaphore: Optional[asyncio.Semaphore] = None
+_bound_loop: Optional[asyncio.AbstractEventLoop] = None
+_tasks: Set[asyncio.Task] = set()
+_queued: Set[int] = set()
+_running = 0
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore, _bound_loop
+    loop = asyncio.get_running_loop()
+    if _bound_loop is not loop:
+        _semaphore, _bound_loop = asyncio.Semaphore(MEDIA_TRANSCODE_WORKERS), loop
+        _queued.clear()
+    return _semaphore
+
+
+async def _claim(content_id: int) -> Optional[CourseContent]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(CourseContent)
+            .where(CourseContent.id == content_id, CourseContent.processing_status == "pending")
+            .values(
+                processing_status="processing",
+                processing_started_at=datetime.utcnow(),
+                processing_attempts=CourseContent.processing_attempts + 1,
+                processing_error=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount != 1:
+            return None
+        return await db.get(CourseContent, content_id)
+
+
+async def _finish(content_id: int, **values):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(CourseContent).where(CourseContent.id == content_id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def process_content(content_id: int):
+    """Run the whole pipeline for one pending video (no-op if another worker has it)"""
+    global _running
+    try:
+        async with _get_semaphore():
+            content = await _claim(content_id)
+            if content is None:
+                return
+            _running += 1
+            try:
+                source = upload_path(content.file_url or "")
+                if not content.file_url or not os.path.isfile(source):
+                    raise MediaProcessingError("Source file is missing")
+
+                info = await probe(source)
+                frame_at = min(max(info.duration * 0.1, 0), 10.0)
+                thumbnail = await extract_frame(source, frame_at, THUMBNAIL_WIDTH)
+                poster = await extract_frame(source, frame_at, POSTER_WIDTH)
+                rendition_prefix = await transcode(content.file_url, info)
+            except asyncio.CancelledError:
+                # Shutting down: hand the row back now rather than after the stale timeout
+                await asyncio.shield(_finish(content_id, processing_status="pending"))
+                raise
+            except Exception as e:
+                failed = content.processing_attempts >= MEDIA_PROCESSING_MAX_ATTEMPTS or isinstance(e, MediaProcessingError)
+                logger.warning(f"⚠️ Media processing failed for content {content_id}: {e}")
+                await _finish(
+                    content_id,
+                    processing_status="failed" if failed else "pending",
+                    processing_error=str(e)[:2000] or type(e).__name__
+                )
+                return
+            finally:
+                _running -= 1
+
+            await _finish(
+                content_id,
+                video_duration=int(round(info.duration)),
+                video_thumbnail=thumbnail,
+                video_poster=poster,
+                hls_url=f"{rendition_prefix}master.m3u8",
+                mp4_url=f"{rendition_prefix}web.mp4",
+                processing_status="ready",
+                processing_error=None
+            )
+            logger.info(f"🎬 Processed video content {content_id} ({info.duration:.0f}s, {info.height}p source)")
+    finally:
+        _queued.discard(content_id)
+
+
+def enqueue_processing(content_id: int) -> bool:
+    """Schedule processing on this process's event loop; False if disabled or already queued"""
+    if not MEDIA_PROCESSING_ENABLED or not ffmpeg_available():
+        return False
+    _get_semaphore()
+    if content_id in _queued:
+        return False
+    _queued.add(content_id)
+    task = asyncio.create_task(process_content(content_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return True
+
+
+async def stop_processing():
+    """Cancel running jobs (their rows go back to pending for the next process)"""
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def sweep(fence=None) -> dict:
+    """Reset stuck rows and enqueue pending ones (scheduler job)"""
+    if not MEDIA_PROCESSING_ENABLED:
+        return {"enabled": False}
+    if not ffmpeg_available():
+        return {"enabled": False, "reason": f"{FFMPEG_BIN}/{FFPROBE_BIN} not installed"}
+
+    stale_before = datetime.utcnow() - timedelta(seconds=MEDIA_PROCESSING_TIMEOUT + 300)
+    stale = and_(
+        CourseContent.processing_status == "processing",
+        or_(CourseContent.processing_started_at.is_(None), CourseContent.processing_started_at < stale_before)
+    )
+    exhausted = CourseContent.processing_attempts >= MEDIA_PROCESSING_MAX_ATTEMPTS
+    async with AsyncSessionLocal() as db:
+        # The worker died or was restarted mid-job
+        retried = await db.execute(
+            update(CourseContent).where(stale, ~exhausted).values(processing_status="pending")
+            .execution_options(synchronize_session=False)
+        )
+        gave_up = await db.execute(
+            update(CourseContent).where(stale, exhausted)
+            .values(processing_status="failed", processing_error="Processing did not finish in time")
+            .execution_options(synchronize_session=False)
+        )
+        pending = list((await db.execute(
+            select(CourseContent.id).where(CourseContent.processing_status == "pending").order_by(CourseContent.id)
+        )).scalars())
+        await db.commit()
+
+    if fence:
+        fence()
+    enqueued = sum(1 for content_id in pending if enqueue_processing(content_id))
+    return {
+        "enabled": True,
+        "reset": retried.rowcount,
+        "failed": gave_up.rowcount,
+        "pending": len(pending),
+        "enqueued": enqueued
+    }
+
+
+def processing_status() -> dict:
+    return {
+        "enabled": MEDIA_PROCESSING_ENABLED,
+        "ffmpeg_available": ffmpeg_available(),
+        "workers": MEDIA_TRANSCODE_WORKERS,
+        "running": _running,
+        "queued": len(_queued)
+    }
@@ -0,0 +1,251 @@
+"""
+Performance Metrics
+Request-scoped instrumentation exported in Prometheus format.
+
+PerformanceMiddleware opens a RequestStats for every HTTP request in a
+context variable. Hooks on SQLAlchemy, the Redis client, docker-py clients
+and the Mistral client add to it, so each request knows how many SQL
+statements, Redis commands and Docker calls it made and how long they
+took. The same timings feed process-wide histograms served at /metrics.
+Requests slower than SLOW_REQUEST_MS are logged with the breakdown.
+"""
+import os
+import re
+import time
+import logging
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+from prometheus_client import Histogram, Gauge, Counter, CollectorRegistry, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DEPENDENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+CALL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests currently being served")
+REQUEST_DEPENDENCY_CALLS = Histogram(
+    "http_request_dependency_calls", "Calls made to a dependency while serving one request",
+    ["route", "dependency"], buckets=CALL_COUNT_BUCKETS
+)
+SQL_DURATION = Histogram(
+    "db_statement_duration_seconds", "SQL statement execution time",
+    ["operation"], buckets=DEPENDENCY_BUCKETS
+)
+REDIS_DURATION = Histogram(
+    "redis_command_duration_seconds", "Redis command round-trip time",
+    ["command"], buckets=DEPENDENCY_BUCKETS
+)
+DOCKER_DURATION = Histogram(
+    "docker_api_duration_seconds", "Docker Engine API call latency",
+    ["method", "operation"], buckets=LATENCY_BUCKETS
+)
+MISTRAL_DURATION = Histogram(
+    "mistral_request_duration_seconds", "Mistral API request latency",
+    ["outcome"], buckets=LATENCY_BUCKETS
+)
+LLM_CALLS = Counter(
+    "llm_calls_total", "LLM completion calls by result",
+    ["result"]
+)
+SCHEDULER_JOB_DURATION = Histogram(
+    "scheduler_job_duration_seconds", "Periodic job run time on the elected leader",
+    ["job", "status"], buckets=LATENCY_BUCKETS + (60, 120, 300)
+)
+
+DEPENDENCIES = ("sql", "redis", "docker", "mistral")
+
+
+class RequestStats:
+    """Per-request call counts and time spent per dependency"""
+
+    __slots__ = ("counts", "seconds")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(DEPENDENCIES, 0)
+        self.seconds = dict.fromkeys(DEPENDENCIES, 0.0)
+
+    def add(self, dependency: str, seconds: float):
+        self.counts[dependency] += 1
+        self.seconds[dependency] += seconds
+
+    def breakdown(self) -> str:
+        return " ".join(
+            f"{dep}={self.counts[dep]}/{self.seconds[dep] * 1000:.1f}ms" for dep in DEPENDENCIES
+        )
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def _record(dependency: str, seconds: float):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add(dependency, seconds)
+
+
+# SQL: every engine (sync, async and replica) executes through Engine cursor events
+
+def _sql_operation(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    return keyword if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    SQL_DURATION.labels(_sql_operation(statement)).observe(seconds)
+    _record("sql", seconds)
+
+
+# Redis: called from RedisClient's instrumented connection
+
+def record_redis(command: str, seconds: float):
+    REDIS_DURATION.labels(str(command).upper()).observe(seconds)
+    _record("redis", seconds)
+
+
+# Docker: docker-py's APIClient is a requests.Session, so a response hook sees every call
+
+_DOCKER_VERSION_PREFIX = re.compile(r"^/v\d+(\.\d+)?")
+_DOCKER_RESOURCES = ("containers", "images", "networks", "volumes", "exec", "plugins")
+_DOCKER_COLLECTION_ACTIONS = ("json", "create", "prune", "search", "load", "build")
+
+
+def _docker_operation(path: str) -> str:
+    """/v1.43/containers/abc123/start -> containers/{id}/start (keeps label cardinality bounded)"""
+    path = _DOCKER_VERSION_PREFIX.sub("", path.split("?", 1)[0])
+    parts = [part for part in path.split("/") if part]
+    if len(parts) >= 2 and parts[0] in _DOCKER_RESOURCES and parts[1] not in _DOCKER_COLLECTION_ACTIONS:
+        parts[1] = "{id}"
+    return "/".join(parts[:3]) or "/"
+
+
+def instrument_docker_client(client):
+    """Time every Docker Engine API call made through a docker-py client"""
+    def on_response(response, *args, **kwargs):
+        seconds = response.elapsed.total_seconds()
+        DOCKER_DURATION.labels(response.request.method, _docker_operation(response.request.path_url)).observe(seconds)
+        _record("docker", seconds)
+
+    client.api.hooks["response"].append(on_response)
+    return client
+
+
+# Mistral
+
+def record_mistral(seconds: float, outcome: str):
+    MISTRAL_DURATION.labels(outcome).observe(seconds)
+    _record("mistral", seconds)
+
+
+def record_llm_call(result: str):
+    """success, failed, retried, coalesced or short_circuited"""
+    LLM_CALLS.labels(result).inc()
+
+
+# Status dictionaries (DB pools, password service, replica) exposed as gauges
+
+class StatusCollector:
+    """Exports numeric fields of status() dictionaries as cyberlab_<group>_<field>{source=...}"""
+
+    def __init__(self, group: str, sources: Dict[str, Callable[[], dict]]):
+        self.group = group
+        self.sources = sources
+
+    def collect(self):
+        families: Dict[str, GaugeMetricFamily] = {}
+        for source, status in self.sources.items():
+            try:
+                values = status()
+            except Exception as e:
+                logger.error(f"Metrics status source {self.group}/{source} failed: {e}")
+                continue
+            for field, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"cyberlab_{self.group}_{field}"
+                if name not in families:
+                    families[name] = GaugeMetricFamily(name, f"{self.group} {field}", labels=["source"])
+                families[name].add_metric([source], value)
+        return list(families.values())
+
+
+def register_status_collector(group: str, sources: Dict[str, Callable[[], dict]]):
+    REGISTRY.register(StatusCollector(group, sources))
+
+
+def render_metrics():
+    """Prometheus exposition; aggregates worker processes when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class PerformanceMiddleware:
+    """ASGI middleware recording per-route latency and per-request dependency usage"""
+
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            _request_stats.reset(token)
+            seconds = time.perf_counter() - started
+
+            # Router sets scope["route"]; use its template so ids do not explode label cardinality
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(scope["method"], route, str(status_code)).observe(seconds)
+            for dependency in DEPENDENCIES:
+                REQUEST_DEPENDENCY_CALLS.labels(route, dependency).observe(stats.counts[dependency])
+
+            # Media downloads last as long as the transfer; their duration says nothing about the server
+            if seconds * 1000 >= self.slow_request_ms and not route.startswith("/uploads/"):
+                logger.warning(
+                    f"🐢 Slow request {scope['method']} {scope['path']} ({route}) -> {status_code} "
+                    f"in {seconds * 1000:.0f}ms | {stats.breakdown()}"
+                )
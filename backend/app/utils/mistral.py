@@ -1,20 +1,32 @@
-import httpx
+"""
+Mistral Question Generation
+Generates quiz questions through one shared LLMClient (pooled connections,
+circuit breaker, retry budget, coalescing of identical in-flight prompts).
+
+Several categories are requested in a single structured prompt; any
+category missing or malformed in that answer is regenerated on its own,
+concurrently, under MISTRAL_MAX_CONCURRENCY. Categories that still fail
+use the built-in fallback questions. Point MISTRAL_API_URL at
+mock_mistral.py to develop and load test without the real API.
+"""
 import json
 import os
-from typing import List, Dict
-
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "")
-MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
+import asyncio
+import logging
+from typing import List, Dict, Optional
+from .llm_client import LLMClient, LLMUnavailableError
+from .generation_cache import generation_cache, cache_key, dedupe_questions
 
-async def generate_quiz_questions(category: str, num_questions: int = 5, difficulty: str = "intermediate") -> List[Dict]:
-    """Generate unique quiz questions using Mistral AI"""
+logger = logging.getLogger(__name__)
 
-    prompt = f"""Generate {num_questions} multiple choice questions about {category} in cybersecurity.
-Difficulty level: {difficulty}
+MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "")
+MISTRAL_API_URL = os.getenv("MISTRAL_API_URL", "https://api.mistral.ai/v1/chat/completions")
+MISTRAL_MODEL = os.getenv("MISTRAL_MODEL", "mistral-small-latest")
+MISTRAL_TIMEOUT = float(os.getenv("MISTRAL_TIMEOUT", "30"))
+MISTRAL_MAX_CONCURRENCY = int(os.getenv("MISTRAL_MAX_CONCURRENCY", "4"))
+MISTRAL_BATCH_PROMPTS = os.getenv("MISTRAL_BATCH_PROMPTS", "true").lower() == "true"
 
-Return ONLY a valid JSON array with this exact format (no markdown, no explanation):
-[
-  {{
+QUESTION_FORMAT = """{
     "question": "Question text here?",
     "option_a": "First option",
     "option_b": "Second option",
@@ -22,18 +34,31 @@ Return ONLY a valid JSON array with this exact format (no markdown, no explanati
     "option_d": "Fourth option",
     "correct_answer": "a",
     "points": 10
-  }}
+  }"""
+
+QUESTION_PROMPT = """Generate {num_questions} multiple choice questions about {category} in cybersecurity.
+Difficulty level: {difficulty}
+
+Return ONLY a valid JSON array with this exact format (no markdown, no explanation):
+[
+  {question_format}
 ]
 
 Make questions practical and scenario-based. Each question should test real cybersecurity knowledge."""
 
-    headers = {
-        "Authorization": f"Bearer {MISTRAL_API_KEY}",
-        "Content-Type": "application/json"
-    }
+mistral_client = LLMClient(
+    MISTRAL_API_URL, MISTRAL_API_KEY, timeout=MISTRAL_TIMEOUT, max_concurrency=MISTRAL_MAX_CONCURRENCY
+)
+
+
+async def close_client():
+    await mistral_client.close()
+
 
+async def _complete(prompt: str, max_tokens: int) -> str:
+    """One chat completion; returns the message content"""
     payload = {
-        "model": "mistral-small-latest",
+        "model": MISTRAL_MODEL,
         "messages": [
             {
                 "role": "user",
@@ -41,35 +66,149 @@ Make questions practical and scenario-based. Each question should test real cybe
             }
         ],
         "temperature": 0.8,
-        "max_tokens": 2000
+        "max_tokens": max_tokens
     }
 
+    result = await mistral_client.complete(payload)
+    return result["choices"][0]["message"]["content"]
+
+
+def _parse_json(content: str):
+    # Clean up the response
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content[7:]
+    if content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return json.loads(content.strip())
+
+
+def _valid_questions(questions, num_questions: int) -> Optional[List[Dict]]:
+    """The first num_questions well-formed, mutually distinct questions, or None if there are too few"""
+    if not isinstance(questions, list):
+        return None
+    valid = [
+        q for q in questions
+        if isinstance(q, dict)
+        and all(isinstance(q.get(key), str) and q.get(key) for key in
+                ("question", "option_a", "option_b", "option_c", "option_d"))
+        and str(q.get("correct_answer", "")).lower() in ("a", "b", "c", "d")
+    ]
+    valid = dedupe_questions(valid)
+    if len(valid) < num_questions:
+        return None
+    for q in valid:
+        q["correct_answer"] = q["correct_answer"].lower()
+        q.setdefault("points", 10)
+    return valid[:num_questions]
+
+
+async def generate_quiz_questions(category: str, num_questions: int = 5, difficulty: str = "intermediate",
+                                  fallback: bool = True) -> List[Dict]:
+    """Generate unique quiz questions using Mistral AI (empty list on failure when fallback=False)"""
+
+    prompt = QUESTION_PROMPT.format(
+        num_questions=num_questions, category=category, difficulty=difficulty, question_format=QUESTION_FORMAT
+    )
+
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(MISTRAL_API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-
-            # Clean up the response
-            content = content.strip()
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            content = content.strip()
-
-            questions = json.loads(content)
-            return questions
+        content = await _complete(prompt, max_tokens=2000)
+        questions = _valid_questions(_parse_json(content), num_questions)
+        if questions is None:
+            raise ValueError("response did not contain enough valid questions")
+        return questions
 
     except Exception as e:
         print(f"Mistral API error: {e}")
+        if not fallback:
+            return []
         # Return fallback questions
         return get_fallback_questions(category, num_questions)
 
+
+async def _generate_batch(categories: List[str], num_questions: int, difficulty: str) -> Dict[str, List[Dict]]:
+    """All categories in one structured prompt; returns only the categories that came back valid"""
+    prompt = f"""Generate {num_questions} multiple choice questions for EACH of these cybersecurity categories.
+Categories (JSON): {json.dumps(categories)}
+Difficulty level: {difficulty}
+
+Return ONLY a valid JSON object (no markdown, no explanation) whose keys are exactly the category names
+and whose values are arrays of questions in this exact format:
+{{
+  "<category name>": [
+    {QUESTION_FORMAT}
+  ]
+}}
+
+Make questions practical and scenario-based. Each question should test real cybersecurity knowledge."""
+
+    try:
+        content = await _complete(prompt, max_tokens=min(8000, 450 * num_questions * len(categories)))
+        parsed = _parse_json(content)
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        logger.warning(f"Batched Mistral generation failed, generating per category: {e}")
+        return {}
+
+    if not isinstance(parsed, dict):
+        return {}
+    generated = {}
+    for category in categories:
+        questions = _valid_questions(parsed.get(category), num_questions)
+        if questions is not None:
+            generated[category] = questions
+    return generated
+
+
+async def generate_questions_for_categories(categories: List[str], num_questions: int,
+                                            difficulty: str = "intermediate",
+                                            fallback: bool = True,
+                                            use_cache: bool = True) -> Dict[str, List[Dict]]:
+    """
+    {category: questions} for every category, in the given order.
+    Cached pools are sampled first (use_cache=False always generates); the rest
+    come from one batched request, then concurrent per-category requests.
+    Every generation is added to the cache.
+    """
+    keys = {category: cache_key(QUESTION_PROMPT, MISTRAL_MODEL, category, difficulty) for category in categories}
+    generated = {}
+    if use_cache:
+        for category in categories:
+            cached = generation_cache.sample(keys[category], num_questions)
+            if cached is not None:
+                generated[category] = cached
+
+    pending = [category for category in categories if category not in generated]
+    fresh = {}
+    if MISTRAL_BATCH_PROMPTS and len(pending) > 1:
+        try:
+            fresh = await _generate_batch(pending, num_questions, difficulty)
+        except LLMUnavailableError as e:
+            # Upstream is down or the circuit is open: per-category requests would fail the same way
+            logger.warning(f"Mistral unavailable, using fallback questions: {e}")
+            pending = []
+
+    missing = [category for category in pending if category not in fresh]
+    if missing:
+        if fresh:
+            logger.info(f"Regenerating {len(missing)} category(ies) missing from batched response: {missing}")
+        results = await asyncio.gather(*(
+            generate_quiz_questions(category, num_questions, difficulty, fallback=False) for category in missing
+        ))
+        fresh.update((category, questions) for category, questions in zip(missing, results) if questions)
+
+    for category, questions in fresh.items():
+        generation_cache.add(keys[category], questions)
+    generated.update(fresh)
+
+    return {
+        category: generated.get(category) or (get_fallback_questions(category, num_questions) if fallback else [])
+        for category in categories
+    }
+
 def get_fallback_questions(category: str, num_questions: int) -> List[Dict]:
     """Fallback questions if API fails"""
 
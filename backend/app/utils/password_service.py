@@ -0,0 +1,156 @@
+"""
+Password Service
+Runs bcrypt hashing/verification in a dedicated process pool.
+
+bcrypt is deliberately slow (~250ms at cost 12) and blocks whichever
+thread calls it. Running it in the request threadpool lets a burst of
+logins starve every other route, so hashing goes through a small
+ProcessPoolExecutor behind its own concurrency limit instead.
+Requests beyond PASSWORD_HASH_MAX_QUEUE waiting callers are rejected with
+PasswordServiceBusy rather than queueing indefinitely.
+"""
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+import bcrypt
+from ..config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_CONCURRENCY, PASSWORD_HASH_MAX_QUEUE
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many hash operations are already waiting"""
+
+
+# Worker functions must be module-level so they can be pickled into the pool
+def bcrypt_hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def bcrypt_verify(password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except ValueError:
+        # Malformed hash in the database
+        return False
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Cost factor of a bcrypt hash ($2b$12$...), or None if unparseable"""
+    try:
+        return int(hashed_password.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    return hash_rounds(hashed_password) != BCRYPT_ROUNDS
+
+
+class PasswordService:
+    """Bounded process pool for bcrypt with queue-depth and latency metrics"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS,
+                 concurrency: int = PASSWORD_HASH_CONCURRENCY,
+                 max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_waiting_seen = 0
+        self.operations = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.total_wait_ms = 0.0
+        self.total_run_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily so importing the app (scripts, migrations) does not spawn processes
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    logger.info(f"🔐 Password hashing pool started with {self.workers} worker(s)")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise PasswordServiceBusy("Password hashing queue is full")
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        wait_ms = (started_at - queued_at) * 1000
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            self.operations += 1
+            self.total_wait_ms += wait_ms
+            self.total_run_ms += (time.perf_counter() - started_at) * 1000
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(bcrypt_hash, password, BCRYPT_ROUNDS)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(bcrypt_verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password and, if it matches but was hashed with a different
+        cost factor, return a replacement hash for the caller to store.
+        """
+        if not await self.verify(password, hashed_password):
+            return False, None
+        if not needs_rehash(hashed_password):
+            return True, None
+        self.rehashed += 1
+        return True, await self.hash(password)
+
+    def status(self) -> dict:
+        return {
+            "workers": self.workers,
+            "concurrency": self.concurrency,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth_seen": self.max_waiting_seen,
+            "max_queue": self.max_queue,
+            "operations": self.operations,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "avg_wait_ms": round(self.total_wait_ms / self.operations, 2) if self.operations else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+            "avg_hash_ms": round(self.total_run_ms / self.operations, 2) if self.operations else 0.0
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_service = PasswordService()
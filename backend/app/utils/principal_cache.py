@@ -0,0 +1,129 @@
+"""
+Principal Cache
+Resolves authenticated users without a database query per request.
+
+Lookups go through a small in-process LRU, then Redis, then the database.
+Every user has a version stamp in Redis; invalidate() bumps it so cached
+snapshots taken before a role change, deletion or password change are
+rejected everywhere. Local LRU entries live at most AUTH_PRINCIPAL_LOCAL_TTL
+seconds, which bounds staleness on other workers.
+"""
+import os
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TTL = float(os.getenv("AUTH_PRINCIPAL_LOCAL_TTL", "15"))
+LOCAL_MAX_ENTRIES = int(os.getenv("AUTH_PRINCIPAL_LOCAL_MAX", "10000"))
+REDIS_TTL = int(os.getenv("AUTH_PRINCIPAL_REDIS_TTL", "300"))
+
+PRINCIPAL_KEY_PREFIX = "auth:principal:"
+VERSION_KEY_PREFIX = "auth:principal_version:"
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """Immutable snapshot of the fields handlers need from the current user"""
+    id: int
+    username: str
+    email: str
+    semester: Optional[int]
+    department: Optional[str]
+    role: str
+    quiz_completed: bool
+    version: int = 0
+
+    @classmethod
+    def from_user(cls, user, version: int = 0) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            semester=user.semester,
+            department=user.department,
+            role=user.role or "student",
+            quiz_completed=bool(user.quiz_completed),
+            version=version
+        )
+
+
+class PrincipalCache:
+    """In-process LRU in front of Redis, keyed by user id"""
+
+    def __init__(self, local_ttl: float = LOCAL_TTL, max_entries: int = LOCAL_MAX_ENTRIES):
+        self.local_ttl = local_ttl
+        self.max_entries = max_entries
+        self._local: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_local(self, user_id: int) -> Optional[UserPrincipal]:
+        with self._lock:
+            entry = self._local.get(user_id)
+            if not entry:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._local[user_id]
+                return None
+            self._local.move_to_end(user_id)
+            return principal
+
+    def _put_local(self, principal: UserPrincipal):
+        with self._lock:
+            self._local[principal.id] = (time.monotonic() + self.local_ttl, principal)
+            self._local.move_to_end(principal.id)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get(self, user_id: int) -> Optional[UserPrincipal]:
+        """Return a cached snapshot whose version is still current, or None"""
+        principal = self._get_local(user_id)
+        if principal:
+            return principal
+
+        raw, version = redis_client.get_many([
+            f"{PRINCIPAL_KEY_PREFIX}{user_id}",
+            f"{VERSION_KEY_PREFIX}{user_id}"
+        ])
+        if not raw:
+            return None
+        try:
+            principal = UserPrincipal(**json.loads(raw))
+        except (TypeError, ValueError):
+            return None
+        if principal.version != int(version or 0):
+            return None
+
+        self._put_local(principal)
+        return principal
+
+    def current_version(self, user_id: int) -> int:
+        """Read before loading from the database so a concurrent invalidation wins"""
+        return int(redis_client.get(f"{VERSION_KEY_PREFIX}{user_id}") or 0)
+
+    def put(self, user, version: int) -> UserPrincipal:
+        principal = UserPrincipal.from_user(user, version)
+        redis_client.set_json(f"{PRINCIPAL_KEY_PREFIX}{principal.id}", asdict(principal), ttl=REDIS_TTL)
+        self._put_local(principal)
+        return principal
+
+    def invalidate(self, user_id: int):
+        """Drop every cached snapshot of a user (role/password change, deletion)"""
+        with self._lock:
+            self._local.pop(user_id, None)
+        redis_client.increment(f"{VERSION_KEY_PREFIX}{user_id}")
+        redis_client.delete(f"{PRINCIPAL_KEY_PREFIX}{user_id}")
+
+
+principal_cache = PrincipalCache()
+
+
+def invalidate_principal(user_id: int):
+    principal_cache.invalidate(user_id)
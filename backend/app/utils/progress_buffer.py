@@ -0,0 +1,323 @@
+"""
+Progress Buffer
+Write-behind aggregation for UserContentProgress heartbeats.
+
+Players report progress every few seconds per viewer; writing each report
+would be a row update and a commit on the primary. Instead a heartbeat
+only merges its delta into a pending entry per (user, content):
+
+- time_spent: seconds are added up
+- progress_percent: the highest value wins
+- completed: sticky once reached (PROGRESS_COMPLETE_PERCENT or explicit)
+
+Pending entries live in Redis (a hash per entry plus a dirty set, updated
+by one Lua script) so every worker shares them, or in process memory when
+Redis is down. The scheduler's "progress_flush" job drains them every
+PROGRESS_FLUSH_INTERVAL seconds into one INSERT ... ON CONFLICT DO UPDATE
+per batch, applying the same merge rules in SQL. Reads add the pending
+deltas to the stored row, so progress never looks behind.
+
+Entries a flush took but could not write are merged back into the buffer;
+local entries are moved into Redis once it is reachable again and flushed
+directly on shutdown.
+"""
+import os
+import time
+import threading
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Session
+from ..database import SessionLocal, upsert_insert
+from ..models import User, CourseContent, UserContentProgress
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_FLUSH_INTERVAL = int(os.getenv("PROGRESS_FLUSH_INTERVAL", "10"))
+PROGRESS_FLUSH_BATCH = int(os.getenv("PROGRESS_FLUSH_BATCH", "500"))
+# Longest a single heartbeat may claim; clients report every few seconds
+PROGRESS_MAX_HEARTBEAT_SECONDS = int(os.getenv("PROGRESS_MAX_HEARTBEAT_SECONDS", "60"))
+PROGRESS_COMPLETE_PERCENT = int(os.getenv("PROGRESS_COMPLETE_PERCENT", "95"))
+# Safety net for entries no flush picks up (never reached while the job runs)
+PENDING_TTL = 7 * 24 * 3600
+MAX_BATCHES_PER_FLUSH = 20
+
+PENDING_KEY_PREFIX = "progress:pending:"
+DIRTY_KEY = "progress:dirty"
+
+# Merge a delta into the pending hash and mark it dirty
+RECORD_SCRIPT = """
+local key = KEYS[1]
+redis.call('hincrby', key, 'seconds', ARGV[1])
+local percent = tonumber(ARGV[2])
+if percent >= 0 and percent > tonumber(redis.call('hget', key, 'percent') or '-1') then
+    redis.call('hset', key, 'percent', percent)
+end
+if ARGV[3] ~= '' then
+    redis.call('hsetnx', key, 'completed_at', ARGV[3])
+end
+redis.call('expire', key, ARGV[4])
+redis.call('sadd', KEYS[2], ARGV[5])
+return 1
+"""
+# Pop up to ARGV[1] dirty entries, returning and deleting their hashes
+TAKE_SCRIPT = """
+local members = redis.call('spop', KEYS[1], ARGV[1])
+local out = {}
+for _, member in ipairs(members) do
+    local key = ARGV[2] .. member
+    out[#out + 1] = member
+    out[#out + 1] = redis.call('hgetall', key)
+    redis.call('del', key)
+end
+return out
+"""
+READ_SCRIPT = """
+local out = {}
+for i, key in ipairs(KEYS) do
+    out[i] = redis.call('hgetall', key)
+end
+return out
+"""
+
+
+@dataclass
+class PendingProgress:
+    seconds: int = 0
+    percent: int = -1  # -1: no position reported yet
+    completed_at: Optional[datetime] = None
+
+    def merge(self, other: "PendingProgress"):
+        self.seconds += other.seconds
+        self.percent = max(self.percent, other.percent)
+        if other.completed_at and (self.completed_at is None or other.completed_at < self.completed_at):
+            self.completed_at = other.completed_at
+
+    @classmethod
+    def from_hash(cls, fields: Dict[str, str]) -> "PendingProgress":
+        completed_at = fields.get("completed_at")
+        return cls(
+            seconds=int(fields.get("seconds") or 0),
+            percent=int(fields.get("percent") or -1),
+            completed_at=datetime.fromisoformat(completed_at) if completed_at else None
+        )
+
+
+Key = Tuple[int, int]  # (user_id, content_id)
+
+_local: Dict[Key, PendingProgress] = {}
+_local_lock = threading.Lock()
+_stats = {"heartbeats": 0, "flushed_rows": 0, "flushes": 0, "flush_failures": 0, "last_flush_seconds": 0.0}
+
+
+def _member(key: Key) -> str:
+    return f"{key[0]}:{key[1]}"
+
+
+def _parse_member(member: str) -> Key:
+    user_id, content_id = member.split(":")
+    return int(user_id), int(content_id)
+
+
+def _pairs_to_dict(pairs: List[str]) -> Dict[str, str]:
+    return dict(zip(pairs[::2], pairs[1::2]))
+
+
+def _record_redis(key: Key, delta: PendingProgress) -> bool:
+    completed_at = delta.completed_at.isoformat() if delta.completed_at else ""
+    member = _member(key)
+    return redis_client.run_script(
+        RECORD_SCRIPT,
+        [f"{PENDING_KEY_PREFIX}{member}", DIRTY_KEY],
+        [delta.seconds, delta.percent, completed_at, PENDING_TTL, member]
+    ) is not None
+
+
+def _record_local(key: Key, delta: PendingProgress):
+    with _local_lock:
+        _local.setdefault(key, PendingProgress()).merge(delta)
+
+
+def _take_local() -> Dict[Key, PendingProgress]:
+    global _local
+    with _local_lock:
+        taken, _local = _local, {}
+    return taken
+
+
+def _buffer(entries: Dict[Key, PendingProgress]):
+    """Merge entries into Redis when reachable, else into process memory"""
+    use_redis = redis_client.is_connected()
+    for key, delta in entries.items():
+        if not (use_redis and _record_redis(key, delta)):
+            _record_local(key, delta)
+
+
+def record_heartbeat(user_id: int, content_id: int, seconds: int = 0,
+                     progress_percent: Optional[int] = None, completed: bool = False):
+    """Buffer one progress report; nothing is written to the database here"""
+    seconds = min(max(int(seconds or 0), 0), PROGRESS_MAX_HEARTBEAT_SECONDS)
+    percent = -1 if progress_percent is None else min(max(int(progress_percent), 0), 100)
+    if percent >= PROGRESS_COMPLETE_PERCENT:
+        completed = True
+    delta = PendingProgress(
+        seconds=seconds,
+        percent=100 if completed else percent,
+        completed_at=datetime.now(timezone.utc) if completed else None
+    )
+    _stats["heartbeats"] += 1
+
+    entries = {(user_id, content_id): delta}
+    if _local and redis_client.is_connected():
+        # Redis is back: hand entries buffered during the outage to the shared buffer
+        for key, pending in _take_local().items():
+            entries.setdefault(key, PendingProgress()).merge(pending)
+    _buffer(entries)
+
+
+def pending_progress(user_id: int, content_ids: Iterable[int]) -> Dict[int, PendingProgress]:
+    """Deltas not yet flushed, per content id"""
+    content_ids = list(content_ids)
+    pending: Dict[int, PendingProgress] = {}
+    if content_ids and redis_client.is_connected():
+        hashes = redis_client.run_script(
+            READ_SCRIPT, [f"{PENDING_KEY_PREFIX}{user_id}:{cid}" for cid in content_ids], []
+        ) or []
+        for content_id, pairs in zip(content_ids, hashes):
+            if pairs:
+                pending[content_id] = PendingProgress.from_hash(_pairs_to_dict(pairs))
+    with _local_lock:
+        for content_id in content_ids:
+            local = _local.get((user_id, content_id))
+            if local:
+                pending.setdefault(content_id, PendingProgress()).merge(local)
+    return pending
+
+
+def merged_progress(content_id: int, row: Optional[UserContentProgress],
+                    pending: Optional[PendingProgress]) -> dict:
+    """Stored progress plus pending deltas, with the flush's merge rules"""
+    progress = {
+        "content_id": content_id,
+        "completed": bool(row.completed) if row else False,
+        "progress_percent": (row.progress_percent or 0) if row else 0,
+        "time_spent": (row.time_spent or 0) if row else 0,
+        "completed_at": row.completed_at if row else None,
+    }
+    if pending:
+        progress["time_spent"] += pending.seconds
+        progress["progress_percent"] = max(progress["progress_percent"], pending.percent)
+        if pending.completed_at:
+            progress["completed"] = True
+            progress["completed_at"] = progress["completed_at"] or pending.completed_at
+    return progress
+
+
+def _take_redis(limit: int) -> Dict[Key, PendingProgress]:
+    result = redis_client.run_script(TAKE_SCRIPT, [DIRTY_KEY], [limit, PENDING_KEY_PREFIX]) or []
+    taken = {}
+    for member, pairs in zip(result[::2], result[1::2]):
+        if pairs:
+            taken[_parse_member(member)] = PendingProgress.from_hash(_pairs_to_dict(pairs))
+    return taken
+
+
+def _upsert_statement(db: Session, rows: List[dict]):
+    table = UserContentProgress.__table__
+    stmt = upsert_insert(db)(table).values(rows)
+    excluded = stmt.excluded
+    current_percent = func.coalesce(table.c.progress_percent, 0)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.content_id],
+        set_={
+            "time_spent": func.coalesce(table.c.time_spent, 0) + excluded.time_spent,
+            "progress_percent": case(
+                (excluded.progress_percent > current_percent, excluded.progress_percent), else_=current_percent
+            ),
+            "completed": or_(table.c.completed.is_(True), excluded.completed.is_(True)),
+            "completed_at": func.coalesce(table.c.completed_at, excluded.completed_at),
+        }
+    )
+
+
+def _write(db: Session, entries: Dict[Key, PendingProgress]) -> int:
+    # Users or contents deleted since the heartbeat would fail the whole batch
+    user_ids = {user_id for user_id, _ in entries}
+    content_ids = {content_id for _, content_id in entries}
+    live_users = set(db.execute(select(User.id).where(User.id.in_(user_ids))).scalars())
+    live_contents = set(db.execute(select(CourseContent.id).where(CourseContent.id.in_(content_ids))).scalars())
+
+    rows = [
+        {
+            "user_id": user_id,
+            "content_id": content_id,
+            "time_spent": pending.seconds,
+            "progress_percent": max(pending.percent, 0),
+            "completed": pending.completed_at is not None,
+            "completed_at": pending.completed_at,
+        }
+        for (user_id, content_id), pending in sorted(entries.items())
+        if user_id in live_users and content_id in live_contents
+    ]
+    if rows:
+        db.execute(_upsert_statement(db, rows))
+    db.commit()
+    return len(rows)
+
+
+def flush(db: Session, fence: Optional[Callable[[], None]] = None, include_redis: bool = True) -> dict:
+    """Write pending progress to the database in batches of PROGRESS_FLUSH_BATCH"""
+    started = time.perf_counter()
+    flushed, batches = 0, 0
+    entries = _take_local()
+    try:
+        while batches < MAX_BATCHES_PER_FLUSH:
+            if include_redis and len(entries) < PROGRESS_FLUSH_BATCH and redis_client.is_connected():
+                for key, pending in _take_redis(PROGRESS_FLUSH_BATCH - len(entries)).items():
+                    entries.setdefault(key, PendingProgress()).merge(pending)
+            if not entries:
+                break
+            if fence:
+                fence()
+            batch = dict(list(entries.items())[:PROGRESS_FLUSH_BATCH])
+            flushed += _write(db, batch)
+            for key in batch:
+                del entries[key]
+            batches += 1
+    except Exception:
+        db.rollback()
+        _stats["flush_failures"] += 1
+        # Keep what could not be written; the next flush retries it
+        _buffer(entries)
+        raise
+    if entries:
+        _buffer(entries)
+
+    _stats["flushes"] += 1
+    _stats["flushed_rows"] += flushed
+    _stats["last_flush_seconds"] = round(time.perf_counter() - started, 4)
+    return {"flushed": flushed, "batches": batches}
+
+
+def drain_local_buffer():
+    """On shutdown: hand this process's entries to Redis, or write them if it is down"""
+    if not _local:
+        return
+    if redis_client.is_connected():
+        _buffer(_take_local())
+        return
+    db = SessionLocal()
+    try:
+        flush(db, include_redis=False)
+    finally:
+        db.close()
+
+
+def buffer_status() -> dict:
+    with _local_lock:
+        local = len(_local)
+    shared = redis_client.run_script("return redis.call('scard', KEYS[1])", [DIRTY_KEY], []) or 0
+    return {**_stats, "pending_local": local, "pending_shared": shared}
@@ -0,0 +1,332 @@
+"""
+Question Bank
+Quizzes draw pre-generated questions from the question_bank table instead
+of calling Mistral while the student waits.
+
+Questions are bucketed by (category, difficulty) and deduplicated by a hash
+of their normalized text. Draws prefer the least-served questions and skip
+anything the user has already seen; a question served
+QUESTION_BANK_MAX_SERVES times is retired. The scheduler's replenisher job
+keeps QUESTION_BANK_TARGET_STOCK live questions per bucket. When a bucket
+cannot cover a draw, the shortfall is generated live (and banked), and only
+then do the static fallback questions fill the gap.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import QuestionBankEntry, UserServedQuestion, CourseAssessment
+from .mistral import generate_questions_for_categories, get_fallback_questions
+from .generation_cache import normalize_question, shingles, is_near_duplicate
+
+logger = logging.getLogger(__name__)
+
+QUESTION_BANK_TARGET_STOCK = int(os.getenv("QUESTION_BANK_TARGET_STOCK", "60"))
+QUESTION_BANK_BATCH_SIZE = int(os.getenv("QUESTION_BANK_BATCH_SIZE", "10"))
+QUESTION_BANK_MAX_SERVES = int(os.getenv("QUESTION_BANK_MAX_SERVES", "50"))
+
+# Placement assessment buckets (always stocked)
+ASSESSMENT_CATEGORIES = [
+    "Network Security", "Web Security", "Cryptography",
+    "Linux Fundamentals", "Penetration Testing", "Incident Response"
+]
+ASSESSMENT_DIFFICULTY = "intermediate"
+
+Bucket = Tuple[str, str]
+
+
+def question_hash(text: str) -> str:
+    return hashlib.sha256(normalize_question(text).encode()).hexdigest()
+
+
+def to_question(entry: QuestionBankEntry) -> dict:
+    """Bank row in the same shape as a freshly generated question"""
+    return {
+        "bank_id": entry.id,
+        "question": entry.question,
+        "option_a": entry.option_a,
+        "option_b": entry.option_b,
+        "option_c": entry.option_c,
+        "option_d": entry.option_d,
+        "correct_answer": entry.correct_answer,
+        "points": entry.points or 10
+    }
+
+
+async def add_questions(db: AsyncSession, category: str, difficulty: str,
+                        questions: List[dict], source: str = "mistral") -> List[QuestionBankEntry]:
+    """
+    Bank new questions, skipping exact (hash) and near duplicates of the bucket.
+    Returns the banked rows of the given questions, new or previously banked.
+    """
+    by_hash = {}
+    for q in questions:
+        by_hash.setdefault(question_hash(q["question"]), q)
+    if not by_hash:
+        return []
+
+    existing = set((await db.execute(
+        select(QuestionBankEntry.question_hash).where(QuestionBankEntry.question_hash.in_(list(by_hash)))
+    )).scalars())
+
+    rows = await db.execute(
+        select(
+            QuestionBankEntry.question, QuestionBankEntry.option_a, QuestionBankEntry.option_b,
+            QuestionBankEntry.option_c, QuestionBankEntry.option_d
+        ).where(
+            QuestionBankEntry.category == category,
+            QuestionBankEntry.difficulty == difficulty,
+            QuestionBankEntry.retired == False
+        )
+    )
+    bucket = [shingles(row._asdict()) for row in rows]
+    candidates = {}
+    for digest, q in by_hash.items():
+        if digest in existing or is_near_duplicate(q, bucket):
+            continue
+        bucket.append(shingles(q))
+        candidates[digest] = q
+
+    new_entries = [
+        QuestionBankEntry(
+            category=category,
+            difficulty=difficulty,
+            question=q["question"],
+            option_a=q["option_a"],
+            option_b=q["option_b"],
+            option_c=q["option_c"],
+            option_d=q["option_d"],
+            correct_answer=q["correct_answer"],
+            points=q.get("points", 10),
+            question_hash=digest,
+            source=source
+        )
+        for digest, q in candidates.items()
+    ]
+    try:
+        async with db.begin_nested():
+            db.add_all(new_entries)
+    except IntegrityError:
+        # Another worker banked some of the same questions concurrently
+        for entry in new_entries:
+            try:
+                async with db.begin_nested():
+                    db.add(entry)
+            except IntegrityError:
+                pass
+
+    result = await db.execute(
+        select(QuestionBankEntry).where(QuestionBankEntry.question_hash.in_(list(by_hash)))
+    )
+    return list(result.scalars())
+
+
+async def _draw_bucket(db: AsyncSession, category: str, difficulty: str, count: int,
+                       user_id: Optional[int], exclude_ids: List[int]) -> List[QuestionBankEntry]:
+    stmt = select(QuestionBankEntry).where(
+        QuestionBankEntry.category == category,
+        QuestionBankEntry.difficulty == difficulty,
+        QuestionBankEntry.retired == False
+    )
+    if user_id is not None:
+        seen = select(UserServedQuestion.question_id).where(UserServedQuestion.user_id == user_id)
+        stmt = stmt.where(QuestionBankEntry.id.not_in(seen))
+    if exclude_ids:
+        stmt = stmt.where(QuestionBankEntry.id.not_in(exclude_ids))
+    stmt = stmt.order_by(QuestionBankEntry.times_served, func.random()).limit(count)
+    return list((await db.execute(stmt)).scalars())
+
+
+async def mark_served(db: AsyncSession, entries: List[QuestionBankEntry], user_id: Optional[int]):
+    """Count the serve, retire worn-out questions and remember what the user saw"""
+    ids = [entry.id for entry in entries]
+    if not ids:
+        return
+    await db.execute(
+        update(QuestionBankEntry)
+        .where(QuestionBankEntry.id.in_(ids))
+        .values(
+            times_served=QuestionBankEntry.times_served + 1,
+            retired=QuestionBankEntry.times_served + 1 >= QUESTION_BANK_MAX_SERVES
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if user_id is not None:
+        db.add_all([UserServedQuestion(user_id=user_id, question_id=question_id) for question_id in ids])
+
+
+async def _top_up(db: AsyncSession, category: str, difficulty: str, per_category: int,
+                  drawn: List[QuestionBankEntry], generated: List[dict],
+                  user_id: Optional[int]) -> List[QuestionBankEntry]:
+    """Bank live-generated questions and draw the rest of the category from them"""
+    if generated:
+        await add_questions(db, category, difficulty, generated)
+    have = [entry.id for entry in drawn]
+    return drawn + await _draw_bucket(db, category, difficulty, per_category - len(have), user_id, have)
+
+
+async def _release_connection(db: AsyncSession):
+    """
+    End the read transaction before a live generation (up to LLM_LATENCY_BUDGET
+    seconds), so no connection sits idle in transaction meanwhile. The session
+    returns its connection to the pool; banking and counting the draw run in
+    a fresh transaction. Sessions do not expire on commit, so drawn rows stay usable.
+    """
+    await db.commit()
+
+
+def _with_fallback(category: str, drawn: List[QuestionBankEntry], per_category: int) -> List[dict]:
+    picked = [to_question(entry) for entry in drawn]
+    if len(picked) < per_category:
+        seen = {normalize_question(q["question"]) for q in picked}
+        picked += [
+            q for q in get_fallback_questions(category, per_category)
+            if normalize_question(q["question"]) not in seen
+        ][:per_category - len(picked)]
+    return picked
+
+
+async def draw_questions(db: AsyncSession, categories: List[str], per_category: int,
+                         difficulty: str = "intermediate", user_id: Optional[int] = None,
+                         record: bool = True) -> Dict[str, List[dict]]:
+    """
+    {category: questions} for every category, in the given order.
+    Bank first; shortfalls are generated live and banked, then filled from the
+    static fallback set. With record=True the draw is counted (caller commits).
+    A live generation commits the caller's session first (nothing may be pending).
+    """
+    drawn: Dict[str, List[QuestionBankEntry]] = {}
+    for category in categories:
+        drawn[category] = await _draw_bucket(db, category, difficulty, per_category, user_id, [])
+
+    short = [category for category in categories if len(drawn[category]) < per_category]
+    if short:
+        logger.info(f"Question bank short for {short} ({difficulty}); generating live")
+        await _release_connection(db)
+        # A user who exhausted a bucket needs questions they have not seen, so skip the cache for them
+        generated = await generate_questions_for_categories(
+            short, per_category, difficulty, fallback=False, use_cache=user_id is None
+        )
+        for category in short:
+            drawn[category] = await _top_up(
+                db, category, difficulty, per_category, drawn[category], generated.get(category), user_id
+            )
+
+    if record:
+        await mark_served(db, [entry for entries in drawn.values() for entry in entries], user_id)
+
+    return {category: _with_fallback(category, drawn[category], per_category) for category in categories}
+
+
+async def stream_questions(db: AsyncSession, categories: List[str], per_category: int,
+                           difficulty: str = "intermediate",
+                           user_id: Optional[int] = None) -> AsyncIterator[Tuple[str, List[dict]]]:
+    """
+    Yield (category, questions) as each category becomes ready: banked
+    categories immediately, then short ones as their live generations finish
+    (one concurrent request per category). Each draw is counted when yielded;
+    the caller commits it before asking for the next category.
+    """
+    short = {}
+    for category in categories:
+        drawn = await _draw_bucket(db, category, difficulty, per_category, user_id, [])
+        if len(drawn) < per_category:
+            short[category] = drawn
+            continue
+        await mark_served(db, drawn, user_id)
+        yield category, _with_fallback(category, drawn, per_category)
+
+    if not short:
+        return
+
+    logger.info(f"Question bank short for {list(short)} ({difficulty}); generating live")
+    await _release_connection(db)
+
+    async def generate(category: str):
+        generated = await generate_questions_for_categories(
+            [category], per_category, difficulty, fallback=False, use_cache=user_id is None
+        )
+        return category, generated[category]
+
+    for next_done in asyncio.as_completed([generate(category) for category in short]):
+        category, generated = await next_done
+        drawn = await _top_up(db, category, difficulty, per_category, short[category], generated, user_id)
+        await mark_served(db, drawn, user_id)
+        yield category, _with_fallback(category, drawn, per_category)
+
+
+# Replenishment (scheduler job)
+
+async def stock_levels(db: AsyncSession) -> Dict[Bucket, int]:
+    rows = await db.execute(
+        select(QuestionBankEntry.category, QuestionBankEntry.difficulty, func.count(QuestionBankEntry.id))
+        .where(QuestionBankEntry.retired == False)
+        .group_by(QuestionBankEntry.category, QuestionBankEntry.difficulty)
+    )
+    return {(category, difficulty): count for category, difficulty, count in rows}
+
+
+async def stocked_buckets(db: AsyncSession) -> List[Bucket]:
+    """Placement buckets plus the topics of every active course assessment"""
+    buckets = {(category, ASSESSMENT_DIFFICULTY) for category in ASSESSMENT_CATEGORIES}
+    rows = await db.execute(
+        select(CourseAssessment.topics, CourseAssessment.difficulty).where(CourseAssessment.is_active == True)
+    )
+    for topics, difficulty in rows:
+        for topic in topics or []:
+            buckets.add((topic, difficulty or ASSESSMENT_DIFFICULTY))
+    return sorted(buckets)
+
+
+async def replenish(db: AsyncSession, fence: Optional[Callable[[], None]] = None) -> dict:
+    """
+    Top up every bucket below QUESTION_BANK_TARGET_STOCK by at most
+    QUESTION_BANK_BATCH_SIZE questions: one batched generation per difficulty.
+    """
+    buckets = await stocked_buckets(db)
+    stock = await stock_levels(db)
+
+    low_by_difficulty: Dict[str, List[str]] = defaultdict(list)
+    for category, difficulty in buckets:
+        if stock.get((category, difficulty), 0) < QUESTION_BANK_TARGET_STOCK:
+            low_by_difficulty[difficulty].append(category)
+
+    added = 0
+    for difficulty, categories in low_by_difficulty.items():
+        deficit = max(QUESTION_BANK_TARGET_STOCK - stock.get((category, difficulty), 0) for category in categories)
+        await _release_connection(db)
+        generated = await generate_questions_for_categories(
+            categories, min(QUESTION_BANK_BATCH_SIZE, deficit), difficulty, fallback=False, use_cache=False
+        )
+        if fence:
+            fence()
+        for category, questions in generated.items():
+            if questions:
+                await add_questions(db, category, difficulty, questions)
+        await db.commit()
+
+        new_stock = await stock_levels(db)
+        added += sum(new_stock.get((c, difficulty), 0) - stock.get((c, difficulty), 0) for c in categories)
+
+    return {
+        "buckets": len(buckets),
+        "low_buckets": sum(len(categories) for categories in low_by_difficulty.values()),
+        "added": added
+    }
+
+
+async def bank_status(db: AsyncSession) -> dict:
+    stock = await stock_levels(db)
+    buckets = await stocked_buckets(db)
+    return {
+        "target_stock": QUESTION_BANK_TARGET_STOCK,
+        "buckets": [
+            {"category": category, "difficulty": difficulty, "stock": stock.get((category, difficulty), 0)}
+            for category, difficulty in buckets
+        ]
+    }
@@ -4,13 +4,25 @@ Handles Redis connections and common caching operations
 """
 import os
 import json
+import time
 import logging
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List
 import redis
 from redis.exceptions import ConnectionError, TimeoutError
+from .metrics import record_redis
 
 logger = logging.getLogger(__name__)
 
+class InstrumentedRedis(redis.Redis):
+    """Records every command's round trip in the request metrics"""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            record_redis(args[0], time.perf_counter() - started)
+
 class RedisClient:
     """Redis client wrapper with connection pooling and error handling"""
     
@@ -18,13 +30,17 @@ class RedisClient:
         self.host = os.getenv("REDIS_HOST", "localhost")
         self.port = int(os.getenv("REDIS_PORT", "6379"))
         self.db = int(os.getenv("REDIS_DB", "0"))
+        # Seconds a health check result is reused; avoids a PING before every command
+        self.health_check_seconds = float(os.getenv("REDIS_HEALTH_CHECK_SECONDS", "5"))
+        self._healthy = False
+        self._last_health_check = 0.0
         self.client: Optional[redis.Redis] = None
         self._connect()
     
     def _connect(self):
         """Initialize Redis connection"""
         try:
-            self.client = redis.Redis(
+            self.client = InstrumentedRedis(
                 host=self.host,
                 port=self.port,
                 db=self.db,
@@ -36,6 +52,8 @@ class RedisClient:
             )
             # Test connection
             self.client.ping()
+            self._healthy = True
+            self._last_health_check = time.monotonic()
             logger.info(f"✅ Redis connected: {self.host}:{self.port}/{self.db}")
         except (ConnectionError, TimeoutError) as e:
             logger.warning(f"⚠️ Redis connection failed: {e}. Running without cache.")
@@ -45,14 +63,19 @@ class RedisClient:
             self.client = None
     
     def is_connected(self) -> bool:
-        """Check if Redis is connected"""
+        """Check if Redis is connected (PINGs at most once per health check interval)"""
         if not self.client:
             return False
+        now = time.monotonic()
+        if now - self._last_health_check < self.health_check_seconds:
+            return self._healthy
+        self._last_health_check = now
         try:
             self.client.ping()
-            return True
+            self._healthy = True
         except:
-            return False
+            self._healthy = False
+        return self._healthy
     
     def get(self, key: str) -> Optional[str]:
         """Get value from Redis"""
@@ -94,6 +117,97 @@ class RedisClient:
             logger.error(f"Redis EXISTS error for key {key}: {e}")
             return False
     
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Get several values in one round trip (MGET)"""
+        if not self.is_connected():
+            return [None] * len(keys)
+        try:
+            return self.client.mget(keys)
+        except Exception as e:
+            logger.error(f"Redis MGET error for keys {keys}: {e}")
+            return [None] * len(keys)
+    
+    def pop(self, key: str) -> Optional[str]:
+        """Atomically get and delete a value (GETDEL)"""
+        if not self.is_connected():
+            return None
+        try:
+            return self.client.getdel(key)
+        except Exception as e:
+            logger.error(f"Redis GETDEL error for key {key}: {e}")
+            return None
+    
+    def add_to_set(self, key: str, member: str, ttl: int = 3600) -> bool:
+        """Add a member to a set and refresh the set's TTL"""
+        if not self.is_connected():
+            return False
+        try:
+            pipe = self.client.pipeline()
+            pipe.sadd(key, member)
+            if ttl > 0:
+                pipe.expire(key, ttl)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Redis SADD error for key {key}: {e}")
+            return False
+    
+    def get_set_members(self, key: str) -> List[str]:
+        """Get all members of a set"""
+        if not self.is_connected():
+            return []
+        try:
+            return list(self.client.smembers(key))
+        except Exception as e:
+            logger.error(f"Redis SMEMBERS error for key {key}: {e}")
+            return []
+    
+    def set_if_absent(self, key: str, value: str, ttl_ms: int) -> bool:
+        """SET NX PX; True when the key was created (lock/lease acquisition)"""
+        if not self.is_connected():
+            return False
+        try:
+            return bool(self.client.set(key, value, nx=True, px=ttl_ms))
+        except Exception as e:
+            logger.error(f"Redis SET NX error for key {key}: {e}")
+            return False
+    
+    def run_script(self, script: str, keys: List[str], args: List[Any]) -> Any:
+        """Run a Lua script atomically (EVAL); None on failure"""
+        if not self.is_connected():
+            return None
+        try:
+            return self.client.eval(script, len(keys), *keys, *args)
+        except Exception as e:
+            logger.error(f"Redis EVAL error for keys {keys}: {e}")
+            return None
+    
+    def push_capped(self, key: str, value: str, max_length: int, ttl: int = 0) -> bool:
+        """LPUSH then LTRIM, keeping the newest max_length entries"""
+        if not self.is_connected():
+            return False
+        try:
+            pipe = self.client.pipeline()
+            pipe.lpush(key, value)
+            pipe.ltrim(key, 0, max_length - 1)
+            if ttl > 0:
+                pipe.expire(key, ttl)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Redis LPUSH error for key {key}: {e}")
+            return False
+    
+    def get_list(self, key: str, count: int = -1) -> List[str]:
+        """Newest-first entries of a list written with push_capped"""
+        if not self.is_connected():
+            return []
+        try:
+            return self.client.lrange(key, 0, count - 1 if count > 0 else -1)
+        except Exception as e:
+            logger.error(f"Redis LRANGE error for key {key}: {e}")
+            return []
+    
     def get_json(self, key: str) -> Optional[Dict]:
         """Get JSON value from Redis"""
         value = self.get(key)
@@ -137,6 +251,16 @@ class RedisClient:
             logger.error(f"Redis HSET error for key {key}: {e}")
             return False
     
+    def delete_hash_fields(self, key: str, fields: List[str]) -> int:
+        """Remove fields from a hash (HDEL)"""
+        if not self.is_connected() or not fields:
+            return 0
+        try:
+            return self.client.hdel(key, *fields)
+        except Exception as e:
+            logger.error(f"Redis HDEL error for key {key}: {e}")
+            return 0
+    
     def delete_pattern(self, pattern: str) -> int:
         """Delete all keys matching pattern"""
         if not self.is_connected():
@@ -0,0 +1,139 @@
+"""
+Refresh Token Store
+Opaque, rotating refresh tokens kept in Redis.
+
+Each login starts a token family. Refreshing consumes the presented token
+(GETDEL) and issues its successor in the same family. A consumed token is
+remembered for the family's lifetime: presenting it again means it was
+stolen or replayed, so the whole family is revoked. Role changes, password
+changes and account deletion revoke every family of the user and bump
+the user's session version; access tokens carry the version they were
+issued under (the "sv" claim) and are rejected once it moves on.
+
+Only SHA-256 digests of tokens are stored. Without Redis no refresh tokens
+can be issued or redeemed (fail closed); users sign in again when their
+access token expires.
+"""
+import json
+import time
+import uuid
+import hashlib
+import secrets
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from .redis_client import redis_client
+from ..config import REFRESH_TOKEN_EXPIRE_DAYS
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TTL = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600
+
+TOKEN_KEY_PREFIX = "auth:refresh:"
+USED_KEY_PREFIX = "auth:refresh_used:"
+FAMILY_KEY_PREFIX = "auth:refresh_family:"
+USER_FAMILIES_KEY_PREFIX = "auth:refresh_user:"
+SESSION_VERSION_KEY_PREFIX = "auth:session_version:"
+
+
+class RefreshTokenError(Exception):
+    """Raised when a refresh token is unknown, expired, revoked or reused"""
+
+
+@dataclass
+class RefreshTokenGrant:
+    user_id: int
+    family: str
+    token: str
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class RefreshTokenStore:
+
+    def issue(self, user_id: int, family: Optional[str] = None) -> Optional[str]:
+        """Create a refresh token, starting a new family unless one is given"""
+        if not redis_client.is_connected():
+            logger.warning("⚠️ Redis unavailable, refresh token not issued")
+            return None
+
+        if family is None:
+            family = uuid.uuid4().hex
+            redis_client.set(f"{FAMILY_KEY_PREFIX}{family}", str(user_id), ttl=REFRESH_TTL)
+            redis_client.add_to_set(f"{USER_FAMILIES_KEY_PREFIX}{user_id}", family, ttl=REFRESH_TTL)
+
+        token = secrets.token_urlsafe(48)
+        record = {"uid": user_id, "family": family, "issued_at": int(time.time())}
+        if not redis_client.set_json(f"{TOKEN_KEY_PREFIX}{_digest(token)}", record, ttl=REFRESH_TTL):
+            return None
+        return token
+
+    def rotate(self, token: str) -> RefreshTokenGrant:
+        """Consume a refresh token and return its successor"""
+        digest = _digest(token)
+        raw = redis_client.pop(f"{TOKEN_KEY_PREFIX}{digest}")
+
+        if raw is None:
+            reused_family = redis_client.get(f"{USED_KEY_PREFIX}{digest}")
+            if reused_family:
+                logger.warning(f"🚨 Refresh token reuse detected, revoking family {reused_family}")
+                self.revoke_family(reused_family)
+            raise RefreshTokenError("Invalid refresh token")
+
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            raise RefreshTokenError("Invalid refresh token")
+
+        user_id, family = record["uid"], record["family"]
+        redis_client.set(f"{USED_KEY_PREFIX}{digest}", family, ttl=REFRESH_TTL)
+
+        if not redis_client.exists(f"{FAMILY_KEY_PREFIX}{family}"):
+            raise RefreshTokenError("Refresh token has been revoked")
+
+        new_token = self.issue(user_id, family)
+        if new_token is None:
+            raise RefreshTokenError("Refresh tokens are unavailable")
+        return RefreshTokenGrant(user_id=user_id, family=family, token=new_token)
+
+    def revoke(self, token: str):
+        """Log out the session a refresh token belongs to"""
+        raw = redis_client.pop(f"{TOKEN_KEY_PREFIX}{_digest(token)}")
+        if raw:
+            try:
+                self.revoke_family(json.loads(raw)["family"])
+            except (ValueError, KeyError):
+                pass
+
+    def revoke_family(self, family: str):
+        redis_client.delete(f"{FAMILY_KEY_PREFIX}{family}")
+
+    def revoke_user(self, user_id: int):
+        """Revoke every session of a user"""
+        key = f"{USER_FAMILIES_KEY_PREFIX}{user_id}"
+        for family in redis_client.get_set_members(key):
+            self.revoke_family(family)
+        redis_client.delete(key)
+
+
+refresh_tokens = RefreshTokenStore()
+
+
+def session_version(user_id: int) -> Optional[int]:
+    """Times the user's sessions were revoked; None when Redis is unreachable"""
+    if not redis_client.is_connected():
+        return None
+    value = redis_client.get(f"{SESSION_VERSION_KEY_PREFIX}{user_id}")
+    try:
+        return int(value) if value else 0
+    except ValueError:
+        return 0
+
+
+def revoke_user_sessions(user_id: int):
+    """Revoke the user's refresh tokens and every access token issued so far"""
+    refresh_tokens.revoke_user(user_id)
+    if redis_client.increment(f"{SESSION_VERSION_KEY_PREFIX}{user_id}") is None:
+        logger.warning(f"⚠️ Redis unavailable, access tokens of user {user_id} stay valid until they expire")
@@ -0,0 +1,333 @@
+"""
+Resumable Uploads
+tus-style protocol for large course media, so a dropped connection resumes
+from the last byte the server stored instead of restarting the transfer:
+
+- create: declare the final size and file name, get an upload id
+- PATCH: append a chunk at the current offset (a mismatched offset is a 409)
+- HEAD: current offset, so the client knows where to resume
+- finalize: once complete, the file is signature-checked, hashed and moved
+  into the blob store exactly like a streamed upload (see uploads.py)
+
+State lives on disk under UPLOAD_DIR/incoming (<id>.part holds the bytes,
+<id>.json the metadata), so uploads survive restarts and work across
+workers sharing the upload volume. The offset is the size of the .part
+file. Uploads untouched for UPLOAD_RESUMABLE_EXPIRY_HOURS are removed by
+the scheduler's upload GC job.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import base64
+import hashlib
+import logging
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Optional
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from .uploads import (
+    UPLOAD_DIR, UPLOAD_SUBDIRS, SNIFF_BYTES, MB, StoredUpload, UploadPolicy,
+    VIDEO_POLICY, DOCUMENT_POLICY, IMAGE_POLICY, RESOURCE_POLICY, policy_for_filename, store_blob, upload_path
+)
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+INCOMING_DIR = os.path.join(UPLOAD_DIR, "incoming")
+os.makedirs(INCOMING_DIR, exist_ok=True)
+
+UPLOAD_RESUMABLE_EXPIRY_HOURS = float(os.getenv("UPLOAD_RESUMABLE_EXPIRY_HOURS", "24"))
+# Largest single PATCH body; clients send the file in chunks of at most this size
+UPLOAD_CHUNK_MAX_MB = int(os.getenv("UPLOAD_CHUNK_MAX_MB", "64"))
+HASH_READ_BYTES = 4 * MB
+
+POLICIES_BY_KIND: Dict[str, UploadPolicy] = {
+    "video": VIDEO_POLICY,
+    "document": DOCUMENT_POLICY,
+    "image": IMAGE_POLICY,
+    "resource": RESOURCE_POLICY,
+}
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+@dataclass
+class ResumableUpload:
+    id: str
+    file_name: str
+    length: int
+    kind: str
+    created_by: int
+    created_at: float
+
+    @property
+    def policy(self) -> UploadPolicy:
+        return POLICIES_BY_KIND.get(self.kind) or policy_for_filename(self.file_name)
+
+    @property
+    def part_path(self) -> str:
+        return os.path.join(INCOMING_DIR, f"{self.id}.part")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(INCOMING_DIR, f"{self.id}.json")
+
+    def offset(self) -> int:
+        try:
+            return os.path.getsize(self.part_path)
+        except FileNotFoundError:
+            return 0
+
+
+def parse_metadata(header: Optional[str]) -> Dict[str, str]:
+    """tus Upload-Metadata: comma-separated 'key base64value' pairs"""
+    metadata = {}
+    for pair in (header or "").split(","):
+        pair = pair.strip()
+        if not pair:
+            continue
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value).decode("utf-8") if value else ""
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(status_code=400, detail=f"Invalid Upload-Metadata value for '{key}'")
+    return metadata
+
+
+def _write_meta(upload: ResumableUpload):
+    temp = f"{upload.meta_path}.tmp"
+    with open(temp, "w") as f:
+        json.dump(asdict(upload), f)
+    os.replace(temp, upload.meta_path)
+
+
+def _read_meta(upload_id: str) -> Optional[ResumableUpload]:
+    try:
+        with open(os.path.join(INCOMING_DIR, f"{upload_id}.json")) as f:
+            return ResumableUpload(**json.load(f))
+    except (FileNotFoundError, ValueError, TypeError):
+        return None
+
+
+def _remove_files(upload: ResumableUpload):
+    for path in (upload.part_path, upload.meta_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+async def create_upload(length: int, file_name: str, kind: Optional[str], user_id: int) -> ResumableUpload:
+    file_name = os.path.basename(file_name or "")
+    if not file_name:
+        raise HTTPException(status_code=400, detail="Upload-Metadata must include a filename")
+    if kind and kind not in POLICIES_BY_KIND:
+        raise HTTPException(status_code=400, detail=f"Unknown upload kind '{kind}'")
+    policy = POLICIES_BY_KIND[kind] if kind else policy_for_filename(file_name)
+    policy.check_extension(file_name)
+    if length < 0:
+        raise HTTPException(status_code=400, detail="Invalid Upload-Length")
+    if length > policy.max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large (limit {policy.max_bytes // MB} MB)")
+
+    upload = ResumableUpload(
+        id=uuid.uuid4().hex,
+        file_name=file_name,
+        length=length,
+        kind=kind or "",
+        created_by=user_id,
+        created_at=time.time()
+    )
+
+    def create():
+        open(upload.part_path, "wb").close()
+        _write_meta(upload)
+
+    await run_in_threadpool(create)
+    logger.info(f"⏫ Resumable upload {upload.id} created: {file_name} ({length} bytes)")
+    return upload
+
+
+async def get_upload(upload_id: str, user_id: int) -> ResumableUpload:
+    """The caller's upload, or 404 (also for other users' uploads)"""
+    upload = await run_in_threadpool(_read_meta, upload_id) if _UPLOAD_ID.match(upload_id) else None
+    if upload is None or upload.created_by != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+def _open_locked(upload: ResumableUpload, mode: str):
+    """
+    Open the .part file holding its lock: one writer or finalizer per upload,
+    across workers sharing the volume (409 while another request holds it).
+    An upload finalized or deleted in the meantime is a 404.
+    """
+    try:
+        f = open(upload.part_path, mode)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # The file we locked may have been moved into the blob store while we opened it
+        current = (os.path.exists(upload.meta_path)
+                   and os.stat(upload.part_path).st_ino == os.fstat(f.fileno()).st_ino)
+    except BlockingIOError:
+        f.close()
+        raise HTTPException(status_code=409, detail="Another request is writing to this upload")
+    except FileNotFoundError:
+        current = False
+    if not current:
+        f.close()
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return f
+
+
+def _read_head(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(SNIFF_BYTES)
+
+
+async def append_chunk(upload: ResumableUpload, request: Request, offset: int) -> int:
+    """
+    Append the request body at `offset`; returns the new offset.
+    Bytes received before a dropped connection are kept, so the client
+    resumes from the HEAD offset rather than resending the whole chunk.
+    """
+    chunk_limit = UPLOAD_CHUNK_MAX_MB * MB
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > chunk_limit:
+        raise HTTPException(status_code=413, detail=f"Chunk too large (limit {UPLOAD_CHUNK_MAX_MB} MB)")
+
+    f = await run_in_threadpool(_open_locked, upload, "ab")
+    try:
+        current = upload.offset()
+        if offset != current:
+            raise HTTPException(status_code=409, detail=f"Upload-Offset mismatch (server has {current})")
+
+        written = 0
+        try:
+            async for data in request.stream():
+                if not data:
+                    continue
+                if current + written + len(data) > upload.length:
+                    raise HTTPException(status_code=413, detail="Chunk exceeds the declared Upload-Length")
+                if written + len(data) > chunk_limit:
+                    raise HTTPException(status_code=413, detail=f"Chunk too large (limit {UPLOAD_CHUNK_MAX_MB} MB)")
+                await run_in_threadpool(f.write, data)
+                written += len(data)
+        except ClientDisconnect:
+            logger.info(f"Resumable upload {upload.id} interrupted at {current + written} bytes")
+        finally:
+            await run_in_threadpool(f.flush)
+            await run_in_threadpool(os.fsync, f.fileno())
+    finally:
+        await run_in_threadpool(f.close)
+
+    new_offset = current + written
+    if current < SNIFF_BYTES <= new_offset or (new_offset == upload.length and current < SNIFF_BYTES):
+        # Reject a mislabelled file as soon as its first bytes are in, not after gigabytes
+        head = await run_in_threadpool(_read_head, upload.part_path)
+        try:
+            upload.policy.check_signature(upload.file_name, head)
+        except HTTPException:
+            await run_in_threadpool(_remove_files, upload)
+            raise
+    return new_offset
+
+
+def _sha256_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_BYTES), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+async def finalize_upload(upload: ResumableUpload) -> StoredUpload:
+    """Move a complete upload into its media directory (holding the same lock as PATCH)"""
+    f = await run_in_threadpool(_open_locked, upload, "rb")
+    try:
+        offset = upload.offset()
+        if offset != upload.length:
+            raise HTTPException(status_code=409, detail=f"Upload incomplete ({offset} of {upload.length} bytes)")
+
+        try:
+            head = await run_in_threadpool(_read_head, upload.part_path)
+            upload.policy.check_signature(upload.file_name, head)
+            sha256 = await run_in_threadpool(_sha256_file, upload.part_path)
+            file_url, deduplicated = await run_in_threadpool(store_blob, upload.part_path, sha256, upload.file_name)
+        except FileNotFoundError:
+            # Cancelled (DELETE) while being finalized
+            raise HTTPException(status_code=404, detail="Upload not found")
+        await run_in_threadpool(_remove_files, upload)
+    finally:
+        await run_in_threadpool(f.close)
+
+    logger.info(f"📦 Resumable upload {upload.id} finalized as {file_url}" + (" (deduplicated)" if deduplicated else ""))
+    return StoredUpload(
+        file_url=file_url,
+        path=upload_path(file_url),
+        file_name=upload.file_name,
+        file_size=offset,
+        sha256=sha256,
+        deduplicated=deduplicated
+    )
+
+
+async def delete_upload(upload: ResumableUpload):
+    await run_in_threadpool(_remove_files, upload)
+
+
+def collect_abandoned(max_age_hours: float = UPLOAD_RESUMABLE_EXPIRY_HOURS,
+                      fence: Optional[Callable[[], None]] = None) -> dict:
+    """
+    Remove resumable uploads with no activity for max_age_hours, plus stray
+    .part files of streamed uploads a crashed worker never cleaned up.
+    """
+    cutoff = time.time() - max_age_hours * 3600
+    removed_uploads, removed_parts, freed = 0, 0, 0
+
+    for name in os.listdir(INCOMING_DIR):
+        upload_id, ext = os.path.splitext(name)
+        path = os.path.join(INCOMING_DIR, name)
+        if ext == ".json":
+            upload = _read_meta(upload_id)
+            if upload is None:
+                continue
+            try:
+                # Every PATCH touches the .part file
+                last_activity = max(os.path.getmtime(upload.part_path), upload.created_at)
+            except FileNotFoundError:
+                last_activity = upload.created_at
+            if last_activity < cutoff:
+                if fence:
+                    fence()
+                freed += upload.offset()
+                _remove_files(upload)
+                removed_uploads += 1
+        elif ext in (".part", ".tmp") and not os.path.exists(os.path.join(INCOMING_DIR, f"{upload_id}.json")):
+            # Orphan without metadata
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed_parts += 1
+            except FileNotFoundError:
+                pass
+
+    for subdir in UPLOAD_SUBDIRS:
+        directory = os.path.join(UPLOAD_DIR, subdir)
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".part"):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        freed += entry.stat().st_size
+                        os.remove(entry.path)
+                        removed_parts += 1
+                except FileNotFoundError:
+                    pass
+
+    return {"removed_uploads": removed_uploads, "removed_parts": removed_parts, "freed_bytes": freed}
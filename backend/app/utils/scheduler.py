@@ -0,0 +1,351 @@
+"""
+Periodic Job Scheduler
+Runs background jobs once per cluster instead of once per worker.
+
+Every API worker runs the same Scheduler, but a job only executes on the
+worker holding its Redis lease (SET NX PX). The holder renews the lease
+while the job runs; every acquisition increments a fencing counter, and a
+job whose lease expired or was taken over sees JobContext.ensure_leader()
+raise LeaseLost before its next side effect. Run durations and results
+are kept in a capped Redis list per job and exported as a histogram.
+
+Without Redis the jobs fail over to one worker holding a session-level
+Postgres advisory lock (a file lock for single-host SQLite development),
+which runs them until Redis is reachable again. Behind PgBouncer session
+locks are unreliable, so no job runs until Redis is back (fail closed).
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import socket
+import asyncio
+import tempfile
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from ..config import DB_PGBOUNCER
+from ..database import engine
+from .redis_client import redis_client
+from .metrics import SCHEDULER_JOB_DURATION
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+JOB_HISTORY_LENGTH = int(os.getenv("SCHEDULER_HISTORY_LENGTH", "50"))
+
+LEASE_KEY_PREFIX = "scheduler:lease:"
+FENCE_KEY_PREFIX = "scheduler:fence:"
+HISTORY_KEY_PREFIX = "scheduler:history:"
+
+# pg_try_advisory_lock key of the fallback leader (any constant bigint shared by all workers)
+FALLBACK_LOCK_KEY = 0x5C4ED01E
+FALLBACK_LOCK_FILE = os.path.join(tempfile.gettempdir(), "cyberlab-scheduler.lock")
+
+# Only the owner may extend or release a lease
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLost(Exception):
+    """The job's lease expired or another worker took it over"""
+
+
+class JobContext:
+    """Handed to a running job; check ensure_leader() before each side effect"""
+
+    def __init__(self, job_name: str, fence_token: int, lease_seconds: float, fallback: bool = False):
+        self.job_name = job_name
+        self.fence_token = fence_token
+        self.fallback = fallback
+        self._lease_deadline = time.monotonic() + lease_seconds
+        self._lost = threading.Event()
+
+    def extend(self, lease_seconds: float):
+        self._lease_deadline = time.monotonic() + lease_seconds
+
+    def mark_lost(self):
+        self._lost.set()
+
+    @property
+    def is_leader(self) -> bool:
+        # The local deadline also protects against a stalled renewal loop
+        return not self._lost.is_set() and time.monotonic() < self._lease_deadline
+
+    def ensure_leader(self):
+        if not self.is_leader:
+            raise LeaseLost(f"Lease for {self.job_name} lost (fence {self.fence_token})")
+
+
+JobFunc = Callable[[JobContext], Union[Any, Awaitable[Any]]]
+
+
+@dataclass
+class PeriodicJob:
+    name: str
+    func: JobFunc
+    interval_seconds: float
+    initial_delay_seconds: float = 0
+    lease_seconds: Optional[float] = None
+    last_run: Optional[dict] = field(default=None, repr=False)
+
+    @property
+    def lease_ttl(self) -> float:
+        # Outlives the interval so the leader keeps the lease between runs
+        return self.lease_seconds or self.interval_seconds * 1.5
+
+
+class FallbackLock:
+    """Scheduler leadership while Redis is unreachable, held until released"""
+
+    def __init__(self):
+        self._conn = None
+        self._file = None
+        self._mutex = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._conn is not None or self._file is not None
+
+    def acquire(self) -> bool:
+        with self._mutex:
+            if engine.dialect.name == "postgresql":
+                return self._acquire_advisory()
+            return self._acquire_file()
+
+    def _acquire_advisory(self) -> bool:
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT 1"))
+                self._conn.commit()
+                return True
+            except Exception as e:
+                # The lock went with the connection; another worker may hold it now
+                logger.warning(f"⚠️ Scheduler fallback lock connection lost: {e}")
+                self._discard_conn()
+        if DB_PGBOUNCER:
+            return False
+        conn = engine.connect()
+        try:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": FALLBACK_LOCK_KEY}).scalar()
+            conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Scheduler fallback lock failed: {e}")
+            conn.close()
+            return False
+        if not locked:
+            conn.close()
+            return False
+        self._conn = conn
+        logger.info("👑 Redis unavailable: this worker runs the periodic jobs (advisory lock)")
+        return True
+
+    def _acquire_file(self) -> bool:
+        if self._file is not None:
+            return True
+        f = open(FALLBACK_LOCK_FILE, "a")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        logger.info("👑 Redis unavailable: this worker runs the periodic jobs (file lock)")
+        return True
+
+    def _discard_conn(self):
+        try:
+            # Never return a connection that may still hold the lock to the pool
+            self._conn.invalidate()
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def release(self):
+        with self._mutex:
+            if self._conn is not None:
+                try:
+                    self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": FALLBACK_LOCK_KEY})
+                    self._conn.commit()
+                    self._conn.close()
+                    self._conn = None
+                except Exception:
+                    self._discard_conn()
+            if self._file is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                self._file.close()
+                self._file = None
+
+
+class Scheduler:
+
+    def __init__(self):
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, PeriodicJob] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._fallback = FallbackLock()
+
+    def add_job(self, name: str, func: JobFunc, interval_seconds: float,
+                initial_delay_seconds: float = 0, lease_seconds: Optional[float] = None):
+        self.jobs[name] = PeriodicJob(name, func, interval_seconds, initial_delay_seconds, lease_seconds)
+
+    # Lease handling
+
+    def _acquire(self, job: PeriodicJob) -> Optional[JobContext]:
+        """Return a context if this worker holds (or just took) the job's lease"""
+        if not redis_client.is_connected():
+            if self._fallback.acquire():
+                return JobContext(job.name, fence_token=0, lease_seconds=job.lease_ttl, fallback=True)
+            return None
+        if self._fallback.held:
+            logger.info("🔁 Redis is back: periodic jobs return to Redis leases")
+            self._fallback.release()
+
+        key = f"{LEASE_KEY_PREFIX}{job.name}"
+        ttl_ms = int(job.lease_ttl * 1000)
+        if redis_client.set_if_absent(key, self.owner_id, ttl_ms):
+            fence = redis_client.increment(f"{FENCE_KEY_PREFIX}{job.name}") or 0
+            logger.info(f"👑 Acquired lease for job {job.name} (fence {fence})")
+            return JobContext(job.name, fence, job.lease_ttl)
+        # Still ours from the previous run (lease outlives the interval)
+        if redis_client.run_script(RENEW_SCRIPT, [key], [self.owner_id, ttl_ms]):
+            fence = int(redis_client.get(f"{FENCE_KEY_PREFIX}{job.name}") or 0)
+            return JobContext(job.name, fence, job.lease_ttl)
+        return None
+
+    def _renew(self, job: PeriodicJob, ctx: JobContext) -> bool:
+        if ctx.fallback:
+            # Once Redis is back, leadership moves to the Redis leases
+            if not redis_client.is_connected() and self._fallback.held:
+                ctx.extend(job.lease_ttl)
+                return True
+            ctx.mark_lost()
+            return False
+        renewed = redis_client.run_script(
+            RENEW_SCRIPT, [f"{LEASE_KEY_PREFIX}{job.name}"], [self.owner_id, int(job.lease_ttl * 1000)]
+        )
+        if renewed:
+            ctx.extend(job.lease_ttl)
+            return True
+        ctx.mark_lost()
+        return False
+
+    async def _keep_lease(self, job: PeriodicJob, ctx: JobContext):
+        while True:
+            await asyncio.sleep(job.lease_ttl / 3)
+            if not await run_in_threadpool(self._renew, job, ctx):
+                logger.warning(f"⚠️ Lost lease for job {job.name} while running")
+                return
+
+    # Running
+
+    async def _execute(self, job: PeriodicJob, ctx: JobContext) -> dict:
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        keeper = asyncio.create_task(self._keep_lease(job, ctx))
+        status, result, error = "success", None, None
+        try:
+            if asyncio.iscoroutinefunction(job.func):
+                result = await job.func(ctx)
+            else:
+                result = await run_in_threadpool(job.func, ctx)
+        except LeaseLost as e:
+            status, error = "fenced", str(e)
+        except Exception as e:
+            status, error = "error", str(e)
+            logger.error(f"❌ Job {job.name} failed: {e}")
+        finally:
+            keeper.cancel()
+
+        duration = time.perf_counter() - started
+        SCHEDULER_JOB_DURATION.labels(job.name, status).observe(duration)
+        run = {
+            "job": job.name,
+            "owner": self.owner_id,
+            "fence_token": ctx.fence_token,
+            "started_at": started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 1),
+            "status": status,
+            "result": result,
+            "error": error
+        }
+        job.last_run = run
+        redis_client.push_capped(
+            f"{HISTORY_KEY_PREFIX}{job.name}", json.dumps(run, default=str), JOB_HISTORY_LENGTH
+        )
+        return run
+
+    async def _loop(self, job: PeriodicJob):
+        await asyncio.sleep(job.initial_delay_seconds)
+        while True:
+            try:
+                ctx = await run_in_threadpool(self._acquire, job)
+                if ctx:
+                    run = await self._execute(job, ctx)
+                    logger.info(f"⏱️ Job {job.name} {run['status']} in {run['duration_ms']}ms")
+                else:
+                    logger.debug(f"Job {job.name} is led by another worker")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Scheduler error for job {job.name}: {e}")
+            await asyncio.sleep(job.interval_seconds)
+
+    def start(self):
+        if not SCHEDULER_ENABLED:
+            logger.info("⏸️ Scheduler disabled (SCHEDULER_ENABLED=false)")
+            return
+        if not redis_client.is_connected():
+            logger.warning("⚠️ Redis unavailable: periodic jobs run on the worker holding the fallback lock")
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job)))
+        logger.info(f"🗓️ Scheduler started with jobs: {', '.join(self.jobs)}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self.jobs.values():
+            redis_client.run_script(RELEASE_SCRIPT, [f"{LEASE_KEY_PREFIX}{job.name}"], [self.owner_id])
+        self._fallback.release()
+
+    # Reporting
+
+    def history(self, job_name: str, limit: int = 20) -> List[dict]:
+        entries = redis_client.get_list(f"{HISTORY_KEY_PREFIX}{job_name}", limit)
+        if not entries:
+            job = self.jobs.get(job_name)
+            return [job.last_run] if job and job.last_run else []
+        return [json.loads(entry) for entry in entries]
+
+    def status(self) -> dict:
+        jobs = {}
+        for name, job in self.jobs.items():
+            leader = redis_client.get(f"{LEASE_KEY_PREFIX}{name}")
+            jobs[name] = {
+                "interval_seconds": job.interval_seconds,
+                "leader": leader,
+                "is_leader": leader == self.owner_id,
+                "last_run": (self.history(name, 1) or [None])[0]
+            }
+        return {"owner": self.owner_id, "running": bool(self._tasks), "fallback_leader": self._fallback.held, "jobs": jobs}
+
+
+scheduler = Scheduler()
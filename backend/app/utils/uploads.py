@@ -0,0 +1,418 @@
+"""
+Streaming Uploads
+Receives multipart uploads straight from the request stream instead of
+letting the framework spool the whole body first.
+
+As each chunk arrives the file part is size-checked against its policy,
+its first bytes are matched against the expected file signatures, it is
+hashed (sha256) and written to a temporary file in a worker thread, so
+the event loop never blocks on disk I/O. A completed upload is renamed
+into the content-addressed blob store (blobs/<2 hex>/<sha256>.<ext>); if
+that blob already exists the upload is dropped and the existing file is
+shared. A rejected or aborted upload leaves nothing behind. Oversized
+uploads are refused from Content-Length before any bytes are read.
+Reference counting and garbage collection of blobs live in blob_store.py.
+"""
+import os
+import uuid
+import shutil
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads")
+UPLOAD_SUBDIRS = ("videos", "documents", "images")
+for _subdir in UPLOAD_SUBDIRS:
+    os.makedirs(os.path.join(UPLOAD_DIR, _subdir), exist_ok=True)
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+BLOB_URL_PREFIX = "/uploads/blobs/"
+# Blobs being collected are renamed to <name>.gc-<uuid> first (blob_store.py)
+TOMBSTONE_MARKER = ".gc-"
+os.makedirs(BLOB_DIR, exist_ok=True)
+
+MB = 1024 * 1024
+UPLOAD_MAX_VIDEO_MB = int(os.getenv("UPLOAD_MAX_VIDEO_MB", "4096"))
+UPLOAD_MAX_DOCUMENT_MB = int(os.getenv("UPLOAD_MAX_DOCUMENT_MB", "100"))
+UPLOAD_MAX_IMAGE_MB = int(os.getenv("UPLOAD_MAX_IMAGE_MB", "20"))
+MAX_FIELD_BYTES = 64 * 1024
+MAX_FIELDS = 32
+# Multipart framing and form fields on top of the file itself
+MULTIPART_OVERHEAD = MAX_FIELDS * MAX_FIELD_BYTES
+SNIFF_BYTES = 16
+
+
+# File signatures
+
+def _is_mp4(head: bytes) -> bool:
+    return head[4:8] == b"ftyp"
+
+
+def _is_riff(kind: bytes) -> Callable[[bytes], bool]:
+    return lambda head: head[:4] == b"RIFF" and head[8:12] == kind
+
+
+def _is_text(head: bytes) -> bool:
+    return b"\x00" not in head
+
+
+_ZIP = lambda head: head[:4] == b"PK\x03\x04"
+_OLE = lambda head: head[:8] == b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+SIGNATURES: Dict[str, Callable[[bytes], bool]] = {
+    "mp4": _is_mp4,
+    "mov": _is_mp4,
+    "webm": lambda head: head[:4] == b"\x1a\x45\xdf\xa3",
+    "avi": _is_riff(b"AVI "),
+    "pdf": lambda head: head[:5] == b"%PDF-",
+    "doc": _OLE, "ppt": _OLE, "xls": _OLE,
+    "docx": _ZIP, "pptx": _ZIP, "xlsx": _ZIP,
+    "txt": _is_text,
+    "md": _is_text,
+    "jpg": lambda head: head[:3] == b"\xff\xd8\xff",
+    "jpeg": lambda head: head[:3] == b"\xff\xd8\xff",
+    "png": lambda head: head[:8] == b"\x89PNG\r\n\x1a\n",
+    "gif": lambda head: head[:6] in (b"GIF87a", b"GIF89a"),
+    "webp": _is_riff(b"WEBP"),
+}
+
+
+@dataclass(frozen=True)
+class UploadPolicy:
+    subdir: str
+    max_bytes: int
+    # None accepts any extension (no signature check)
+    extensions: Optional[Tuple[str, ...]] = None
+    error_detail: str = "Invalid file format"
+
+    def check_extension(self, filename: str):
+        if self.extensions is not None and extension_of(filename) not in self.extensions:
+            raise HTTPException(status_code=400, detail=self.error_detail)
+
+    def check_signature(self, filename: str, head: bytes):
+        if self.extensions is None:
+            return
+        matches = SIGNATURES.get(extension_of(filename))
+        if matches and not matches(head):
+            raise HTTPException(status_code=415, detail="File content does not match its extension")
+
+
+VIDEO_POLICY = UploadPolicy("videos", UPLOAD_MAX_VIDEO_MB * MB, ("mp4", "webm", "mov", "avi"), "Invalid video format")
+DOCUMENT_POLICY = UploadPolicy(
+    "documents", UPLOAD_MAX_DOCUMENT_MB * MB,
+    ("pdf", "doc", "docx", "txt", "md", "ppt", "pptx", "xls", "xlsx"), "Invalid document format"
+)
+IMAGE_POLICY = UploadPolicy("images", UPLOAD_MAX_IMAGE_MB * MB, ("jpg", "jpeg", "png", "gif", "webp"), "Invalid image format")
+RESOURCE_POLICY = UploadPolicy("documents", UPLOAD_MAX_DOCUMENT_MB * MB)
+# Anything else uploaded as course content is stored as a document
+OTHER_CONTENT_POLICY = RESOURCE_POLICY
+
+
+def policy_for_filename(filename: str) -> UploadPolicy:
+    """Pick the policy from the extension (uploads whose kind is only known from the file name)"""
+    ext = extension_of(filename)
+    for policy in (VIDEO_POLICY, DOCUMENT_POLICY, IMAGE_POLICY):
+        if ext in policy.extensions:
+            return policy
+    return OTHER_CONTENT_POLICY
+
+
+def extension_of(filename: str) -> str:
+    return filename.lower().rsplit(".", 1)[-1] if "." in filename else ""
+
+
+def upload_path(file_url: str) -> str:
+    """/uploads/videos/x.mp4 -> <UPLOAD_DIR>/videos/x.mp4"""
+    return file_url.replace("/uploads/", UPLOAD_DIR + "/", 1)
+
+
+# Content-addressed storage
+
+def blob_url(sha256: str, filename: str) -> str:
+    """Blobs keep the extension of the first upload so they are served with the right type"""
+    ext = extension_of(filename)
+    return f"{BLOB_URL_PREFIX}{sha256[:2]}/{sha256}" + (f".{ext}" if ext else "")
+
+
+def is_blob_url(file_url: Optional[str]) -> bool:
+    return bool(file_url) and file_url.startswith(BLOB_URL_PREFIX)
+
+
+def find_blob(sha256: str) -> Optional[str]:
+    """URL of the stored blob with this hash, whatever its extension"""
+    directory = os.path.join(BLOB_DIR, sha256[:2])
+    try:
+        for name in os.listdir(directory):
+            if name.split(".", 1)[0] == sha256 and not name.endswith(".part") and TOMBSTONE_MARKER not in name:
+                return f"{BLOB_URL_PREFIX}{sha256[:2]}/{name}"
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def store_blob(source_path: str, sha256: str, filename: str, keep_source: bool = False) -> Tuple[str, bool]:
+    """
+    Move (or with keep_source, hard-link/copy) a complete file into the blob
+    store. Returns (file_url, deduplicated). A duplicate leaves the stored
+    blob in place and only refreshes its mtime, which the blob GC treats as
+    "recently stored" so it is not collected before the new reference lands.
+    A blob the GC collected between the lookup and the refresh counts as
+    absent, and this copy is stored instead.
+    """
+    existing = find_blob(sha256)
+    if existing:
+        try:
+            os.utime(upload_path(existing))
+        except FileNotFoundError:
+            existing = None
+    if existing:
+        if not keep_source:
+            os.remove(source_path)
+        return existing, True
+
+    file_url = blob_url(sha256, filename)
+    target = upload_path(file_url)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if keep_source:
+        try:
+            os.link(source_path, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Different filesystem or no hard link support
+            temp = f"{target}.{uuid.uuid4().hex}.part"
+            shutil.copy2(source_path, temp)
+            os.replace(temp, target)
+    else:
+        # Atomic on the same filesystem: readers never see a partial file
+        os.replace(source_path, target)
+    return file_url, False
+
+
+@dataclass
+class StoredUpload:
+    file_url: str
+    path: str
+    file_name: str
+    file_size: int
+    sha256: str
+    # Identical bytes were already stored; file_url points at the shared blob
+    deduplicated: bool = False
+
+
+@dataclass
+class _Part:
+    name: str = ""
+    filename: Optional[str] = None
+    headers: List[Tuple[bytes, bytes]] = field(default_factory=list)
+    data: bytearray = field(default_factory=bytearray)
+
+
+class _UploadWriter:
+    """Temp file + incremental hash for the single file part"""
+
+    def __init__(self, filename: str, policy: UploadPolicy):
+        self.filename = filename
+        self.policy = policy
+        self.temp_path = os.path.join(UPLOAD_DIR, policy.subdir, f"{uuid.uuid4()}.part")
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self.head = b""
+        self.sniffed = False
+        self.file: Optional[BinaryIO] = None
+
+    async def open(self):
+        self.file = await run_in_threadpool(open, self.temp_path, "wb")
+
+    def _write(self, data: bytes):
+        # hashlib releases the GIL for large buffers, so hashing runs off the loop too
+        self.hasher.update(data)
+        self.file.write(data)
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.policy.max_bytes:
+            raise HTTPException(
+                status_code=413, detail=f"File too large (limit {self.policy.max_bytes // MB} MB)"
+            )
+        if not self.sniffed:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self.policy.check_signature(self.filename, self.head)
+                self.sniffed = True
+        await run_in_threadpool(self._write, data)
+
+    async def finish(self) -> StoredUpload:
+        if not self.sniffed:
+            # Files shorter than SNIFF_BYTES
+            self.policy.check_signature(self.filename, self.head)
+        await run_in_threadpool(self._close)
+        sha256 = self.hasher.hexdigest()
+        file_url, deduplicated = await run_in_threadpool(store_blob, self.temp_path, sha256, self.filename)
+        return StoredUpload(
+            file_url=file_url,
+            path=upload_path(file_url),
+            file_name=self.filename,
+            file_size=self.size,
+            sha256=sha256,
+            deduplicated=deduplicated
+        )
+
+    def _close(self):
+        if self.file is not None and not self.file.closed:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+    async def discard(self):
+        def cleanup():
+            if self.file is not None and not self.file.closed:
+                self.file.close()
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+        await run_in_threadpool(cleanup)
+
+
+async def receive_upload(request: Request, policy: Optional[UploadPolicy] = None,
+                         file_field: str = "file") -> Tuple[Dict[str, str], StoredUpload]:
+    """
+    Stream a multipart/form-data request to disk.
+    Without a policy it is chosen from the uploaded file name (policy_for_filename).
+    Returns (form fields, stored file); raises 400/413/415 HTTPExceptions.
+    """
+    max_bytes = policy.max_bytes if policy else max(
+        p.max_bytes for p in (VIDEO_POLICY, DOCUMENT_POLICY, IMAGE_POLICY, OTHER_CONTENT_POLICY)
+    )
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail=f"File too large (limit {max_bytes // MB} MB)")
+
+    fields: Dict[str, str] = {}
+    events: List[Tuple[str, _Part, bytes]] = []
+    part = _Part()
+    header_name = bytearray()
+    header_value = bytearray()
+
+    # Parser callbacks only queue events (several parts can pass in one chunk); the loop below does the I/O
+    def on_part_begin():
+        nonlocal part
+        part = _Part()
+
+    def on_part_data(data, start, end):
+        events.append(("data", part, data[start:end]))
+
+    def on_part_end():
+        events.append(("end", part, b""))
+
+    def on_header_field(data, start, end):
+        header_name.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        part.headers.append((bytes(header_name).lower(), bytes(header_value)))
+        header_name.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, options = parse_options_header(dict(part.headers).get(b"content-disposition", b""))
+        part.name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" in options:
+            part.filename = os.path.basename(options[b"filename"].decode("utf-8", "replace"))
+        events.append(("headers", part, b""))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    writer: Optional[_UploadWriter] = None
+    stored: Optional[StoredUpload] = None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, event_part, data in events:
+                is_file = event_part.filename is not None
+                if kind == "headers":
+                    if is_file:
+                        if event_part.name != file_field or writer is not None:
+                            raise HTTPException(status_code=400, detail=f"Upload exactly one file as '{file_field}'")
+                        file_policy = policy or policy_for_filename(event_part.filename)
+                        file_policy.check_extension(event_part.filename)
+                        writer = _UploadWriter(event_part.filename, file_policy)
+                        await writer.open()
+                    elif len(fields) >= MAX_FIELDS:
+                        raise HTTPException(status_code=400, detail="Too many form fields")
+                elif kind == "data":
+                    if is_file:
+                        await writer.write(data)
+                    else:
+                        event_part.data.extend(data)
+                        if len(event_part.data) > MAX_FIELD_BYTES:
+                            raise HTTPException(status_code=400, detail=f"Form field '{event_part.name}' too large")
+                elif kind == "end":
+                    if is_file:
+                        stored = await writer.finish()
+                    else:
+                        fields[event_part.name] = event_part.data.decode("utf-8", "replace")
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        # A blob already stored may be shared; left unreferenced, the blob GC removes it
+        if writer is not None:
+            await writer.discard()
+        raise
+
+    if stored is None:
+        if writer is not None:
+            await writer.discard()
+        raise HTTPException(status_code=400, detail=f"No file uploaded as '{file_field}'")
+
+    logger.info(
+        f"📦 Stored upload {stored.file_url} ({stored.file_size} bytes"
+        + (", deduplicated)" if stored.deduplicated else ")")
+    )
+    return fields, stored
+
+
+# Form field helpers for handlers that parse the multipart body themselves
+
+def form_str(fields: Dict[str, str], name: str, default: Optional[str] = None, required: bool = False) -> Optional[str]:
+    value = fields.get(name)
+    if value is None or (value == "" and not required):
+        if required:
+            raise HTTPException(status_code=422, detail=f"Form field '{name}' is required")
+        return default
+    return value
+
+
+def form_int(fields: Dict[str, str], name: str, default: Optional[int] = None) -> Optional[int]:
+    value = fields.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Form field '{name}' must be an integer")
+
+
+def form_bool(fields: Dict[str, str], name: str, default: bool = False) -> bool:
+    value = fields.get(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("true", "1", "yes", "on")
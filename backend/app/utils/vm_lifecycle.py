@@ -2,13 +2,25 @@
 Cyyber Linux VM Lifecycle Manager
 Adds pause/resume functionality to Docker containers for resource optimization
 """
+import os
+import time
 import docker
 import logging
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
+from .metrics import instrument_docker_client
+from .redis_client import redis_client
+from .scheduler import LeaseLost
 
 logger = logging.getLogger(__name__)
 
+ACTIVITY_KEY = "vm:activity"
+VM_OPTIMIZER_WORKERS = int(os.getenv("VM_OPTIMIZER_WORKERS", "8"))
+VM_OPTIMIZER_OP_TIMEOUT = int(os.getenv("VM_OPTIMIZER_OP_TIMEOUT", "20"))  # Seconds per Docker call
+VM_STOP_GRACE_SECONDS = 10
+
 class VMLifecycleManager:
     """
     Manages VM lifecycle states for resource optimization
@@ -16,8 +28,10 @@ class VMLifecycleManager:
     """
 
     def __init__(self):
-        self.docker_client = docker.from_env()
-        self.vm_activity = {}  # Track last activity per VM
+        self.docker_client = instrument_docker_client(docker.from_env())
+        # Separate client so optimizer calls fail after VM_OPTIMIZER_OP_TIMEOUT instead of the 60s default
+        self.optimizer_client = instrument_docker_client(docker.from_env(timeout=VM_OPTIMIZER_OP_TIMEOUT))
+        self.vm_activity = {}  # Local fallback when Redis is unavailable
 
     def start_vm(self, container_id: str) -> dict:
         """Start or unpause a VM"""
@@ -122,68 +136,202 @@ class VMLifecycleManager:
             logger.error(f"Failed to get stats for {container_id}: {e}")
             return {"error": str(e)}
 
+    # Activity is shared through Redis so the optimizer (which may run in another
+    # worker or replica) sees interactions recorded by any API process.
+
     def record_activity(self, container_id: str):
         """Record user activity for a VM"""
-        self.vm_activity[container_id] = datetime.now()
+        now = datetime.now()
+        self.vm_activity[container_id] = now
+        redis_client.set_hash(ACTIVITY_KEY, {container_id: str(now.timestamp())}, ttl=0)
+
+    def load_activity(self) -> Dict[str, datetime]:
+        """Last activity for every VM in one round trip (HGETALL)"""
+        stored = redis_client.get_hash(ACTIVITY_KEY)
+        if stored is None:
+            return dict(self.vm_activity)
+        activity = {}
+        for container_id, timestamp in stored.items():
+            try:
+                activity[container_id] = datetime.fromtimestamp(float(timestamp))
+            except ValueError:
+                continue
+        return activity
 
     def get_idle_time(self, container_id: str) -> Optional[timedelta]:
         """Get how long VM has been idle"""
-        if container_id not in self.vm_activity:
+        last_activity = self.load_activity().get(container_id)
+        if last_activity is None:
             return None
 
-        return datetime.now() - self.vm_activity[container_id]
+        return datetime.now() - last_activity
 
-    def auto_pause_idle_vms(self, idle_threshold_minutes: int = 10):
+    def _track_unseen(self, containers: list, activity: Dict[str, datetime]):
         """
-        Automatically pause VMs that have been idle
-        Call this periodically (e.g., every minute)
+        Start the idle clock for VMs with no recorded activity and forget VMs
+        that no longer exist, so the activity hash does not grow forever.
+        """
+        now = datetime.now()
+        unseen = {c.id: str(now.timestamp()) for c in containers if c.id not in activity}
+        if unseen:
+            redis_client.set_hash(ACTIVITY_KEY, unseen, ttl=0)
+            for container_id in unseen:
+                activity[container_id] = now
+                self.vm_activity.setdefault(container_id, now)
+
+        live_ids = {c.id for c in containers}
+        gone = [container_id for container_id in activity if container_id not in live_ids]
+        if gone:
+            redis_client.delete_hash_fields(ACTIVITY_KEY, gone)
+            for container_id in gone:
+                self.vm_activity.pop(container_id, None)
+
+    def run_optimizer_pass(self, pause_after_minutes: int = 10, stop_after_minutes: Optional[int] = None,
+                           fence: Optional[Callable[[], None]] = None) -> dict:
+        """
+        One optimizer pass:
+        1. List lab containers once (sparse: no per-container inspect)
+        2. Read every VM's last activity in one HGETALL
+        3. Pause running VMs idle > pause_after_minutes; stop running or paused
+           VMs idle > stop_after_minutes (None disables stopping)
+        4. Issue the operations concurrently on the listed container objects
+           with at most VM_OPTIMIZER_WORKERS in flight; each Docker call is
+           bounded by VM_OPTIMIZER_OP_TIMEOUT seconds
+
+        fence is called before each operation and may raise (the scheduler
+        passes JobContext.ensure_leader) to abort the rest of the pass.
         """
-        paused_count = 0
+        started = time.perf_counter()
+        report = {
+            "scanned": 0,
+            "running": 0,
+            "paused_idle": 0,
+            "paused": 0,
+            "stopped": 0,
+            "failed": 0,
+            "actions": [],
+            "list_ms": 0.0,
+            "duration_ms": 0.0
+        }
 
         try:
-            containers = self.docker_client.containers.list(
-                filters={"name": "lab_"}
-            )
-
-            for container in containers:
-                if container.status != "running":
-                    continue
-
-                idle_time = self.get_idle_time(container.id)
-
-                if idle_time and idle_time > timedelta(minutes=idle_threshold_minutes):
-                    result = self.pause_vm(container.id)
-                    if result.get("action") == "paused":
-                        paused_count += 1
-                        logger.info(f"Auto-paused {container.name} (idle for {idle_time})")
-
+            containers = self.optimizer_client.containers.list(sparse=True, filters={"name": "lab_"})
         except Exception as e:
-            logger.error(f"Error in auto-pause: {e}")
+            logger.error(f"Optimizer could not list VMs: {e}")
+            report["error"] = str(e)
+            return report
+        report["list_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        report["scanned"] = len(containers)
+
+        activity = self.load_activity()
+        self._track_unseen(containers, activity)
+
+        now = datetime.now()
+        planned = []
+        for container in containers:
+            status = container.status
+            if status == "running":
+                report["running"] += 1
+            elif status == "paused":
+                report["paused_idle"] += 1
+            else:
+                continue
+
+            idle_minutes = (now - activity[container.id]).total_seconds() / 60
+            if stop_after_minutes is not None and idle_minutes > stop_after_minutes:
+                planned.append((container, "stop", idle_minutes))
+            elif status == "running" and idle_minutes > pause_after_minutes:
+                planned.append((container, "pause", idle_minutes))
+
+        if planned:
+            with ThreadPoolExecutor(max_workers=min(VM_OPTIMIZER_WORKERS, len(planned))) as pool:
+                futures = []
+                for container, action, idle_minutes in planned:
+                    if fence:
+                        fence()
+                    futures.append(pool.submit(self._apply_action, container, action, idle_minutes, fence))
+                for future in futures:
+                    entry = future.result()
+                    report["actions"].append(entry)
+                    if entry["status"] == "ok":
+                        report["paused" if entry["action"] == "pause" else "stopped"] += 1
+                    elif entry["status"] != "skipped":
+                        report["failed"] += 1
+
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(
+            f"VM optimizer: scanned {report['scanned']}, paused {report['paused']}, "
+            f"stopped {report['stopped']}, failed {report['failed']} in {report['duration_ms']}ms"
+        )
+        return report
+
+    def _apply_action(self, container, action: str, idle_minutes: float,
+                      fence: Optional[Callable[[], None]] = None) -> dict:
+        entry = {
+            "container_id": container.id[:12],
+            "container_name": _container_name(container),
+            "action": action,
+            "idle_minutes": round(idle_minutes, 1),
+            "status": "ok",
+            "duration_ms": 0.0
+        }
+        started = time.perf_counter()
+        try:
+            if fence:
+                fence()
+            if action == "pause":
+                container.pause()
+            else:
+                container.stop(timeout=VM_STOP_GRACE_SECONDS)
+            logger.info(f"Auto-{action}d {entry['container_name']} (idle for {entry['idle_minutes']} min)")
+        except LeaseLost as e:
+            entry.update(status="skipped", error=str(e))
+        except docker.errors.NotFound:
+            entry.update(status="gone")
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            entry.update(status="timeout", error=str(e))
+        except Exception as e:
+            entry.update(status="error", error=str(e))
+            logger.error(f"Failed to {action} VM {container.id[:12]}: {e}")
+        entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return entry
 
-        return {"paused_count": paused_count}
+    def auto_pause_idle_vms(self, idle_threshold_minutes: int = 10, fence: Optional[Callable[[], None]] = None):
+        """
+        Automatically pause VMs that have been idle
+        Call this periodically (e.g., every minute)
+        """
+        report = self.run_optimizer_pass(pause_after_minutes=idle_threshold_minutes, fence=fence)
+        report["paused_count"] = report["paused"]
+        report["stopped_count"] = report["stopped"]
+        return report
 
     def get_all_vms_status(self) -> list:
         """Get status of all lab VMs"""
         try:
             containers = self.docker_client.containers.list(
                 all=True,
+                sparse=True,
                 filters={"name": "lab_"}
             )
+            activity = self.load_activity()
 
             vms = []
             for container in containers:
                 # Parse lab_id and user_id from container name
                 # Expected format: lab_{lab_id}_{user_id}
-                parts = container.name.split("_")
+                name = _container_name(container)
+                parts = name.split("_")
                 if len(parts) >= 3:
                     lab_id = "_".join(parts[0:2])  # lab_xxx
                     user_id = parts[2]
 
-                    idle_time = self.get_idle_time(container.id)
+                    last_activity = activity.get(container.id)
+                    idle_time = datetime.now() - last_activity if last_activity else None
 
                     vms.append({
                         "container_id": container.id[:12],
-                        "container_name": container.name,
+                        "container_name": name,
                         "lab_id": lab_id,
                         "user_id": user_id,
                         "status": container.status,
@@ -202,36 +350,12 @@ class VMLifecycleManager:
         1. Pausing idle VMs (>10 min)
         2. Stopping very idle VMs (>30 min)
         """
-        result = {
-            "paused": 0,
-            "stopped": 0,
-            "running": 0
-        }
+        return self.run_optimizer_pass(pause_after_minutes=10, stop_after_minutes=30)
 
-        try:
-            containers = self.docker_client.containers.list(
-                all=True,
-                filters={"name": "lab_"}
-            )
-
-            for container in containers:
-                if container.status == "running":
-                    result["running"] += 1
-
-                    idle_time = self.get_idle_time(container.id)
-
-                    if idle_time:
-                        # Pause after 10 minutes
-                        if idle_time > timedelta(minutes=10):
-                            self.pause_vm(container.id)
-                            result["paused"] += 1
-
-                        # Stop after 30 minutes
-                        elif idle_time > timedelta(minutes=30):
-                            self.stop_vm(container.id)
-                            result["stopped"] += 1
-
-        except Exception as e:
-            logger.error(f"Error optimizing resources: {e}")
 
-        return result
+def _container_name(container) -> str:
+    """Name of a container from a full or sparse listing"""
+    if container.name:
+        return container.name
+    names = container.attrs.get("Names") or [""]
+    return names[0].lstrip("/")
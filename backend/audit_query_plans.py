@@ -0,0 +1,131 @@
+"""
+Query Plan Audit Script
+Runs EXPLAIN on the hot queries issued by each router and flags sequential scans.
+
+Run against a seeded database (python init_database.py --seed), e.g.:
+    python audit_query_plans.py            # audit all queries
+    python audit_query_plans.py --verbose  # also print every plan
+
+On PostgreSQL the planner is told to avoid sequential scans for the session
+(enable_seqscan = off), so a "Seq Scan" in the plan means no usable index
+exists rather than "the table is small". On SQLite "SCAN <table>" without an
+index is flagged. Exits with status 1 when any query is flagged.
+"""
+
+import sys
+from sqlalchemy import select, func, text
+from app.database import engine, SessionLocal
+from app.models import (
+    User, Course, Enrollment, CourseLab, UserQuizResult, AssessmentQuizAttempt,
+    LabProgress, CourseModule, CourseContent, UserContentProgress,
+    CourseAssessment, UserAssessmentAttempt
+)
+from app.models.user import CourseProgress
+
+
+def sample_ids(db):
+    """Pick real ids from the seeded database so plans use realistic values"""
+    user_id = db.query(func.min(User.id)).scalar() or 1
+    course_id = db.query(func.min(Course.id)).scalar() or 1
+    lab_id = db.query(func.min(LabProgress.lab_id)).scalar() or "lab_linux_101"
+    content_id = db.query(func.min(CourseContent.id)).scalar() or 1
+    module_id = db.query(func.min(CourseModule.id)).scalar() or 1
+    return user_id, course_id, lab_id, content_id, module_id
+
+
+def hot_queries(user_id, course_id, lab_id, content_id, module_id):
+    """(router.handler, statement) pairs mirroring the routers' filters"""
+    return [
+        ("auth.get_current_user", select(User).where(User.username == "admin")),
+        ("labs.get_all_labs", select(LabProgress).where(
+            LabProgress.user_id == user_id, LabProgress.lab_id == lab_id)),
+        ("labs.get_all_progress", select(LabProgress).where(LabProgress.user_id == user_id)),
+        ("dashboard.get_dashboard_stats:enrolled", select(func.count()).select_from(Enrollment).where(
+            Enrollment.user_id == user_id)),
+        ("dashboard.get_dashboard_stats:completed_labs", select(func.count()).select_from(LabProgress).where(
+            LabProgress.user_id == user_id, LabProgress.completed == True)),
+        ("dashboard.get_dashboard_stats:course_labs", select(func.count()).select_from(CourseLab).where(
+            CourseLab.course_id == course_id)),
+        ("dashboard.get_dashboard_stats:quiz_results", select(UserQuizResult).where(
+            UserQuizResult.user_id == user_id)),
+        ("courses.get_course_labs", select(CourseLab).where(
+            CourseLab.course_id == course_id).order_by(CourseLab.order)),
+        ("courses.get_enrolled_courses", select(Enrollment).where(
+            Enrollment.user_id == user_id, Enrollment.course_id == course_id)),
+        ("courses.get_course_progress", select(CourseProgress).where(
+            CourseProgress.user_id == user_id, CourseProgress.course_id == course_id)),
+        ("courses.get_course_modules", select(CourseModule).where(
+            CourseModule.course_id == course_id).order_by(CourseModule.order)),
+        ("courses.get_course_modules:contents", select(CourseContent).where(
+            CourseContent.module_id == module_id).order_by(CourseContent.order)),
+        ("content.user_content_progress", select(UserContentProgress).where(
+            UserContentProgress.user_id == user_id, UserContentProgress.content_id == content_id)),
+        ("quiz.get_assessment_quiz", select(AssessmentQuizAttempt).where(
+            AssessmentQuizAttempt.user_id == user_id).order_by(AssessmentQuizAttempt.started_at.desc())),
+        ("assessments.get_my_attempts", select(UserAssessmentAttempt).where(
+            UserAssessmentAttempt.user_id == user_id, UserAssessmentAttempt.course_id == course_id)),
+        ("admin_assessments.get_assessment_attempts", select(UserAssessmentAttempt).where(
+            UserAssessmentAttempt.course_id == course_id)),
+        ("admin_assessments.get_assessment", select(CourseAssessment).where(
+            CourseAssessment.course_id == course_id)),
+    ]
+
+
+def explain(conn, statement):
+    """Return the plan lines for a statement on the current dialect"""
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    if engine.dialect.name == "sqlite":
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        return [row[-1] for row in rows]
+    rows = conn.execute(text(f"EXPLAIN {sql}")).fetchall()
+    return [row[0] for row in rows]
+
+
+def is_sequential_scan(line: str) -> bool:
+    if engine.dialect.name == "sqlite":
+        return line.startswith("SCAN") and "INDEX" not in line
+    return "Seq Scan" in line
+
+
+def audit(verbose=False):
+    print("=" * 70)
+    print(f"🔍 Query Plan Audit ({engine.dialect.name})")
+    print("=" * 70)
+
+    db = SessionLocal()
+    try:
+        ids = sample_ids(db)
+    finally:
+        db.close()
+
+    flagged = []
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("SET enable_seqscan = off"))
+
+        for name, statement in hot_queries(*ids):
+            plan = explain(conn, statement)
+            scans = [line.strip() for line in plan if is_sequential_scan(line.strip())]
+            if scans:
+                flagged.append(name)
+                print(f"❌ {name}")
+                for line in scans:
+                    print(f"     {line}")
+            else:
+                print(f"✅ {name}")
+            if verbose:
+                for line in plan:
+                    print(f"     | {line}")
+
+    print("\n" + "=" * 70)
+    if flagged:
+        print(f"⚠️  {len(flagged)} query(ies) fall back to sequential scans")
+    else:
+        print("✅ All hot queries use indexes")
+    print("=" * 70)
+    return not flagged
+
+
+if __name__ == "__main__":
+    ok = audit(verbose="--verbose" in sys.argv)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,71 @@
+"""
+Migration script to add composite/unique indexes on hot query paths
+- Removes duplicate progress/enrollment rows that would violate the new unique indexes
+- Creates every index declared in the models' __table_args__ (idempotent)
+
+Run from the backend directory: python migrations/add_hot_path_indexes.py
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+from app.database import engine
+from app.models import (
+    LabProgress, Enrollment, CourseLab, UserQuizResult, AssessmentQuizAttempt,
+    UserAssessmentAttempt, CourseModule, CourseContent, UserContentProgress
+)
+from app.models.user import CourseProgress
+
+# table -> (unique key columns, ORDER BY deciding which duplicate survives)
+DEDUP_RULES = {
+    "lab_progress": ("user_id, lab_id", "completed DESC, current_step DESC, id DESC"),
+    "enrollments": ("user_id, course_id", "completed DESC, progress DESC, id ASC"),
+    "course_progress": ("user_id, course_id", "passed DESC, assessment_attempts DESC, id DESC"),
+    "user_content_progress": ("user_id, content_id", "completed DESC, progress_percent DESC, id DESC"),
+}
+
+INDEXED_MODELS = [
+    LabProgress, Enrollment, CourseLab, UserQuizResult, AssessmentQuizAttempt,
+    UserAssessmentAttempt, CourseProgress, CourseModule, CourseContent, UserContentProgress
+]
+
+
+def remove_duplicates(conn):
+    """Keep one row per unique key, preferring the most advanced progress"""
+    for table, (key_columns, order_by) in DEDUP_RULES.items():
+        first_key = key_columns.split(",")[0].strip()
+        result = conn.execute(text(f"""
+            DELETE FROM {table}
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY {key_columns} ORDER BY {order_by}
+                    ) AS rn
+                    FROM {table}
+                    WHERE {first_key} IS NOT NULL
+                ) ranked
+                WHERE rn > 1
+            )
+        """))
+        print(f"  - {table}: removed {result.rowcount} duplicate row(s)")
+
+
+def run_migration():
+    print("Removing duplicate rows...")
+    with engine.begin() as conn:
+        remove_duplicates(conn)
+
+    print("Creating hot-path indexes...")
+    for model in INDEXED_MODELS:
+        model.__table__.create(engine, checkfirst=True)
+        for index in model.__table__.indexes:
+            index.create(engine, checkfirst=True)
+            print(f"  - {index.name}")
+
+    print("✅ Hot-path indexes created successfully!")
+
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,71 @@
+"""
+Migration script to add the media processing columns
+- Adds video_poster, hls_url, mp4_url and the processing_* columns to
+  course_contents, plus the processing status index
+- With --enqueue, marks existing video contents for processing (the
+  scheduler's media processing sweeper picks them up)
+
+Run from the backend directory: python migrations/add_media_processing.py [--enqueue]
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import inspect, text, update
+from app.database import engine, SessionLocal
+from app.models import CourseContent
+
+NEW_COLUMNS = [
+    "video_poster", "hls_url", "mp4_url",
+    "processing_status", "processing_error", "processing_attempts", "processing_started_at",
+]
+
+
+def add_columns():
+    table = CourseContent.__table__
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for name in NEW_COLUMNS:
+            if name in existing:
+                continue
+            column_type = table.c[name].type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+            print(f"  - added {table.name}.{name}")
+        conn.execute(text(f"UPDATE {table.name} SET processing_attempts = 0 WHERE processing_attempts IS NULL"))
+    for index in table.indexes:
+        if index.name == "ix_course_contents_processing_status":
+            index.create(engine, checkfirst=True)
+
+
+def enqueue_videos() -> int:
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(CourseContent)
+            .where(
+                CourseContent.content_type == "video",
+                CourseContent.file_url.isnot(None),
+                CourseContent.processing_status.is_(None)
+            )
+            .values(processing_status="pending", processing_attempts=0)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+def run_migration():
+    print("Adding media processing columns...")
+    add_columns()
+    print("✅ Media processing columns added successfully!")
+
+    if "--enqueue" in sys.argv:
+        print("Queueing existing videos...")
+        print(f"  - {enqueue_videos()} video(s) marked pending")
+
+
+if __name__ == "__main__":
+    run_migration()
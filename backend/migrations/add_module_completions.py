@@ -0,0 +1,96 @@
+"""
+Migration script to move completed course modules into course_module_completions
+- Creates the table and its indexes (idempotent)
+- Copies the module ids from course_progress.completed_modules (a JSON array),
+  in list order; rows already copied are skipped, so it can be re-run
+
+The JSON column is left in place but is no longer written.
+
+Run from the backend directory: python migrations/add_module_completions.py
+"""
+import sys
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import select
+from app.database import engine, SessionLocal
+from app.models import User, Course
+from app.models.user import CourseProgress, CourseModuleCompletion
+
+BATCH_SIZE = 1000
+
+
+def parse_module_ids(raw):
+    """Module ids of a completed_modules value; [] for empty or malformed JSON"""
+    try:
+        values = json.loads(raw) if raw else []
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(values, list):
+        return []
+    module_ids = []
+    for value in values:
+        try:
+            module_id = int(value)
+        except (TypeError, ValueError):
+            continue
+        if module_id not in module_ids:
+            module_ids.append(module_id)
+    return module_ids
+
+
+def backfill(db):
+    existing = set(db.execute(select(
+        CourseModuleCompletion.user_id, CourseModuleCompletion.course_id, CourseModuleCompletion.module_id
+    )).all())
+    users = set(db.execute(select(User.id)).scalars())
+    courses = set(db.execute(select(Course.id)).scalars())
+    now = datetime.now(timezone.utc)
+
+    rows, skipped = [], 0
+    for progress in db.query(CourseProgress).filter(CourseProgress.completed_modules.isnot(None)):
+        if progress.user_id not in users or progress.course_id not in courses:
+            skipped += 1
+            continue
+        started = progress.started_at or now
+        for position, module_id in enumerate(parse_module_ids(progress.completed_modules)):
+            key = (progress.user_id, progress.course_id, module_id)
+            if key in existing:
+                continue
+            existing.add(key)
+            rows.append({
+                "user_id": progress.user_id,
+                "course_id": progress.course_id,
+                "module_id": module_id,
+                # The JSON array only kept the order; spread by a second to preserve it
+                "completed_at": started + timedelta(seconds=position),
+            })
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(CourseModuleCompletion.__table__.insert(), rows[start:start + BATCH_SIZE])
+    db.commit()
+    return len(rows), skipped
+
+
+def run_migration():
+    print("Creating course_module_completions...")
+    CourseModuleCompletion.__table__.create(engine, checkfirst=True)
+    for index in CourseModuleCompletion.__table__.indexes:
+        index.create(engine, checkfirst=True)
+        print(f"  - {index.name}")
+
+    print("Copying completed modules from course_progress...")
+    db = SessionLocal()
+    try:
+        copied, skipped = backfill(db)
+    finally:
+        db.close()
+    print(f"  - {copied} completion(s) copied, {skipped} progress row(s) of deleted users/courses skipped")
+
+    print("✅ Module completions migrated successfully!")
+
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,56 @@
+"""
+Migration script to add the question bank tables
+- Creates question_bank and user_served_questions
+- With --fill, generates questions until every bucket reaches its target stock
+  (otherwise the scheduler's replenisher fills the bank in the background)
+
+Run from the backend directory: python migrations/add_question_bank.py [--fill]
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database import engine, AsyncSessionLocal
+from app.models import QuestionBankEntry, UserServedQuestion
+from app.utils.mistral import close_client
+from app.utils.question_bank import replenish, bank_status
+
+MAX_FILL_PASSES = 20
+
+
+async def fill_bank():
+    try:
+        for attempt in range(1, MAX_FILL_PASSES + 1):
+            async with AsyncSessionLocal() as db:
+                result = await replenish(db)
+            print(f"  - pass {attempt}: {result['low_buckets']} low bucket(s), added {result['added']}")
+            if result["low_buckets"] == 0 or result["added"] == 0:
+                break
+
+        async with AsyncSessionLocal() as db:
+            status = await bank_status(db)
+        for bucket in status["buckets"]:
+            print(f"  - {bucket['category']} ({bucket['difficulty']}): {bucket['stock']}/{status['target_stock']}")
+    finally:
+        await close_client()
+
+
+def run_migration():
+    print("Creating question bank tables...")
+    for model in (QuestionBankEntry, UserServedQuestion):
+        model.__table__.create(engine, checkfirst=True)
+        for index in model.__table__.indexes:
+            index.create(engine, checkfirst=True)
+    print("✅ Question bank tables created successfully!")
+    print("  - question_bank")
+    print("  - user_served_questions")
+
+    if "--fill" in sys.argv:
+        print("Filling question bank...")
+        asyncio.run(fill_bank())
+
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,130 @@
+"""
+Migration script to move uploaded media into the content-addressed blob store
+- Creates the file URL indexes used for blob reference counting
+- Hashes every referenced legacy upload (/uploads/videos/<uuid>.mp4, ...),
+  links it into /uploads/blobs/<2 hex>/<sha256>.<ext>, points every row at
+  the blob URL and then removes the legacy file; identical files collapse
+  into one blob
+- Reports legacy files no row references (--delete-orphans removes them)
+
+Safe to re-run: a crash between steps leaves either the legacy file or the
+blob in place, never a row pointing at a missing file.
+
+Run from the backend directory:
+    python migrations/dedupe_uploads.py [--dry-run] [--delete-orphans]
+"""
+import os
+import sys
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import update
+from app.database import engine, SessionLocal
+from app.models import CourseContent, CourseResource
+from app.utils.uploads import UPLOAD_DIR, UPLOAD_SUBDIRS, is_blob_url, upload_path, store_blob
+from app.utils.blob_store import REFERENCE_COLUMNS, referenced_urls
+
+MB = 1024 * 1024
+
+
+def sha256_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4 * MB), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def repoint(db, old_url: str, new_url: str) -> int:
+    rows = 0
+    for column in REFERENCE_COLUMNS:
+        result = db.execute(
+            update(column.class_).where(column == old_url).values({column.key: new_url})
+            .execution_options(synchronize_session=False)
+        )
+        rows += result.rowcount
+    return rows
+
+
+def migrate_referenced(db, dry_run: bool) -> dict:
+    legacy = sorted(url for url in referenced_urls(db) if url.startswith("/uploads/") and not is_blob_url(url))
+    print(f"Found {len(legacy)} referenced legacy upload(s)")
+
+    by_hash = defaultdict(list)
+    stats = {"moved": 0, "deduplicated": 0, "missing": 0, "saved_bytes": 0, "rows": 0}
+    for url in legacy:
+        path = upload_path(url)
+        if not os.path.isfile(path):
+            print(f"  ⚠️ missing on disk: {url}")
+            stats["missing"] += 1
+            continue
+        size = os.path.getsize(path)
+        digest = sha256_file(path)
+        if by_hash[digest]:
+            stats["saved_bytes"] += size
+        by_hash[digest].append(url)
+        if dry_run:
+            continue
+
+        # Link first, repoint rows, and only then drop the legacy file
+        blob_url, deduplicated = store_blob(path, digest, os.path.basename(path), keep_source=True)
+        stats["rows"] += repoint(db, url, blob_url)
+        db.commit()
+        os.remove(path)
+        stats["deduplicated" if deduplicated else "moved"] += 1
+        print(f"  - {url} -> {blob_url}" + (" (duplicate)" if deduplicated else ""))
+
+    duplicates = {digest: urls for digest, urls in by_hash.items() if len(urls) > 1}
+    if dry_run:
+        for digest, urls in duplicates.items():
+            print(f"  - {digest[:12]}: {len(urls)} copies ({', '.join(urls)})")
+    print(f"  {len(by_hash)} distinct file(s), {len(duplicates)} with duplicates, "
+          f"{stats['saved_bytes'] / MB:.1f} MB {'to save' if dry_run else 'saved'}")
+    return stats
+
+
+def report_orphans(db, delete: bool):
+    referenced = referenced_urls(db)
+    orphans, orphan_bytes = [], 0
+    for subdir in UPLOAD_SUBDIRS:
+        for entry in os.scandir(os.path.join(UPLOAD_DIR, subdir)):
+            url = f"/uploads/{subdir}/{entry.name}"
+            if entry.is_file() and not entry.name.endswith(".part") and url not in referenced:
+                orphans.append(entry.path)
+                orphan_bytes += entry.stat().st_size
+
+    print(f"Found {len(orphans)} unreferenced legacy file(s) ({orphan_bytes / MB:.1f} MB)")
+    if delete:
+        for path in orphans:
+            os.remove(path)
+        print(f"  - removed {len(orphans)} file(s)")
+    elif orphans:
+        print("  - re-run with --delete-orphans to remove them")
+
+
+def run_migration():
+    dry_run = "--dry-run" in sys.argv
+
+    print("Creating file URL indexes...")
+    for model in (CourseContent, CourseResource):
+        for index in model.__table__.indexes:
+            index.create(engine, checkfirst=True)
+
+    print("Moving uploads into the blob store..." if not dry_run else "Dry run: hashing uploads...")
+    db = SessionLocal()
+    try:
+        stats = migrate_referenced(db, dry_run)
+        report_orphans(db, delete="--delete-orphans" in sys.argv and not dry_run)
+    finally:
+        db.close()
+
+    if not dry_run:
+        print(f"✅ Blob store migration complete! {stats['moved']} moved, {stats['deduplicated']} deduplicated, "
+              f"{stats['rows']} row(s) updated, {stats['missing']} missing")
+
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,36 @@
+"""
+Migration script to create and fill user_dashboard_summaries
+- Creates the table (idempotent)
+- Builds every user's dashboard summary from the source tables; re-run it
+  (or POST /api/admin/dashboard-summaries/rebuild) to repair the rows
+
+Run from the backend directory: python migrations/rebuild_dashboard_summaries.py [user_id ...]
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database import engine, SessionLocal
+from app.models.user import UserDashboardSummary
+from app.utils.dashboard_summary import rebuild_dashboard_summaries, invalidate_dashboard_catalog
+
+
+def run_migration(user_ids=None):
+    print("Creating user_dashboard_summaries...")
+    UserDashboardSummary.__table__.create(engine, checkfirst=True)
+
+    print("Rebuilding dashboard summaries...")
+    db = SessionLocal()
+    try:
+        rebuilt = rebuild_dashboard_summaries(db, user_ids)
+    finally:
+        db.close()
+    invalidate_dashboard_catalog()
+    print(f"  - {rebuilt} summary row(s) rebuilt")
+
+    print("✅ Dashboard summaries rebuilt successfully!")
+
+
+if __name__ == "__main__":
+    run_migration([int(arg) for arg in sys.argv[1:]] or None)
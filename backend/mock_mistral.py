@@ -0,0 +1,106 @@
+"""
+Mock Mistral Completion Server
+Serves /v1/chat/completions with generated quiz questions for local
+development and load testing of question generation.
+
+    python mock_mistral.py                       # listen on :8099
+    python mock_mistral.py --port 8099 --latency 2.0 --fail-rate 0.2 --drop-category
+
+Then run the API with:
+    MISTRAL_API_URL=http://localhost:8099/v1/chat/completions
+
+--latency        seconds to wait before answering (simulates model time)
+--fail-rate      fraction of requests answered with HTTP 500
+--drop-category  omit the last category from batched answers (exercises per-category fallback)
+"""
+
+import re
+import sys
+import json
+import random
+import asyncio
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def arg_value(name, default):
+    if name in sys.argv:
+        return type(default)(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+LATENCY = arg_value("--latency", 0.5)
+FAIL_RATE = arg_value("--fail-rate", 0.0)
+PORT = arg_value("--port", 8099)
+DROP_CATEGORY = "--drop-category" in sys.argv
+
+app = FastAPI(title="Mock Mistral")
+stats = {"requests": 0, "batched": 0, "failed": 0}
+
+
+WORDS = (
+    "firewall packet token cipher kernel exploit payload audit session proxy hash certificate "
+    "socket registry sandbox beacon daemon signature tunnel credential subnet malware honeypot "
+    "forensics privilege gateway nonce replay handshake scanner rootkit"
+).split()
+
+
+def make_questions(category, count):
+    # Distinct wording per question so near-duplicate filtering keeps them
+    return [
+        {
+            "question": f"[{category}] Which {' '.join(random.sample(WORDS, 4))} applies?",
+            "option_a": " ".join(random.sample(WORDS, 2)),
+            "option_b": " ".join(random.sample(WORDS, 2)),
+            "option_c": " ".join(random.sample(WORDS, 2)),
+            "option_d": " ".join(random.sample(WORDS, 2)),
+            "correct_answer": random.choice("abcd"),
+            "points": 10
+        }
+        for i in range(count)
+    ]
+
+
+def completion(content):
+    return {
+        "id": "mock-completion",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    stats["requests"] += 1
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    await asyncio.sleep(LATENCY)
+
+    if random.random() < FAIL_RATE:
+        stats["failed"] += 1
+        return JSONResponse(status_code=500, content={"error": "mock failure"})
+
+    count = int(re.search(r"Generate (\d+)", prompt).group(1))
+    batch = re.search(r"Categories \(JSON\): (\[.*\])", prompt)
+    if batch:
+        stats["batched"] += 1
+        categories = json.loads(batch.group(1))
+        if DROP_CATEGORY:
+            categories = categories[:-1]
+        content = json.dumps({category: make_questions(category, count) for category in categories})
+    else:
+        category = re.search(r"questions about (.+?) in cybersecurity", prompt).group(1)
+        content = json.dumps(make_questions(category, count))
+
+    return completion(content)
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    print(f"🤖 Mock Mistral on :{PORT} (latency {LATENCY}s, fail rate {FAIL_RATE}, drop category {DROP_CATEGORY})")
+    uvicorn.run(app, host="0.0.0.0", port=PORT, log_level="warning")
@@ -40,11 +40,60 @@ const getApiUrl = () => {
 
 export const API_URL = getApiUrl();
 
+// Shared by concurrent 401s so a burst of failed requests triggers a single refresh
+let refreshPromise = null;
+
 export function AuthProvider({ children }) {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(localStorage.getItem('token'));
   const [loading, setLoading] = useState(true);
 
+  const storeTokens = (data) => {
+    localStorage.setItem('token', data.access_token);
+    if (data.refresh_token) {
+      localStorage.setItem('refresh_token', data.refresh_token);
+    }
+    setToken(data.access_token);
+  };
+
+  const refreshSession = async () => {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) {
+      throw new Error('No refresh token');
+    }
+    const res = await axios.post(`${API_URL}/auth/refresh`, { refresh_token: refreshToken });
+    storeTokens(res.data);
+    return res.data.access_token;
+  };
+
+  // Access tokens are short-lived: on a 401, rotate the refresh token once and replay the request
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      async (error) => {
+        const original = error.config;
+        if (error.response?.status !== 401 || !original || original._retried || original.url?.includes('/auth/')) {
+          return Promise.reject(error);
+        }
+        original._retried = true;
+        try {
+          if (!refreshPromise) {
+            refreshPromise = refreshSession().finally(() => {
+              refreshPromise = null;
+            });
+          }
+          const newToken = await refreshPromise;
+          original.headers.Authorization = `Bearer ${newToken}`;
+          return axios(original);
+        } catch {
+          logout();
+          return Promise.reject(error);
+        }
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   useEffect(() => {
     if (token) {
       fetchUser();
@@ -68,9 +117,7 @@ export function AuthProvider({ children }) {
 
   const login = async (username, password) => {
     const res = await axios.post(`${API_URL}/auth/login`, { username, password });
-    const newToken = res.data.access_token;
-    localStorage.setItem('token', newToken);
-    setToken(newToken);
+    storeTokens(res.data);
   };
 
   const register = async (userData) => {
@@ -78,7 +125,12 @@ export function AuthProvider({ children }) {
   };
 
   const logout = () => {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      axios.post(`${API_URL}/auth/logout`, { refresh_token: refreshToken }).catch(() => {});
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     setToken(null);
     setUser(null);
   };
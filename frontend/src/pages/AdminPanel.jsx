@@ -11,6 +11,44 @@ import {
 } from 'lucide-react';
 import './AdminPanel.css';
 
+const UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
+
+const encodeMetadata = (metadata) => Object.entries(metadata)
+  .map(([key, value]) => `${key} ${btoa(unescape(encodeURIComponent(value)))}`).join(',');
+
+// Resumable (tus-style) upload: chunks are PATCHed at the server's offset, so a
+// dropped connection resumes from the last stored byte instead of starting over.
+// getAuthHeaders is called per request: an upload can outlive the access token,
+// and the token refreshed into localStorage must be used for the remaining chunks.
+const uploadResumable = async (file, getAuthHeaders, onProgress) => {
+  const { data } = await axios.post(`${API_URL}/admin/content/uploads`, null, {
+    headers: { ...getAuthHeaders(), 'Upload-Length': String(file.size), 'Upload-Metadata': encodeMetadata({ filename: file.name }) }
+  });
+  const uploadUrl = `${API_URL}/admin/content/uploads/${data.upload_id}`;
+  const chunkBytes = Math.min(UPLOAD_CHUNK_BYTES, data.chunk_max_bytes || UPLOAD_CHUNK_BYTES);
+  let offset = 0;
+  let failures = 0;
+  while (offset < file.size) {
+    try {
+      const res = await axios.patch(uploadUrl, file.slice(offset, offset + chunkBytes), {
+        headers: { ...getAuthHeaders(), 'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': String(offset) }
+      });
+      offset = Number(res.headers['upload-offset']);
+      failures = 0;
+      onProgress(Math.round((offset / file.size) * 100));
+    } catch (err) {
+      if (err.response && ![409, 423, 500, 502, 503, 504].includes(err.response.status)) throw err;
+      if (++failures > UPLOAD_MAX_RETRIES) throw err;
+      await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** failures));
+      // Resume from whatever the server actually stored
+      const head = await axios.head(uploadUrl, { headers: getAuthHeaders() });
+      offset = Number(head.headers['upload-offset']);
+    }
+  }
+  return uploadUrl;
+};
+
 const AdminPanel = () => {
   const navigate = useNavigate();
   const [activeTab, setActiveTab] = useState('stats');
@@ -37,6 +75,7 @@ const AdminPanel = () => {
   });
   const [availableLabs, setAvailableLabs] = useState([]);
   const [uploadingFile, setUploadingFile] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState(0);
   const [labs, setLabs] = useState([]);
   const [labPagination, setLabPagination] = useState({ page: 1, per_page: 10, total: 0, total_pages: 0 });
   const [labSearch, setLabSearch] = useState('');
@@ -224,20 +263,15 @@ const AdminPanel = () => {
 
   const handleFileUpload = async (moduleId, file) => {
     if (!file) return;
-    setUploadingFile(true);
+    setUploadingFile(true); setUploadProgress(0);
     try {
-      const formData = new FormData();
-      formData.append('file', file);
-      formData.append('title', file.name.split('.')[0]);
-      formData.append('description', '');
-      formData.append('order', '0');
-      formData.append('is_required', 'true');
-      formData.append('estimated_duration', '0');
-      await axios.post(`${API_URL}/admin/content/modules/${moduleId}/upload-content`, formData,
-        { ...getAuthHeaders(), headers: { ...getAuthHeaders().headers, 'Content-Type': 'multipart/form-data' } });
+      const uploadUrl = await uploadResumable(file, () => getAuthHeaders().headers, setUploadProgress);
+      await axios.post(`${uploadUrl}/finalize`, {
+        module_id: moduleId, title: file.name.split('.')[0], description: '', order: 0, is_required: true, estimated_duration: 0
+      }, getAuthHeaders());
       setSuccess('File uploaded!'); fetchCourseModules(selectedCourse.id);
       setTimeout(() => setSuccess(''), 3000);
-    } catch (err) { setError('Upload failed'); setTimeout(() => setError(''), 5000); }
+    } catch (err) { setError(err.response?.data?.detail || 'Upload failed'); setTimeout(() => setError(''), 5000); }
     finally { setUploadingFile(false); }
   };
 
@@ -759,7 +793,7 @@ const AdminPanel = () => {
                     </div>
                   ))}
                 </div>
-                {uploadingFile && <div className="fixed inset-0 bg-black/50 flex items-center justify-center z-50"><div className="bg-gray-800 p-6 rounded-lg flex items-center gap-4"><RefreshCw className="w-6 h-6 animate-spin text-emerald-400" /><span>Uploading...</span></div></div>}
+                {uploadingFile && <div className="fixed inset-0 bg-black/50 flex items-center justify-center z-50"><div className="bg-gray-800 p-6 rounded-lg flex items-center gap-4"><RefreshCw className="w-6 h-6 animate-spin text-emerald-400" /><span>Uploading... {uploadProgress}%</span></div></div>}
               </div>
             )}
 
@@ -128,10 +128,17 @@ export default function CourseWorkflow() {
     if (content.content_type === 'lab_link' && content.linked_lab_id) {
       navigate(`/lab/${content.linked_lab_id}`);
     } else if (content.file_url) {
-      window.open(`${API_URL.replace('/api', '')}${content.file_url}`, '_blank');
+      window.open(`${API_URL.replace('/api', '')}${mediaUrl(content)}`, '_blank');
     }
   };
 
+  // Processed videos: adaptive HLS where the browser plays it natively, else the 720p MP4
+  const mediaUrl = (content) => {
+    const nativeHls = document.createElement('video').canPlayType('application/vnd.apple.mpegurl');
+    if (content.hls_url && nativeHls) return content.hls_url;
+    return content.mp4_url || content.file_url;
+  };
+
   // Group labs by category for the branching tree
   const groupedLabs = labs.reduce((acc, lab) => {
     const category = lab.category || 'General';
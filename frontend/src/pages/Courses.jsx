@@ -6,6 +6,32 @@ import Layout from '../components/Layout';
 import { BookOpen, Clock, Users, ChevronRight, Check, Play } from 'lucide-react';
 import Pagination from '../components/Pagination';
 
+const MEDIA_URL = API_URL.replace('/api', '');
+const CARD_SIZES = '(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw';
+
+// Uploaded images come with resized AVIF/WebP variants; external URLs are used as-is
+function CourseImage({ course }) {
+  const variants = course.image_variants;
+  const prefixSrcset = (srcset) => srcset.split(', ').map((entry) => `${MEDIA_URL}${entry}`).join(', ');
+  if (!variants) {
+    return <img src={course.image_url} alt={course.title} loading="lazy" decoding="async" className="w-full h-full object-cover" />;
+  }
+  return (
+    <picture className="w-full h-full">
+      {Object.entries(variants.srcset).map(([type, srcset]) => (
+        <source key={type} type={type} srcSet={prefixSrcset(srcset)} sizes={CARD_SIZES} />
+      ))}
+      <img
+        src={`${MEDIA_URL}${variants.card}`}
+        alt={course.title}
+        loading="lazy"
+        decoding="async"
+        className="w-full h-full object-cover"
+      />
+    </picture>
+  );
+}
+
 export default function Courses() {
   const { token } = useAuth();
   const [courses, setCourses] = useState([]);
@@ -145,7 +171,11 @@ export default function Courses() {
               className="bg-gray-800 rounded-xl border border-gray-700 overflow-hidden hover:border-gray-600 transition-colors"
             >
               <div className="h-32 bg-gradient-to-br from-emerald-500/20 to-cyan-500/20 flex items-center justify-center">
-                <BookOpen className="w-12 h-12 text-emerald-400" />
+                {course.image_url ? (
+                  <CourseImage course={course} />
+                ) : (
+                  <BookOpen className="w-12 h-12 text-emerald-400" />
+                )}
               </div>
               <div className="p-5">
                 <div className="flex items-center gap-2 mb-3">
@@ -8,6 +8,45 @@ import {
 import axios from 'axios';
 import { useAuth, API_URL } from '../context/AuthContext';
 
+// Progress updates that could not be sent (offline, server errors); synced in one batch later
+const PENDING_PROGRESS_KEY = 'pendingLabProgress';
+const PENDING_PROGRESS_MAX = 100;
+let pendingSyncInFlight = false;
+
+const newPendingId = () => `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+// Every entry carries an id so a sync removes exactly what it sent, whatever
+// was queued or trimmed while the request was in flight
+const readPendingProgress = () => {
+  try {
+    const entries = JSON.parse(localStorage.getItem(PENDING_PROGRESS_KEY)) || [];
+    return entries.map(entry => (entry.id ? entry : { ...entry, id: newPendingId() }));
+  } catch {
+    return [];
+  }
+};
+
+const writePendingProgress = (entries) => {
+  localStorage.setItem(PENDING_PROGRESS_KEY, JSON.stringify(entries));
+};
+
+// Over the cap, fold the queue to one entry per lab (furthest step, sticky
+// completion, last flag) instead of dropping the oldest updates
+const compactPendingProgress = (entries) => {
+  if (entries.length <= PENDING_PROGRESS_MAX) return entries;
+  const byLab = new Map();
+  entries.forEach(({ id, ...update }) => {
+    const current = byLab.get(update.lab_id);
+    byLab.set(update.lab_id, current ? {
+      ...current,
+      current_step: Math.max(current.current_step, update.current_step),
+      completed: current.completed || update.completed,
+      flag_submitted: update.flag_submitted || current.flag_submitted
+    } : update);
+  });
+  return [...byLab.values()].map(update => ({ ...update, id: newPendingId() })).slice(-PENDING_PROGRESS_MAX);
+};
+
 export default function CyberRange() {
   const { labId } = useParams();
   const navigate = useNavigate();
@@ -48,7 +87,13 @@ export default function CyberRange() {
     checkVmStatus();
     const interval = setInterval(checkVmStatus, 10000);
 
-    return () => clearInterval(interval);
+    syncPendingProgress();
+    window.addEventListener('online', syncPendingProgress);
+
+    return () => {
+      clearInterval(interval);
+      window.removeEventListener('online', syncPendingProgress);
+    };
   }, [labId, token]);
 
   const fetchLab = async () => {
@@ -202,18 +247,45 @@ export default function CyberRange() {
     }
   };
 
+  const syncPendingProgress = async () => {
+    if (pendingSyncInFlight || !navigator.onLine) return;
+    const pending = readPendingProgress();
+    if (!pending.length) return;
+    // Persist ids given to entries queued before they had one
+    writePendingProgress(pending);
+    pendingSyncInFlight = true;
+    try {
+      // The server keeps the furthest step per lab, so order and repeats do not matter
+      const updates = pending.map(({ id, ...update }) => update);
+      await axios.post(`${API_URL}/labs/progress/batch`, { updates }, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      const sent = new Set(pending.map(entry => entry.id));
+      writePendingProgress(readPendingProgress().filter(entry => !sent.has(entry.id)));
+    } catch (err) {
+      console.error('Failed to sync offline progress:', err);
+    } finally {
+      pendingSyncInFlight = false;
+    }
+  };
+
   const saveProgress = async (step, isCompleted = false, flag = null) => {
+    const update = {
+      lab_id: labId,
+      current_step: step,
+      completed: isCompleted,
+      flag_submitted: flag
+    };
     try {
-      await axios.post(`${API_URL}/labs/progress`, {
-        lab_id: labId,
-        current_step: step,
-        completed: isCompleted,
-        flag_submitted: flag
-      }, {
+      await axios.post(`${API_URL}/labs/progress`, update, {
         headers: { Authorization: `Bearer ${token}` }
       });
+      syncPendingProgress();
     } catch (err) {
       console.error('Failed to save progress:', err);
+      if (!err.response || err.response.status >= 500) {
+        writePendingProgress(compactPendingProgress([...readPendingProgress(), { ...update, id: newPendingId() }]));
+      }
     }
   };
 
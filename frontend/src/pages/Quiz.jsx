@@ -17,6 +17,7 @@ export default function Quiz() {
   const [submitting, setSubmitting] = useState(false);
   const [results, setResults] = useState(null);
   const [creating, setCreating] = useState(false);
+  const [streaming, setStreaming] = useState(false);
 
   useEffect(() => {
     fetchAttempts();
@@ -35,31 +36,88 @@ export default function Quiz() {
     }
   };
 
+  const createAttemptAtOnce = async () => {
+    const res = await axios.post(
+      `${API_URL}/quiz/assessment/create`,
+      {},
+      { headers: { Authorization: `Bearer ${token}` } }
+    );
+
+    // Load the new attempt
+    const attemptRes = await axios.get(
+      `${API_URL}/quiz/assessment/${res.data.attempt_id}`,
+      { headers: { Authorization: `Bearer ${token}` } }
+    );
+
+    setCurrentAttempt(attemptRes.data);
+    setQuestions(attemptRes.data.questions || []);
+  };
+
+  // NDJSON events: attempt, then questions per category as they are ready, then complete
+  const readQuestionStream = async (body, onAttempt) => {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    const handleEvent = (event) => {
+      if (event.type === 'attempt') {
+        onAttempt(event.attempt_id);
+        setCurrentAttempt({ id: event.attempt_id, attempt_number: event.attempt_number, questions: [] });
+      } else if (event.type === 'questions') {
+        setQuestions(prev => [...prev, ...event.questions]);
+      } else if (event.type === 'error') {
+        throw new Error(event.detail);
+      }
+    };
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+    }
+  };
+
   const createNewAttempt = async () => {
     setCreating(true);
+    setStreaming(true);
+    setQuestions([]);
+    setAnswers({});
+    setCurrentIndex(0);
+    setResults(null);
+
+    let attemptId = null;
     try {
-      const res = await axios.post(
-        `${API_URL}/quiz/assessment/create`,
-        {},
-        { headers: { Authorization: `Bearer ${token}` } }
-      );
-      
-      // Load the new attempt
-      const attemptRes = await axios.get(
-        `${API_URL}/quiz/assessment/${res.data.attempt_id}`,
-        { headers: { Authorization: `Bearer ${token}` } }
-      );
-      
-      setCurrentAttempt(attemptRes.data);
-      setQuestions(attemptRes.data.questions || []);
-      setAnswers({});
-      setCurrentIndex(0);
-      setResults(null);
+      const res = await fetch(`${API_URL}/quiz/assessment/create/stream`, {
+        method: 'POST',
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      if (!res.ok || !res.body) {
+        throw new Error(`Stream request failed with status ${res.status}`);
+      }
+      await readQuestionStream(res.body, (id) => {
+        attemptId = id;
+        setCreating(false);
+      });
     } catch (error) {
-      console.error('Failed to create attempt:', error);
-      alert('Failed to create new quiz. Please try again.');
+      console.error('Failed to stream attempt:', error);
+      try {
+        if (attemptId) {
+          // Reload whatever was saved before the stream broke
+          await loadAttempt(attemptId);
+        } else {
+          // Non-streaming endpoint (goes through axios, so an expired token is refreshed)
+          await createAttemptAtOnce();
+        }
+      } catch (fallbackError) {
+        console.error('Failed to create attempt:', fallbackError);
+        alert('Failed to create new quiz. Please try again.');
+      }
     } finally {
       setCreating(false);
+      setStreaming(false);
     }
   };
 
@@ -410,10 +468,10 @@ export default function Quiz() {
           {currentIndex === questions.length - 1 ? (
             <button
               onClick={handleSubmit}
-              disabled={submitting || Object.keys(answers).length < questions.length}
+              disabled={submitting || streaming || Object.keys(answers).length < questions.length}
               className="flex items-center gap-2 px-6 py-2 bg-emerald-500 text-white rounded-lg hover:bg-emerald-600 disabled:opacity-50 disabled:cursor-not-allowed"
             >
-              {submitting ? 'Submitting...' : 'Submit Quiz'}
+              {submitting ? 'Submitting...' : streaming ? 'Loading more questions...' : 'Submit Quiz'}
             </button>
           ) : (
             <button